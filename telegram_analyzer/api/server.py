@@ -1,9 +1,15 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, PlainTextResponse
 from fastapi.requests import Request
+from sqlalchemy import tuple_
+from datetime import datetime
+from typing import Optional
 import uvicorn
+import asyncio
+import base64
+import time
 import os
 import sys
 
@@ -12,8 +18,21 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from core.telegram_client import telegram_bot
 from core.database import db
-from core.models import Chat, Message, User, MessageAnalysis
+from core.models import Chat, Message, User, MessageAnalysis, SyncCheckpoint, ChatRollup, ChatAnalysis, DriftPoint
 from core.analyzer import analyzer
+from core.rollups import summarize, chat_overall
+from core.scheduler import SyncScheduler
+from core.stream import StreamingAnalyzer
+from core.inference import inference
+from core.events import events
+from core.jobs import JobManager
+from core.search import search_messages
+from core.vector_index import vector_index, embed_query, message_vector
+from core.replies import replies, reply_prob
+from core.engagement import engagement
+from core.metrics import metrics
+from core.profiler import profile_path
+from config import Config
 
 app = FastAPI(title="Telegram Intent Analyzer")
 
@@ -21,20 +40,93 @@ app = FastAPI(title="Telegram Intent Analyzer")
 app.mount("/static", StaticFiles(directory="web/static"), name="static")
 templates = Jinja2Templates(directory="web/templates")
 
+scheduler = SyncScheduler(telegram_bot)
+stream = StreamingAnalyzer()
+jobs = JobManager(sync=telegram_bot.sync_history)
+
+# Read at scrape time from the components' own counters
+metrics.callback("analyzer_queue_depth", "Items waiting per queue", lambda: {
+    ("stream",): stream.queue.qsize(),
+    ("db_writer",): db.writer.queue.qsize() if db.writer else 0,
+    ("sync_scheduler",): scheduler.queue.qsize(),
+    ("analysis_jobs",): jobs.stats()["queued"],
+}, labels=("queue",))
+metrics.callback("analyzer_jobs_running", "Analysis jobs running", lambda: jobs.stats()["running"])
+metrics.callback("analyzer_inference_in_flight", "Calls running or waiting on the inference executor",
+                 lambda: inference.stats()["in_flight"])
+
+def _cache_lookups():
+    cache = analyzer.embedding_cache
+    values = {
+        ("embedding", "memory_hit"): cache.hits,
+        ("embedding", "disk_hit"): cache.disk_hits,
+        ("embedding", "miss"): cache.misses,
+    }
+    info = analyzer.sentiment_cache_info()
+    if info:
+        values[("sentiment", "memory_hit")] = info.hits
+        values[("sentiment", "miss")] = info.misses
+    return values
+
+def _cache_hit_ratio():
+    ratios = {}
+    for (cache, result), n in _cache_lookups().items():
+        hits, total = ratios.get((cache,), (0, 0))
+        ratios[(cache,)] = (hits + (n if result != "miss" else 0), total + n)
+    return {k: hits / total for k, (hits, total) in ratios.items() if total}
+
+metrics.callback("analyzer_cache_lookups_total", "Cache lookups by result", _cache_lookups,
+                 labels=("cache", "result"), kind="counter")
+metrics.callback("analyzer_cache_hit_ratio", "Share of cache lookups served from the cache", _cache_hit_ratio,
+                 labels=("cache",))
+metrics.callback("analyzer_stream_messages_total", "Live messages analyzed", lambda: stream.processed, kind="counter")
+metrics.callback("analyzer_stream_errors_total", "Failed live micro-batches", lambda: stream.errors, kind="counter")
+metrics.callback("analyzer_db_commits_total", "Transactions committed by the database writer",
+                 lambda: db.writer.commits if db.writer else None, kind="counter")
+metrics.callback("analyzer_events_published_total", "Events published to the push channel",
+                 lambda: events.published, kind="counter")
+
+async def start_live_analysis():
+    try:
+        if await telegram_bot.is_user_authorized():
+            await telegram_bot.start_listening(on_message=stream.submit, block=False)
+    except Exception as e:
+        print(f"Could not connect to Telegram: {e}")
+
 @app.on_event("startup")
 async def startup_event():
-    # In a real app, strict handling of the loop is needed for Telethon + FastAPI
-    # For now, we assume we might run Telethon in a separate thread or just connect here
-    await telegram_bot.connect()
+    scheduler.start()
+    stream.start()
+    jobs.start()
+    # Connecting to Telegram can take seconds; serve requests meanwhile. Endpoints that
+    # need the client wait for the same connection attempt.
+    asyncio.create_task(start_live_analysis())
+    # Load the model in the background once the server is up. Importing torch holds the
+    # GIL for a while, so give uvicorn a head start to bind and serve the first requests.
+    asyncio.get_running_loop().call_later(
+        Config.MODEL_WARMUP_DELAY, lambda: asyncio.create_task(inference.warm_up())
+    )
+    # Same for the similarity index, so searches don't wait for it to be built
+    asyncio.get_running_loop().call_later(Config.MODEL_WARMUP_DELAY, vector_index.start_build)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Running jobs stay "running" in the database and resume on the next start
+    await jobs.stop()
+    inference.shutdown()
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return templates.TemplateResponse(request, "index.html")
 
 @app.get("/api/status")
 async def get_status():
     authorized = await telegram_bot.is_user_authorized()
-    return {"authorized": authorized}
+    return {"authorized": authorized, "model_ready": inference.model_ready or analyzer.ready}
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    return analyzer.embedding_cache.stats()
 
 @app.post("/api/login")
 async def login(phone: str):
@@ -51,6 +143,7 @@ async def login(phone: str):
 async def verify(phone: str, code: str, password: str = None):
     try:
         await telegram_bot.sign_in(phone, code, password)
+        await start_live_analysis()
         return {"status": "success"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -58,7 +151,7 @@ async def verify(phone: str, code: str, password: str = None):
 @app.get("/api/chats")
 async def get_chats():
     # Only return chats that are in the DB or fetch recent ones
-    with db.get_session() as session:
+    with db.read_session() as session:
         chats = session.query(Chat).order_by(Chat.last_updated.desc()).limit(50).all()
         return [{"id": c.id, "title": c.title, "type": c.type} for c in chats]
 
@@ -66,7 +159,7 @@ async def get_chats():
 async def sync_chats(background_tasks: BackgroundTasks):
     # This triggers a sync of dialogs
     async def _sync():
-        dialogs = await telegram_bot.get_dialogs()
+        dialogs = await telegram_bot.get_dialogs(limit=Config.DIALOG_LIMIT)
         with db.get_session() as session:
              for d in dialogs:
                 chat_id = d.id
@@ -77,85 +170,223 @@ async def sync_chats(background_tasks: BackgroundTasks):
                     new_chat = Chat(id=chat_id, title=title, type='unknown')
                     session.add(new_chat)
              session.commit()
+        # Queue history syncs for every dialog, stalest first
+        scheduler.enqueue_all()
     
     background_tasks.add_task(_sync)
     return {"status": "sync_started"}
 
 @app.get("/api/chats/{chat_id}/analyze")
-async def analyze_chat(chat_id: int, background_tasks: BackgroundTasks):
-    # Trigger sync history then analyze
-    async def _process_chat():
+async def analyze_chat(chat_id: int, full: bool = False, profile: bool = False):
+    # Sync then analyze as a tracked job; repeated requests for a chat share one job.
+    # profile=true records a flame-graph profile of the run, see /api/jobs/{id}/profile
+    job, created = jobs.submit(chat_id, full, profile)
+    return {
+        "status": "analysis_started" if created else "analysis_already_running",
+        "job": jobs.view(job),
+    }
+
+@app.get("/api/jobs")
+async def list_jobs(chat_id: Optional[int] = None, status: Optional[str] = None, limit: int = Query(50, ge=1, le=500)):
+    return {"jobs": jobs.list(chat_id, status, limit), **jobs.stats()}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/api/jobs/{job_id}/profile", response_class=PlainTextResponse)
+async def get_job_profile(job_id: str):
+    """
+    Folded stacks of a profiled job (flamegraph.pl / speedscope input).
+    """
+    path = profile_path(job_id)
+    if not job_id.isalnum() or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="No profile for this job")
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Prometheus text format
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    job = jobs.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/api/chats/{chat_id}/backfill")
+async def backfill_chat(chat_id: int, background_tasks: BackgroundTasks):
+    # Walk the full history backwards, resuming from the stored checkpoint
+    async def _backfill():
         try:
-            print(f"Syncing history for {chat_id}...")
-            await telegram_bot.sync_history(chat_id, limit=50) # Fetch last 50
-            
-            print(f"Analyzing messages for {chat_id}...")
-            with db.get_session() as session:
-                messages = session.query(Message).filter(Message.chat_id == chat_id).order_by(Message.date.asc()).all()
-                print(f"Found {len(messages)} messages to analyze.")
-                
-                # Analyze each message
-                prev_msg = None
-                count = 0
-                for msg in messages:
-                    # Calculate time gap
-                    time_gap = 0
-                    if prev_msg:
-                        time_gap = (msg.date - prev_msg.date).total_seconds()
-                    
-                    # Intent
-                    intent, confidence = analyzer.predict_intent(msg.text)
-                    
-                    # Urgency
-                    urgency = analyzer.calculate_urgency(msg.text, time_gap)
-                    
-                    # Sentiment
-                    sentiment = analyzer.calculate_sentiment(msg.text)
-                    tone = analyzer.analyze_emotional_tone(sentiment)
-                    
-                    # Update DB
-                    existing_analysis = session.query(MessageAnalysis).filter(MessageAnalysis.message_id == msg.id).first()
-                    if not existing_analysis:
-                        analysis_entry = MessageAnalysis(
-                            message_id=msg.id,
-                            intent=intent,
-                            intent_confidence=confidence,
-                            urgency_score=urgency,
-                            engagement_score=0, # Placeholder
-                            sentiment_score=sentiment,
-                            emotional_tone=tone,
-                            future_reply_prob_5min=0, # Placeholder
-                            future_reply_prob_1hr=0, # Placeholder
-                            future_reply_prob_24hr=0 # Placeholder
-                        )
-                        session.add(analysis_entry)
-                        count += 1
-                    else:
-                        existing_analysis.intent = intent # Update existing
-                        existing_analysis.sentiment_score = sentiment
-                        existing_analysis.emotional_tone = tone
-                    
-                    prev_msg = msg
-                
-                session.commit()
-                print(f"Successfully analyzed {count} new messages.")
+            stored = await telegram_bot.sync_history(chat_id, backfill=True)
+            print(f"Backfill for {chat_id} stored {stored} messages.")
         except Exception as e:
-            print(f"ERROR inside _process_chat: {e}")
+            print(f"ERROR inside _backfill: {e}")
             import traceback
             traceback.print_exc()
     
-    background_tasks.add_task(_process_chat)
-    return {"status": "analysis_started"}
+    background_tasks.add_task(_backfill)
+    return {"status": "backfill_started"}
+
+@app.get("/api/chats/{chat_id}/sync")
+async def get_sync_progress(chat_id: int):
+    progress = telegram_bot.sync_progress.get(chat_id)
+    if progress:
+        return progress
+    with db.read_session() as session:
+        checkpoint = session.get(SyncCheckpoint, chat_id)
+        if not checkpoint:
+            raise HTTPException(status_code=404, detail="Chat has not been synced yet")
+        return {
+            "chat_id": chat_id,
+            "phase": "idle",
+            "newest_id": checkpoint.newest_id,
+            "oldest_id": checkpoint.oldest_id,
+            "history_complete": bool(checkpoint.history_complete),
+            "messages_fetched": checkpoint.messages_fetched,
+        }
+
+@app.get("/api/inference")
+async def get_inference_stats():
+    return inference.stats()
+
+@app.get("/api/stream")
+async def get_stream_stats():
+    return stream.stats()
+
+@app.get("/api/scheduler")
+async def get_scheduler_stats():
+    return scheduler.stats()
+
+@app.get("/api/db")
+async def get_db_stats():
+    return db.stats()
+
+@app.get("/api/events")
+async def get_event_stats():
+    return events.stats()
+
+@app.websocket("/api/ws")
+async def event_socket(websocket: WebSocket):
+    """
+    Push channel. Send {"subscribe": chat_id} / {"unsubscribe": chat_id}; frames look like
+    {"chat_id": ..., "events": [{"type": "analyses" | "progress" | "rollups", ...}]}
+    or {"resync": [chat_ids]} when the client fell behind and should refetch.
+    """
+    await websocket.accept()
+    sub = events.connect()
+    
+    async def _send():
+        while True:
+            await websocket.send_text(await sub.queue.get())
+    
+    sender = asyncio.create_task(_send())
+    try:
+        while True:
+            msg = await websocket.receive_json()
+            if "subscribe" in msg:
+                events.subscribe(sub, int(msg["subscribe"]))
+            if "unsubscribe" in msg:
+                events.unsubscribe(sub, int(msg["unsubscribe"]))
+    except (WebSocketDisconnect, ValueError, TypeError):
+        pass
+    finally:
+        sender.cancel()
+        events.disconnect(sub)
+
+@app.get("/api/chats/{chat_id}/events")
+async def event_stream(chat_id: int, request: Request):
+    """
+    Same frames as /api/ws as Server-Sent Events, for a single chat.
+    """
+    sub = events.connect()
+    events.subscribe(sub, chat_id)
+    
+    async def _stream():
+        try:
+            while True:
+                try:
+                    frame = await asyncio.wait_for(sub.queue.get(), timeout=15)
+                    yield f"data: {frame}\n\n"
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+        finally:
+            events.disconnect(sub)
+    
+    return StreamingResponse(_stream(), media_type="text/event-stream")
+
+def encode_cursor(date, message_id):
+    return base64.urlsafe_b64encode(f"{date.isoformat()}|{message_id}".encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        date, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(date), int(message_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 @app.get("/api/chats/{chat_id}/results")
-async def get_chat_results(chat_id: int):
-    with db.get_session() as session:
-        messages = (session.query(Message, MessageAnalysis)
-                    .outerjoin(MessageAnalysis, Message.id == MessageAnalysis.message_id) # Fix join
-                    .filter(Message.chat_id == chat_id)
-                    .order_by(Message.date.asc())
-                    .limit(50)
-                    .all())
+async def get_chat_results(
+    chat_id: int,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    direction: str = Query("older", pattern="^(older|newer)$"),
+    tone: Optional[str] = None,
+    intent: Optional[str] = None,
+    min_urgency: Optional[float] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    """
+    Keyset pagination over (date, id), newest first.
+    Pass older_cursor back with direction=older to page into history, or newer_cursor
+    with direction=newer to fetch what arrived since. Items are always newest first.
+    """
+    with db.read_session() as session:
+        query = session.query(Message, MessageAnalysis).filter(Message.chat_id == chat_id)
+        
+        if tone or intent or min_urgency is not None:
+            # Filtering on analysis fields only makes sense for analyzed messages
+            query = query.join(MessageAnalysis, Message.id == MessageAnalysis.message_id)
+            if tone:
+                query = query.filter(MessageAnalysis.emotional_tone == tone)
+            if intent:
+                query = query.filter(MessageAnalysis.intent == intent)
+            if min_urgency is not None:
+                query = query.filter(MessageAnalysis.urgency_score >= min_urgency)
+        else:
+            query = query.outerjoin(MessageAnalysis, Message.id == MessageAnalysis.message_id)
+        
+        if since:
+            query = query.filter(Message.date >= since)
+        if until:
+            query = query.filter(Message.date <= until)
+        
+        # Served by ix_messages_chat_date, which SQLite extends with the rowid (Message.id)
+        key = tuple_(Message.date, Message.id)
+        if cursor:
+            cursor_key = tuple_(*decode_cursor(cursor))
+            query = query.filter(key < cursor_key if direction == "older" else key > cursor_key)
+        if direction == "older":
+            query = query.order_by(Message.date.desc(), Message.id.desc())
+        else:
+            query = query.order_by(Message.date.asc(), Message.id.asc())
+        
+        # One extra row tells us whether there is another page
+        messages = query.limit(limit + 1).all()
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        if direction == "newer":
+            messages.reverse()
         
         results = []
         for msg, analysis in messages:
@@ -172,10 +403,180 @@ async def get_chat_results(chat_id: int):
                 "intent": intent,
                 "urgency": urgency,
                 "sentiment": sentiment,
-                "tone": tone
+                "tone": tone,
+                "engagement": analysis.engagement_score if analysis else None,
+                "reply_prob": reply_prob(analysis),
             })
-            
-        return results
+        
+        return {
+            "items": results,
+            "has_more": has_more,
+            "older_cursor": encode_cursor(messages[-1][0].date, messages[-1][0].id) if messages else cursor,
+            "newer_cursor": encode_cursor(messages[0][0].date, messages[0][0].id) if messages else cursor,
+        }
+
+@app.get("/api/search")
+async def search(
+    q: str = Query(..., min_length=1),
+    chat_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    tone: Optional[str] = None,
+    intent: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+):
+    """
+    Full-text search over message history, best match first.
+    Every word has to match; end a word with * for a prefix match.
+    """
+    started = time.perf_counter()
+    with db.read_session() as session:
+        try:
+            items, next_cursor = search_messages(session, q, chat_id, since, until, tone, intent, limit, cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    for item in items:
+        item["date"] = item["date"].isoformat()
+    return {
+        "items": items,
+        "has_more": next_cursor is not None,
+        "next_cursor": next_cursor,
+        "took_ms": (time.perf_counter() - started) * 1000,
+    }
+
+def _similar_items(session, hits):
+    # One query for the texts of all hits, returned in similarity order
+    ids = [message_id for message_id, _ in hits]
+    rows = {m.id: (m, a) for m, a in (session.query(Message, MessageAnalysis)
+                                      .outerjoin(MessageAnalysis, Message.id == MessageAnalysis.message_id)
+                                      .filter(Message.id.in_(ids))
+                                      .all())}
+    items = []
+    for message_id, score in hits:
+        if message_id not in rows:
+            continue
+        m, a = rows[message_id]
+        items.append({
+            "id": m.id,
+            "chat_id": m.chat_id,
+            "text": m.text,
+            "date": m.date.isoformat(),
+            "sender_id": m.sender_id,
+            "intent": a.intent if a else "unknown",
+            "tone": a.emotional_tone if a else "Neutral",
+            "score": score,
+        })
+    return items
+
+@app.get("/api/similar")
+async def similar(q: str = Query(..., min_length=1), chat_id: Optional[int] = None, k: int = Query(10, ge=1, le=100)):
+    """
+    Messages closest in meaning to the given text (cosine similarity of embeddings).
+    """
+    started = time.perf_counter()
+    vector = await inference.run(embed_query, q)
+    hits = await asyncio.to_thread(vector_index.search, vector, k, chat_id)
+    with db.read_session() as session:
+        items = _similar_items(session, hits)
+    return {"items": items, "took_ms": (time.perf_counter() - started) * 1000}
+
+@app.get("/api/messages/{message_id}/similar")
+async def similar_to_message(message_id: int, chat_id: Optional[int] = None, k: int = Query(10, ge=1, le=100)):
+    """
+    Messages closest in meaning to a stored message, the message itself excluded.
+    """
+    started = time.perf_counter()
+    with db.read_session() as session:
+        vector = message_vector(session, message_id)
+    if vector is None:
+        raise HTTPException(status_code=404, detail="No embedding stored for this message")
+    hits = await asyncio.to_thread(vector_index.search, vector, k, chat_id, {message_id})
+    with db.read_session() as session:
+        items = _similar_items(session, hits)
+    return {"items": items, "took_ms": (time.perf_counter() - started) * 1000}
+
+@app.get("/api/vectors")
+async def get_vector_stats():
+    return vector_index.stats()
+
+@app.get("/api/chats/{chat_id}/summary")
+async def get_chat_summary(
+    chat_id: int,
+    bucket: str = Query("day", pattern="^(hour|day|week)$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    """
+    Precomputed chat statistics: all-time totals plus a time series at the given
+    granularity. Reads only the rollup rows, never the messages themselves.
+    """
+    with db.read_session() as session:
+        overall = chat_overall(session, chat_id)
+        
+        # The time range is applied by the query, served by uq_chat_rollups_bucket
+        query = session.query(ChatRollup).filter(ChatRollup.chat_id == chat_id, ChatRollup.bucket == bucket)
+        if since:
+            query = query.filter(ChatRollup.bucket_start >= since)
+        if until:
+            query = query.filter(ChatRollup.bucket_start <= until)
+        series = [summarize(row) for row in query.order_by(ChatRollup.bucket_start.asc())]
+        return {
+            "chat_id": chat_id,
+            "bucket": bucket,
+            "overall": overall,
+            "series": series,
+        }
+
+@app.get("/api/chats/{chat_id}/drift")
+async def get_chat_drift(chat_id: int, limit: int = Query(200, ge=1, le=5000), since: Optional[datetime] = None):
+    """
+    Emotional drift series of a chat, oldest to newest, plus its current trend.
+    """
+    with db.read_session() as session:
+        query = session.query(DriftPoint).filter(DriftPoint.chat_id == chat_id)
+        if since:
+            query = query.filter(DriftPoint.date >= since)
+        points = query.order_by(DriftPoint.date.desc(), DriftPoint.id.desc()).limit(limit).all()
+        summary = session.query(ChatAnalysis).filter(ChatAnalysis.chat_id == chat_id).first()
+        
+        return {
+            "chat_id": chat_id,
+            "trend": summary.overall_sentiment_trend if summary else None,
+            "series": [{
+                "date": p.date.isoformat(),
+                "message_slope": p.message_slope,
+                "message_variance": p.message_variance,
+                "message_trend": p.message_trend,
+                "hour_slope": p.hour_slope,
+                "hour_variance": p.hour_variance,
+                "hour_trend": p.hour_trend,
+            } for p in reversed(points)],
+        }
+
+@app.get("/api/chats/{chat_id}/replies")
+async def get_chat_replies(chat_id: int):
+    """
+    How fast messages of a chat get answered: reply latency distribution per sender
+    pair, reply rates per sender, and the state of the chat's reply models.
+    """
+    with db.read_session() as session:
+        summary = replies.summary(session, chat_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="No reply model for this chat yet")
+    return {"chat_id": chat_id, **summary}
+
+@app.get("/api/chats/{chat_id}/engagement")
+async def get_chat_engagement(chat_id: int):
+    """
+    Current engagement of a chat and the windowed metrics behind it, per sender:
+    response time, turn-taking ratio, length trend, reply-chain depth and initiative.
+    """
+    with db.read_session() as session:
+        summary = engagement.summary(session, chat_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="No messages for this chat")
+    return {"chat_id": chat_id, **summary}
 
 if __name__ == "__main__":
     uvicorn.run("api.server:app", host="127.0.0.1", port=8000, reload=True)
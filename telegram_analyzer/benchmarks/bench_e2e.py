@@ -0,0 +1,209 @@
+"""
+End-to-end benchmark on a synthetic corpus, no Telegram account needed.
+
+A FakeTelegramClient (benchmarks/fake_telegram.py) serves a generated corpus
+(benchmarks/corpus.py) to the real TelegramManager, and these scenarios are timed
+against a fresh database:
+
+    sync      sync_history with backfill for every chat
+    analyze   full analysis of every chat (the pipeline behind /analyze)
+    results   /api/chats/{id}/results pages, through the ASGI app
+    live      NewMessage events through the StreamingAnalyzer
+
+Prints one JSON document (throughput, latency percentiles, peak RSS), optionally
+also written to --output so runs can be compared.
+
+    python benchmarks/bench_e2e.py --chats 10 --messages 2000 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import CorpusSpec, generate_corpus, live_text
+from benchmarks.fake_telegram import FakeTelegramClient
+
+SCENARIOS = ["sync", "analyze", "results", "live"]
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {}
+
+    def pct_ms(p):
+        return samples[min(len(samples) - 1, int(p * len(samples)))] * 1000
+
+    return {"p50_ms": pct_ms(0.5), "p95_ms": pct_ms(0.95), "p99_ms": pct_ms(0.99), "max_ms": samples[-1] * 1000}
+
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def bench_sync(bot, chats, concurrency):
+    durations = []
+    stored = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def sync(chat_id):
+        nonlocal stored
+        async with semaphore:
+            t = time.perf_counter()
+            # Awaited first: "stored += await ..." reads stored before the await and loses concurrent updates
+            n = await bot.sync_history(chat_id, limit=100, backfill=True)
+            stored += n
+            durations.append(time.perf_counter() - t)
+
+    t = time.perf_counter()
+    await asyncio.gather(*[sync(c.id) for c in chats])
+    seconds = time.perf_counter() - t
+    return {"seconds": seconds, "messages": stored, "messages_per_sec": stored / seconds,
+            "per_chat": percentiles(durations)}
+
+
+async def bench_analyze(inference, analyze_chat, chats):
+    t = time.perf_counter()
+    await inference.warm_up()
+    load_seconds = time.perf_counter() - t
+
+    durations = []
+    analyzed = 0
+    t = time.perf_counter()
+    for chat in chats:
+        started = time.perf_counter()
+        analyzed += await inference.run(analyze_chat, chat.id)
+        durations.append(time.perf_counter() - started)
+    seconds = time.perf_counter() - t
+    return {"model_load_seconds": load_seconds, "seconds": seconds, "messages": analyzed,
+            "messages_per_sec": analyzed / seconds if seconds else 0, "per_chat": percentiles(durations)}
+
+
+async def bench_results(app, chats, requests, pages, limit):
+    import httpx
+
+    rng = random.Random(1)
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        t = time.perf_counter()
+        done = 0
+        while done < requests:
+            chat_id = rng.choice(chats).id
+            cursor = None
+            # Newest page, then scroll back into history
+            for _ in range(pages):
+                params = {"limit": limit}
+                if cursor:
+                    params["cursor"] = cursor
+                started = time.perf_counter()
+                response = await client.get(f"/api/chats/{chat_id}/results", params=params)
+                latencies.append(time.perf_counter() - started)
+                response.raise_for_status()
+                body = response.json()
+                done += 1
+                cursor = body["older_cursor"]
+                if not body["has_more"] or done >= requests:
+                    break
+        seconds = time.perf_counter() - t
+    return {"requests": done, "requests_per_sec": done / seconds, "latency": percentiles(latencies)}
+
+
+async def bench_live(bot, client, stream_cls, chats, messages, rate):
+    rng = random.Random(2)
+    stream = stream_cls()
+    stream.start()
+    await bot.start_listening(on_message=stream.submit, block=False)
+
+    t = time.perf_counter()
+    for k in range(messages):
+        await client.emit(rng.choice(chats).id, live_text(rng))
+        if rate:
+            # Pace against the schedule rather than sleeping a fixed amount
+            delay = t + (k + 1) / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+    await stream.queue.join()
+    seconds = time.perf_counter() - t
+    stats = stream.stats()
+    await stream.stop()
+    return {"messages": stats["processed"], "seconds": seconds, "messages_per_sec": stats["processed"] / seconds,
+            "batches": stats["batches"], "avg_batch_size": stats["avg_batch_size"], "errors": stats["errors"],
+            "latency": percentiles(stream.latencies)}
+
+
+async def run(args):
+    # Imported here so DB_PATH (set in __main__) is seen by the database singleton
+    from core.telegram_client import telegram_bot
+    from core.inference import inference
+    from core.pipeline import analyze_chat
+    from core.stream import StreamingAnalyzer
+    from core.database import db
+    from api.server import app
+
+    spec = CorpusSpec(chats=args.chats, messages_per_chat=args.messages, duplicate_rate=args.duplicate_rate,
+                      reply_rate=args.reply_rate, mean_words=args.mean_words, seed=args.seed)
+    t = time.perf_counter()
+    corpus = generate_corpus(spec)
+    client = FakeTelegramClient(corpus, page_latency=args.page_latency)
+    telegram_bot.client = client
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "db_path": db.path,
+        "corpus_seconds": time.perf_counter() - t,
+        "scenarios": {},
+    }
+    runners = {
+        "sync": lambda: bench_sync(telegram_bot, corpus, args.sync_concurrency),
+        "analyze": lambda: bench_analyze(inference, analyze_chat, corpus),
+        "results": lambda: bench_results(app, corpus, args.requests, args.pages, args.page_size),
+        "live": lambda: bench_live(telegram_bot, client, StreamingAnalyzer, corpus, args.live_messages, args.live_rate),
+    }
+    # Always in pipeline order: analyze needs synced messages, results analyzed ones
+    for name in SCENARIOS:
+        if name in args.scenarios:
+            result = await runners[name]()
+            result["peak_rss_mb"] = rss_mb() # Peak of the process so far
+            report["scenarios"][name] = result
+    report["peak_rss_mb"] = rss_mb()
+    report["db"] = db.stats()
+    inference.shutdown()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=2000, help="Messages per chat")
+    parser.add_argument("--mean-words", type=float, default=8.0)
+    parser.add_argument("--duplicate-rate", type=float, default=0.2)
+    parser.add_argument("--reply-rate", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--page-latency", type=float, default=0.0, help="Simulated seconds per history page")
+    parser.add_argument("--sync-concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=500, help="/results requests")
+    parser.add_argument("--pages", type=int, default=5, help="Pages scrolled per chat")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--live-messages", type=int, default=2000)
+    parser.add_argument("--live-rate", type=float, default=500, help="Live messages per second, 0 = as fast as possible")
+    parser.add_argument("--db", help="Database path (default: a fresh temporary file)")
+    parser.add_argument("--output", help="Also write the JSON report here")
+    args = parser.parse_args()
+
+    os.environ["DB_PATH"] = args.db or os.path.join(tempfile.mkdtemp(), "bench.db")
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2, default=str)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
@@ -0,0 +1,89 @@
+"""
+Embedding throughput and memory of the encoder backends (PyTorch vs ONNX Runtime int8).
+
+Every backend runs in a fresh process so load time and peak RSS are its own. The
+embedding cache is bypassed: this measures raw model inference.
+
+    python benchmarks/bench_encoders.py --messages 2000 --backends torch onnx
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORDS = ("hey are you coming tonight the meeting moved to thursday call me asap lol ok sure "
+         "whatever leave me alone i am busy maybe later thanks see you tomorrow where is it "
+         "send the photos please urgent help now this is so annoying good morning").split()
+
+
+def messages(n, seed=0):
+    rng = random.Random(seed)
+    # Telegram-like length mix: mostly short, some long
+    return [" ".join(rng.choices(WORDS, k=min(60, int(rng.expovariate(1 / 9)) + 1))) for _ in range(n)]
+
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+def worker(backend, n, batch_size):
+    from core.encoders import load_encoder
+
+    texts = messages(n)
+    base_rss = rss_mb()
+    t = time.perf_counter()
+    encoder = load_encoder(backend, "all-MiniLM-L6-v2")
+    load_seconds = time.perf_counter() - t
+    encoder.encode(texts[:batch_size], batch_size) # Warm-up
+
+    t = time.perf_counter()
+    encoder.encode(texts, batch_size)
+    seconds = time.perf_counter() - t
+    return {
+        "backend": backend,
+        "messages": n,
+        "batch_size": batch_size,
+        "load_seconds": load_seconds,
+        "messages_per_sec": n / seconds,
+        "ms_per_message": seconds / n * 1000,
+        "rss_before_load_mb": base_rss,
+        "rss_after_mb": rss_mb(),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx"])
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args.worker, args.messages, args.batch_size)))
+        sys.exit(0)
+
+    results = []
+    for backend in args.backends:
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", backend,
+             "--messages", str(args.messages), "--batch-size", str(args.batch_size)],
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            results.append({"backend": backend, "error": proc.stderr.strip().splitlines()[-1:]})
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,108 @@
+"""
+Import throughput for Telegram Desktop exports (core/importer.py).
+
+Writes the synthetic corpus (benchmarks/corpus.py) as a result.json in the export
+format (rich-text arrays, service messages, media without text, indented like the
+real thing), then imports it into a fresh database and reports messages/sec and
+peak RSS. --analyze also runs the pipelined analysis.
+
+    python benchmarks/bench_import.py --chats 20 --messages 50000
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import CorpusSpec, generate_corpus
+
+
+def _export_message(rng, msg, sender_names):
+    text = msg.message
+    if text and rng.random() < 0.1:
+        # Rich text: plain strings mixed with entity objects
+        words = text.split(" ")
+        cut = len(words) // 2
+        text = [" ".join(words[:cut]) + " ", {"type": "bold", "text": " ".join(words[cut:])}]
+    return {
+        "id": msg.id,
+        "type": "message",
+        "date": msg.date.strftime("%Y-%m-%dT%H:%M:%S"),
+        "date_unixtime": str(int(msg.date.timestamp())),
+        "from": sender_names[msg.sender_id],
+        "from_id": f"user{msg.sender_id}",
+        **({"reply_to_message_id": msg.reply_to_msg_id} if msg.reply_to_msg_id else {}),
+        "text": text,
+        "text_entities": [],
+    }
+
+
+def write_export(corpus, path, service_rate=0.02, seed=0):
+    """
+    Writes a full-account export, one message at a time. Returns the number of messages.
+    """
+    rng = random.Random(seed)
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{\n "about": "Here is the data you requested.",\n "chats": {\n  "about": "",\n  "list": [\n')
+        for i, chat in enumerate(corpus):
+            sender_names = {m.sender_id: f"User {m.sender_id}" for m in chat.messages}
+            header = {"name": chat.title, "type": "private_supergroup", "id": -chat.id}
+            f.write(("   ,\n" if i else "") + "   " + json.dumps(header)[:-1] + ', "messages": [\n')
+            for j, msg in enumerate(chat.messages):
+                if rng.random() < service_rate:
+                    item = {"id": msg.id, "type": "service", "date": msg.date.isoformat(), "actor": "x", "action": "pin_message"}
+                else:
+                    item = _export_message(rng, msg, sender_names)
+                f.write((",\n" if j else "") + json.dumps(item, indent=1, ensure_ascii=False))
+                count += 1
+            f.write("\n]}\n")
+        f.write("  ]\n }\n}\n")
+    return count
+
+
+def run(args):
+    # Imported here so DB_PATH (set in __main__) is seen by the database singleton
+    from core.importer import import_export
+    from core.database import db
+
+    spec = CorpusSpec(chats=args.chats, messages_per_chat=args.messages, seed=args.seed)
+    path = os.path.join(os.path.dirname(db.path), "result.json")
+    t = time.perf_counter()
+    written = write_export(generate_corpus(spec), path)
+    report = {
+        "config": vars(args),
+        "export_mb": os.path.getsize(path) / 2**20,
+        "export_messages": written,
+        "write_seconds": time.perf_counter() - t,
+        "rss_before_import_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    stats = import_export(path, analyze=args.analyze, batch_size=args.batch_size)
+    report["import"] = dict(stats, messages_per_sec=stats["messages"] / stats["seconds"])
+    report["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    if args.reimport:
+        # Everything is a duplicate the second time
+        stats = import_export(path, batch_size=args.batch_size)
+        report["reimport"] = dict(stats, messages_per_sec=stats["messages"] / stats["seconds"])
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=50000, help="Messages per chat")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int)
+    parser.add_argument("--analyze", action="store_true")
+    parser.add_argument("--reimport", action="store_true", help="Import the same file again")
+    args = parser.parse_args()
+
+    os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+    print(json.dumps(run(args), indent=2, default=str))
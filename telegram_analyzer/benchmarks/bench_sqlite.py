@@ -0,0 +1,140 @@
+"""
+Mixed read/write load against the two storage modes of DatabaseManager.
+
+Writer threads commit small batches of messages (like live sync and streaming do)
+while reader threads run the dashboard's newest-first results query. Reports write
+throughput, read throughput, read latency and "database is locked" errors.
+
+    python benchmarks/bench_sqlite.py --seconds 10 --writers 4 --readers 8
+"""
+from datetime import datetime, timedelta
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+from core.database import DatabaseManager
+from core.models import Chat, User, Message, MessageAnalysis
+
+CHATS = 20
+BASE = datetime(2025, 1, 1)
+
+
+def seed(manager, messages):
+    with manager.get_session() as session:
+        session.execute(sqlite_insert(User), [{"id": 1}])
+        session.execute(sqlite_insert(Chat), [{"id": c, "title": f"chat {c}", "type": "user"} for c in range(CHATS)])
+        session.execute(sqlite_insert(Message), [{
+            "telegram_id": i,
+            "chat_id": i % CHATS,
+            "sender_id": 1,
+            "text": f"seed message {i}",
+            "date": BASE + timedelta(seconds=i),
+        } for i in range(messages)])
+        session.commit()
+
+
+def _insert(session, chat_id, start, size):
+    session.execute(sqlite_insert(Message), [{
+        "telegram_id": start + k,
+        "chat_id": chat_id,
+        "sender_id": 1,
+        "text": "live message",
+        "date": BASE + timedelta(days=365, seconds=start + k),
+    } for k in range(size)])
+
+
+def _results(session, chat_id):
+    return (session.query(Message, MessageAnalysis)
+            .outerjoin(MessageAnalysis, Message.id == MessageAnalysis.message_id)
+            .filter(Message.chat_id == chat_id)
+            .order_by(Message.date.desc(), Message.id.desc())
+            .limit(50)
+            .all())
+
+
+def run(mode, seconds, writers, readers, batch, messages):
+    tmp = tempfile.mkdtemp()
+    manager = DatabaseManager(path=os.path.join(tmp, "bench.db"), mode=mode)
+    seed(manager, messages)
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    stats = {"writes": 0, "write_errors": 0, "reads": 0, "read_errors": 0}
+    latencies = []
+    counter = iter(range(10 ** 6, 10 ** 9, batch))
+
+    def writer():
+        rng = random.Random()
+        while not stop.is_set():
+            with lock:
+                start = next(counter)
+            try:
+                manager.run_write(_insert, rng.randrange(CHATS), start, batch)
+                with lock:
+                    stats["writes"] += batch
+            except OperationalError:
+                with lock:
+                    stats["write_errors"] += 1
+
+    def reader():
+        rng = random.Random()
+        while not stop.is_set():
+            t = time.perf_counter()
+            try:
+                with manager.read_session() as session:
+                    _results(session, rng.randrange(CHATS))
+                with lock:
+                    stats["reads"] += 1
+                    latencies.append(time.perf_counter() - t)
+            except OperationalError:
+                with lock:
+                    stats["read_errors"] += 1
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+
+    def pct_ms(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else None
+
+    return {
+        "mode": mode,
+        "messages_written_per_sec": stats["writes"] / seconds,
+        "reads_per_sec": stats["reads"] / seconds,
+        "read_p50_ms": pct_ms(0.5),
+        "read_p99_ms": pct_ms(0.99),
+        "write_errors": stats["write_errors"],
+        "read_errors": stats["read_errors"],
+        "db": manager.stats(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=10, help="Messages per write transaction")
+    parser.add_argument("--messages", type=int, default=100000, help="Seeded messages")
+    args = parser.parse_args()
+
+    results = [run(mode, args.seconds, args.writers, args.readers, args.batch, args.messages)
+               for mode in ("default", "tuned")]
+    print(json.dumps(results, indent=2))
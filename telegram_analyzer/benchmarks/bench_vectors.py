@@ -0,0 +1,108 @@
+"""
+Similar-message search: exact brute force vs the IVF index of VectorIndex.
+
+Seeds a temporary database with clustered synthetic 384-d unit vectors (stand-ins for
+MiniLM embeddings), builds the index and times queries. Recall@k is measured
+against the exact answer.
+
+    python benchmarks/bench_vectors.py --vectors 200000 --queries 200
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from core.database import DatabaseManager
+from core.models import MessageEmbedding
+import core.vector_index as vi
+
+DIM = 384
+CHATS = 50
+SEED_BLOCK = 50000
+
+
+def clustered(rng, n, centers):
+    # Unit vectors scattered around random topic centers
+    vectors = centers[rng.integers(len(centers), size=n)] + rng.normal(scale=0.08, size=(n, DIM))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+def seed(manager, rng, centers, total, dtype):
+    for start in range(0, total, SEED_BLOCK):
+        vectors = clustered(rng, min(SEED_BLOCK, total - start), centers)
+        rows = []
+        for k, v in enumerate(vectors):
+            packed_dtype, scale, blob = vi.pack(v, dtype)
+            rows.append({"message_id": start + k + 1, "chat_id": (start + k) % CHATS,
+                         "dtype": packed_dtype, "scale": scale, "vector": blob})
+        manager.run_write(lambda session, rows: session.execute(sqlite_insert(MessageEmbedding), rows), rows)
+
+
+def time_queries(index, queries, k, chat_id=None):
+    results, latencies = [], []
+    for q in queries:
+        t = time.perf_counter()
+        results.append([i for i, _ in index.search(q, k, chat_id)])
+        latencies.append(time.perf_counter() - t)
+    latencies.sort()
+    return results, {
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1000,
+    }
+
+
+def recall(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth) if t]))
+
+
+def run(vectors, queries, k, nprobe, dtype):
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(max(10, vectors // 500), DIM))
+    tmp = tempfile.mkdtemp()
+    manager = DatabaseManager(path=os.path.join(tmp, "bench.db"))
+    vi.db = manager # The index reads through the module-level manager
+
+    t = time.perf_counter()
+    seed(manager, rng, centers, vectors, dtype)
+    seed_seconds = time.perf_counter() - t
+    query_vectors = clustered(rng, queries, centers)
+
+    exact = vi.VectorIndex(exact_max=vectors, dtype=dtype)
+    exact.build()
+    ivf = vi.VectorIndex(exact_max=min(vectors - 1, vi.Config.VECTOR_EXACT_MAX), nprobe=nprobe, dtype=dtype)
+    ivf.build()
+
+    truth, exact_timing = time_queries(exact, query_vectors, k)
+    found, ivf_timing = time_queries(ivf, query_vectors, k)
+    chat_truth, _ = time_queries(exact, query_vectors, k, chat_id=1)
+    chat_found, chat_timing = time_queries(ivf, query_vectors, k, chat_id=1)
+
+    return {
+        "vectors": vectors,
+        "dtype": dtype,
+        "seed_seconds": seed_seconds,
+        "exact": {**exact_timing, "build_seconds": exact.build_seconds},
+        "ivf": {**ivf_timing, **ivf.stats(), f"recall@{k}": recall(found, truth)},
+        "ivf_one_chat": {**chat_timing, f"recall@{k}": recall(chat_found, chat_truth)},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=None)
+    parser.add_argument("--dtype", choices=["float32", "int8"], default="float32")
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.vectors, args.queries, args.k, args.nprobe, args.dtype), indent=2))
@@ -0,0 +1,114 @@
+"""
+Synthetic Telegram-like chat corpus for benchmarks.
+
+Deterministic for a given seed. Shapes that matter for the analysis pipeline are
+configurable: message count per chat, text length distribution, how often texts
+repeat (embedding cache hit rate) and how often messages reply to recent ones
+(reply structure and response gaps).
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+import random
+
+VOCABULARY = (
+    "hey hi hello ok okay sure yes no maybe later now today tomorrow tonight meeting call "
+    "me you we they it this that the a to for with at on in of and but so really very "
+    "good great bad terrible love hate happy sad sorry thanks please help urgent asap "
+    "emergency where when why how what coming going busy free work home office train car "
+    "photos file send share address dinner lunch coffee movie game match project deadline "
+    "report boss team client weekend trip flight hotel ticket price money pay lol haha "
+    "whatever annoying stop leave alone ugh hurry immediately interesting cool noted idk"
+).split()
+SHORT_REPLIES = ["ok", "k", "lol", "yes", "no", "sure", "hmm", "cool", "thanks", "👍", "haha", "omg", "what?", "?"]
+PUNCTUATION = ["", "", "", ".", "!", "?", "!!", "..."]
+
+
+@dataclass
+class CorpusMessage:
+    # Attribute names mirror telethon's Message where the app reads them
+    id: int
+    chat_id: int
+    sender_id: int
+    message: str
+    date: datetime
+    reply_to_msg_id: int = None
+
+
+@dataclass
+class CorpusChat:
+    id: int
+    title: str
+    username: str = None
+    messages: list = field(default_factory=list) # Oldest first, ids increasing
+
+
+@dataclass
+class CorpusSpec:
+    chats: int = 10
+    messages_per_chat: int = 2000
+    mean_words: float = 8.0 # Exponentially distributed text length
+    max_words: int = 80
+    short_reply_rate: float = 0.15 # "ok", "lol"... (decided by the short-text heuristics)
+    duplicate_rate: float = 0.2 # Texts repeated verbatim from earlier in the chat
+    reply_rate: float = 0.3 # Messages that reply to one of the last 20 messages
+    empty_rate: float = 0.03 # Media-only messages (no text)
+    senders_per_chat: int = 4
+    seed: int = 0
+    start: datetime = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _text(rng, spec):
+    words = min(spec.max_words, 1 + int(rng.expovariate(1 / spec.mean_words)))
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words)) + rng.choice(PUNCTUATION)
+
+
+def generate_chat(rng, spec, chat_id, index):
+    chat = CorpusChat(id=chat_id, title=f"Bench chat {index}", username=f"bench_{index}")
+    senders = [1000 + index * 100 + s for s in range(spec.senders_per_chat)]
+    date = spec.start + timedelta(minutes=rng.randint(0, 60 * 24))
+    texts = []
+    for msg_id in range(1, spec.messages_per_chat + 1):
+        reply_to = None
+        if chat.messages and rng.random() < spec.reply_rate:
+            target = rng.choice(chat.messages[-20:])
+            reply_to = target.id
+            # Someone else answers, usually fast
+            sender = rng.choice([s for s in senders if s != target.sender_id] or senders)
+            date += timedelta(seconds=rng.expovariate(1 / 90))
+        else:
+            sender = rng.choice(senders)
+            # Bursty conversation: mostly minutes apart, sometimes hours or days
+            mean_gap = 120 if rng.random() < 0.8 else 20000
+            date += timedelta(seconds=rng.expovariate(1 / mean_gap))
+
+        roll = rng.random()
+        if roll < spec.empty_rate:
+            text = ""
+        elif roll < spec.empty_rate + spec.short_reply_rate:
+            text = rng.choice(SHORT_REPLIES)
+        elif texts and roll < spec.empty_rate + spec.short_reply_rate + spec.duplicate_rate:
+            text = rng.choice(texts[-500:])
+        else:
+            text = _text(rng, spec)
+            texts.append(text)
+        chat.messages.append(CorpusMessage(msg_id, chat_id, sender, text, date, reply_to))
+    return chat
+
+
+def generate_corpus(spec=None, **overrides):
+    """
+    Returns a list of CorpusChat. Chat ids are negative like Telegram group ids.
+    """
+    spec = spec or CorpusSpec(**overrides)
+    rng = random.Random(spec.seed)
+    return [generate_chat(rng, spec, -(1000000 + i), i) for i in range(spec.chats)]
+
+
+def live_text(rng, spec=None):
+    """
+    A text for a live message, drawn from the same distribution as the corpus.
+    """
+    spec = spec or CorpusSpec()
+    if rng.random() < spec.short_reply_rate:
+        return rng.choice(SHORT_REPLIES)
+    return _text(rng, spec)
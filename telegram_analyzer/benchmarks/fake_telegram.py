@@ -0,0 +1,116 @@
+"""
+Local stand-in for telethon's TelegramClient, serving a synthetic corpus.
+
+Implements the parts TelegramManager uses: get_dialogs, get_entity, iter_messages
+(limit / offset_id / min_id / max_id / reverse, in pages like the real client) and
+NewMessage handlers registered with client.on(...). emit() injects a live message.
+
+    telegram_bot.client = FakeTelegramClient(generate_corpus(chats=5))
+"""
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import asyncio
+import bisect
+import os
+import sys
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import CorpusMessage
+
+PAGE_SIZE = 100 # Messages per GetHistoryRequest in telethon
+
+
+class FakeTelegramClient:
+    def __init__(self, corpus, page_latency=0.0):
+        """
+        corpus: list of CorpusChat (see benchmarks/corpus.py)
+        page_latency: seconds slept per page of history, to model the network round trip
+        """
+        self.chats = {chat.id: chat for chat in corpus}
+        self.page_latency = page_latency
+        self.handlers = []
+        self.requests = 0
+        self._disconnected = None
+
+    async def connect(self):
+        pass
+
+    async def disconnect(self):
+        if self._disconnected and not self._disconnected.done():
+            self._disconnected.set_result(None)
+
+    async def is_user_authorized(self):
+        return True
+
+    async def run_until_disconnected(self):
+        self._disconnected = asyncio.get_running_loop().create_future()
+        await self._disconnected
+
+    async def get_dialogs(self, limit=None):
+        # Most recently active first, like Telegram
+        oldest = datetime.min.replace(tzinfo=timezone.utc)
+        chats = sorted(self.chats.values(), key=lambda c: c.messages[-1].date if c.messages else oldest, reverse=True)
+        return [SimpleNamespace(id=c.id, title=c.title, name=c.title, entity=self._entity(c)) for c in chats[:limit]]
+
+    async def get_entity(self, chat_id):
+        self.requests += 1
+        return self._entity(self.chats[chat_id])
+
+    @staticmethod
+    def _entity(chat):
+        return SimpleNamespace(id=chat.id, title=chat.title, username=chat.username)
+
+    async def iter_messages(self, entity, limit=None, offset_id=0, min_id=0, max_id=0, reverse=False, **kwargs):
+        chat = self.chats[getattr(entity, "id", entity)]
+        ids = [m.id for m in chat.messages]
+        # Bounds are exclusive, offset_id counts from the side the iteration starts at
+        lo = bisect.bisect_right(ids, min_id)
+        hi = bisect.bisect_left(ids, max_id) if max_id else len(ids)
+        if offset_id:
+            if reverse:
+                lo = max(lo, bisect.bisect_right(ids, offset_id))
+            else:
+                hi = min(hi, bisect.bisect_left(ids, offset_id))
+        selected = chat.messages[lo:hi]
+        if not reverse:
+            selected = selected[::-1]
+        if limit is not None:
+            selected = selected[:limit]
+
+        for start in range(0, len(selected), PAGE_SIZE):
+            self.requests += 1
+            if self.page_latency:
+                await asyncio.sleep(self.page_latency)
+            for msg in selected[start:start + PAGE_SIZE]:
+                yield msg
+
+    def on(self, event_builder=None):
+        # Every registered handler is treated as a NewMessage handler
+        def decorator(fn):
+            self.handlers.append(fn)
+            return fn
+        return decorator
+
+    def add_event_handler(self, callback, event=None):
+        self.handlers.append(callback)
+
+    async def emit(self, chat_id, text, sender_id=None, reply_to_msg_id=None):
+        """
+        Delivers a new message to the NewMessage handlers and appends it to the chat history.
+        """
+        chat = self.chats[chat_id]
+        msg = CorpusMessage(
+            id=chat.messages[-1].id + 1 if chat.messages else 1,
+            chat_id=chat_id,
+            sender_id=sender_id or 1,
+            message=text,
+            date=datetime.now(timezone.utc),
+            reply_to_msg_id=reply_to_msg_id,
+        )
+        chat.messages.append(msg)
+        event = SimpleNamespace(chat_id=chat_id, message=msg)
+        for handler in self.handlers:
+            await handler(event)
+        return msg
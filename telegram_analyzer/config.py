@@ -10,10 +10,66 @@ class Config:
     PHONE_NUMBER = os.getenv("PHONE_NUMBER")
     SESSION_NAME = os.getenv("SESSION_NAME", "anon_session")
     DB_PATH = os.getenv("DB_PATH", "telegram_analysis.db")
+    DB_MODE = os.getenv("DB_MODE", "tuned") # 'tuned' (WAL, writer thread, read pool) or 'default'
+    DB_CACHE_KB = int(os.getenv("DB_CACHE_KB", 65536)) # Page cache per connection
+    DB_MMAP_BYTES = int(os.getenv("DB_MMAP_BYTES", 268435456))
+    DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", 5000))
+    DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", 4)) # Read-only connections for API queries
+    DB_WRITE_BATCH = int(os.getenv("DB_WRITE_BATCH", 64)) # Queued writes committed together
+    DB_WRITE_BATCH_MS = float(os.getenv("DB_WRITE_BATCH_MS", 2)) # Max wait for more writes before committing
     
     # Analysis Configuration
     URGENCY_THRESHOLD = 70
     ENGAGEMENT_THRESHOLD = 50
+    ENCODE_BATCH_SIZE = int(os.getenv("ENCODE_BATCH_SIZE", 64))
+    SYNC_CHUNK_SIZE = int(os.getenv("SYNC_CHUNK_SIZE", 500)) # Messages per sync transaction
+    IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 20000)) # Exported messages per import transaction
+    IMPORT_READ_CHUNK = int(os.getenv("IMPORT_READ_CHUNK", 1048576)) # Characters read from the export at a time
+    IMPORT_WRITES_IN_FLIGHT = int(os.getenv("IMPORT_WRITES_IN_FLIGHT", 2)) # Parsed batches queued for the writer
+    SYNC_CONCURRENCY = int(os.getenv("SYNC_CONCURRENCY", 4)) # Chats synced in parallel by the scheduler
+    SYNC_RATE_PER_SEC = float(os.getenv("SYNC_RATE_PER_SEC", 3)) # Telegram requests per second, shared
+    SYNC_BURST = int(os.getenv("SYNC_BURST", 10))
+    SYNC_INTERVAL = int(os.getenv("SYNC_INTERVAL", 300)) # Seconds between scheduler refills
+    DIALOG_LIMIT = int(os.getenv("DIALOG_LIMIT", 500))
+    ANALYSIS_CHUNK_SIZE = int(os.getenv("ANALYSIS_CHUNK_SIZE", 2000)) # Messages per analysis transaction
+    JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", 2)) # Analysis jobs running at the same time
+    STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", 256)) # Live messages per micro-batch
+    STREAM_MAX_DELAY_MS = int(os.getenv("STREAM_MAX_DELAY_MS", 20)) # Max wait before a partial micro-batch is flushed
+    STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", 10000))
+    INFERENCE_MODE = os.getenv("INFERENCE_MODE", "thread") # 'thread' or 'process' (one DB writer per worker process)
+    INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+    MODEL_WARMUP_DELAY = float(os.getenv("MODEL_WARMUP_DELAY", 3)) # Seconds after start-up before loading the model
+    ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch") # 'torch' or 'onnx' (ONNX Runtime, see requirements-onnx.txt)
+    ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models"))
+    ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "1") == "1" # Dynamic int8 quantization of the exported model
+    ONNX_THREADS = int(os.getenv("ONNX_THREADS", 0)) # ONNX Runtime intra-op threads, 0 = all cores
+    SENTIMENT_CACHE_SIZE = int(os.getenv("SENTIMENT_CACHE_SIZE", 100000)) # Memoized VADER results
+    EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 50000)) # In-memory LRU entries
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH") # Defaults to <DB_PATH>_embeddings.db
+    INTENTS_PATH = os.getenv("INTENTS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "intents.json"))
+    INTENT_CACHE_PATH = os.getenv("INTENT_CACHE_PATH") # Defaults to <DB_PATH>_intents.npz
+    INTENT_THRESHOLD = float(os.getenv("INTENT_THRESHOLD", 0.3)) # Best intent similarity below this -> "neutral"
+    STORE_EMBEDDINGS = os.getenv("STORE_EMBEDDINGS", "1") == "1" # Keep message embeddings for similarity search
+    EMBEDDING_STORE_DTYPE = os.getenv("EMBEDDING_STORE_DTYPE", "float32") # 'float32' or 'int8' (4x smaller)
+    VECTOR_EXACT_MAX = int(os.getenv("VECTOR_EXACT_MAX", 50000)) # Brute force up to this many vectors, IVF above
+    VECTOR_NPROBE = int(os.getenv("VECTOR_NPROBE", 16)) # IVF lists scanned per query
+    DRIFT_WINDOW_MESSAGES = int(os.getenv("DRIFT_WINDOW_MESSAGES", 200)) # Last N messages
+    DRIFT_WINDOW_HOURS = float(os.getenv("DRIFT_WINDOW_HOURS", 24)) # Last T hours
+    DRIFT_SLOPE_THRESHOLD = float(os.getenv("DRIFT_SLOPE_THRESHOLD", 0.2)) # Sentiment change across a window
+    DRIFT_VOLATILITY_THRESHOLD = float(os.getenv("DRIFT_VOLATILITY_THRESHOLD", 0.25)) # Sentiment variance
+    REPLY_MIN_SAMPLES = int(os.getenv("REPLY_MIN_SAMPLES", 50)) # Labeled messages before a chat's reply model is used
+    REPLY_PRIOR_WEIGHT = float(os.getenv("REPLY_PRIOR_WEIGHT", 5)) # Pulls a sender's reply rate towards the chat's
+    REPLY_ALPHA = float(os.getenv("REPLY_ALPHA", 0.001)) # L2 regularization of the reply models
+    REPLY_UPDATE_SECONDS = int(os.getenv("REPLY_UPDATE_SECONDS", 60)) # Chat time between label updates on live traffic
+    ENGAGEMENT_WINDOW_HOURS = float(os.getenv("ENGAGEMENT_WINDOW_HOURS", 24)) # Rolling window of the engagement metrics
+    ENGAGEMENT_WINDOW_MESSAGES = int(os.getenv("ENGAGEMENT_WINDOW_MESSAGES", 500)) # ...capped at this many messages
+    ENGAGEMENT_SILENCE_MINUTES = float(os.getenv("ENGAGEMENT_SILENCE_MINUTES", 60)) # Silence after which a message starts a new conversation
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1" # Per-stage timings behind /metrics
+    PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5)) # Sampling period of the opt-in profiler
+    PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")) # Folded-stack profiles of analysis jobs
+    EVENTS_FLUSH_MS = int(os.getenv("EVENTS_FLUSH_MS", 100)) # Push events of a chat are coalesced for this long
+    EVENTS_MAX_ITEMS = int(os.getenv("EVENTS_MAX_ITEMS", 200)) # Newest items kept per event in one frame
+    EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", 100)) # Frames buffered per client before it must resync
 
     @staticmethod
     def validate():
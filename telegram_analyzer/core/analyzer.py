@@ -1,63 +1,175 @@
-from sentence_transformers import SentenceTransformer, util
 import numpy as np
 from datetime import datetime
 import re
+import os
+import sys
+import threading
+from functools import lru_cache
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from core.embedding_cache import EmbeddingCache
+from core.intents import load_intents, IntentPrototypes
+from core.encoders import encoder_name, load_encoder
+from core.metrics import stage
+from core.engagement import ChatEngagement
+
+URGENCY_TRIGGERS = ["asap", "emergency", "now", "urgent"]
+# One pass finds every trigger; the lookahead also reports overlapping matches
+TRIGGER_PATTERN = re.compile("(?=(" + "|".join(re.escape(t) for t in URGENCY_TRIGGERS) + "))")
+
 class ConversationAnalyzer:
-    def __init__(self):
-        # Load a efficient, small model
-        # Using a singleton pattern or global load might be better for performance in prod,
-        # but for this local tool, loading in init is acceptable (though it will delay startup slightly)
-        print("Loading SentenceTransformer model...")
-        self.model = SentenceTransformer('all-MiniLM-L6-v2') 
-        self.sentiment_analyzer = SentimentIntensityAnalyzer()
-        print("Model loaded.")
-        
-        self.intents = {
-            "agreement": ["ok", "sure", "fine", "agreement", "yes", "deal", "k", "acceptable"],
-            "passive_ack": ["seen", "hmm", "interesting", "oh", "ah", "noted", "cool"],
-            "disinterest": ["whatever", "idk", "maybe later", "busy", "don't care", "meh"],
-            "irriation": ["stop", "annoying", "leave me alone", "whatever", "ugh"],
-            "urgency": ["asap", "now", "urgent", "emergency", "immediately", "hurry"]
-        }
+    def __init__(self, backend=None):
+        # Construction is cheap: the encoder backend (torch or ONNX Runtime, ENCODER_BACKEND)
+        # is imported and the model is loaded on first use (or by warm_up() in the background), so importing this module
+        # does not delay server start-up.
+        self.model_name = 'all-MiniLM-L6-v2'
+        self.backend = backend or Config.ENCODER_BACKEND
+        self.encoder_name = encoder_name(self.backend, self.model_name)
+        self.encoder_threads = None # Set by process-pool workers
+        self.embedding_cache = EmbeddingCache(self.encoder_name)
+        self.ready = False
+        self._model = None
+        self._sentiment_analyzer = None
+        self._sentiment_memo = None
+        self._load_lock = threading.Lock()
+        self.prototypes = None
         
-        # Pre-compute embeddings for reference intents
-        self.intent_embeddings = {
-            k: self.model.encode(v) for k, v in self.intents.items()
-        }
+        # Reference phrases per intent, edited in intents.json
+        self.intents = load_intents()
 
-    def predict_intent(self, text):
+    @property
+    def model(self):
+        if self._model is None:
+            self.warm_up()
+        return self._model
+
+    @property
+    def sentiment_analyzer(self):
+        if self._sentiment_analyzer is None:
+            self._sentiment_analyzer = SentimentIntensityAnalyzer()
+        return self._sentiment_analyzer
+
+    def warm_up(self):
+        """
+        Loads the model and pre-computes the intent reference embeddings. Thread-safe, runs once.
+        """
+        with self._load_lock:
+            if self.ready:
+                return
+            print(f"Loading {self.model_name} ({self.backend} encoder)...")
+            model = load_encoder(self.backend, self.model_name, threads=self.encoder_threads)
+            print("Model loaded.")
+            
+            # Reference phrase embeddings, from disk unless the model or intents changed
+            self.prototypes = IntentPrototypes.compile(model, self.encoder_name, self.intents)
+
+            self._model = model
+            self.ready = True
+
+    def reload_intents(self, path=None):
+        """
+        Re-reads the intents file. Phrases are only re-encoded if its contents changed.
+        """
+        intents = load_intents(path)
+        with self._load_lock:
+            self.intents = intents
+            if self._model is not None:
+                self.prototypes = IntentPrototypes.compile(self._model, self.encoder_name, intents)
+        return self.prototypes.labels if self.prototypes else list(intents)
+
+    def _quick_intent(self, text):
+        """
+        Heuristics for empty and very short texts. Returns None when the model is needed.
+        """
         if not text:
             return "unknown", 0.0
 
-        # 1. Heuristics for very short texts
         text_lower = text.lower().strip()
         if text_lower in ["ok", "k", "kk", "thumbs up", "👍", "yep", "yea"]:
             return "agreement", 0.95
         if text_lower in ["hmm", "cool"]:
             return "passive_ack", 0.8
-            
+        return None
+
+    def encode(self, texts, batch_size=None):
+        """
+        Returns normalized embeddings for texts, going through the embedding cache.
+        Only texts never seen before (after normalization) reach the model.
+        """
+        cache = self.embedding_cache
+        normalized = [cache.normalize(t) for t in texts]
+        keys = [cache.key(n) for n in normalized]
+
+        found = cache.get_many(list(dict.fromkeys(keys)))
+
+        # Encode each missing text once, even if it repeats within the batch
+        missing = {}
+        for k, n in zip(keys, normalized):
+            if k not in found and k not in missing:
+                missing[k] = n
+        if missing:
+            with stage("encode", items=len(missing)):
+                vectors = self.model.encode(list(missing.values()), batch_size=batch_size)
+            new_items = list(zip(missing.keys(), vectors))
+            cache.put_many(new_items)
+            found.update(new_items)
+
+        if not keys:
+            return np.zeros((0, self.model.dimension), dtype=np.float32)
+        return np.stack([found[k] for k in keys])
+
+    def predict_intent(self, text):
+        return self.predict_intents_batch([text])[0]
+
+    def predict_intents_batch(self, texts, batch_size=None, return_embeddings=False):
+        """
+        Classifies a list of texts in one go.
+        texts: list of message texts (None/empty allowed)
+        batch_size: encoder batch size, defaults to Config.ENCODE_BATCH_SIZE
+        return_embeddings: also return the message embeddings (None where the short-text
+                           heuristics decided without the model)
+        Returns: list of (intent, confidence) tuples in the same order as texts
+        """
+        results = [None] * len(texts)
+        vectors = [None] * len(texts)
+
+        # 1. Heuristics for very short texts
+        pending = []
+        for i, text in enumerate(texts):
+            quick = self._quick_intent(text)
+            if quick is not None:
+                results[i] = quick
+            else:
+                pending.append(i)
+
+        if not pending:
+            return (results, vectors) if return_embeddings else results
+
         # 2. Semantic Search
-        embedding = self.model.encode(text)
-        
-        best_intent = "neutral"
-        max_score = 0.0
-        
-        for intent, ref_embeddings in self.intent_embeddings.items():
-            # Compute cosine similarity
-            scores = util.cos_sim(embedding, ref_embeddings)
-            # Take the max similarity with any of the reference phrases for this intent
-            score = float(scores.max())
-            if score > max_score:
-                max_score = score
-                best_intent = intent
-        
-        # Threshold for "neutral"
-        if max_score < 0.3:
-            return "neutral", max_score
-            
-        return best_intent, max_score
+        if not self.ready:
+            self.warm_up()
+        embeddings = self.encode([texts[i] for i in pending], batch_size=batch_size)
+
+        # Max similarity with any of the reference phrases for each intent
+        prototypes = self.prototypes
+        with stage("intent_scoring", items=len(pending)):
+            intent_scores = prototypes.score(embeddings)
+        best = intent_scores.argmax(axis=1)
+
+        for row, i in enumerate(pending):
+            max_score = max(float(intent_scores[row, best[row]]), 0.0)
+            # Threshold for "neutral"
+            if max_score < Config.INTENT_THRESHOLD:
+                results[i] = ("neutral", max_score)
+            else:
+                results[i] = (prototypes.labels[best[row]], max_score)
+            vectors[i] = embeddings[row]
+
+        return (results, vectors) if return_embeddings else results
 
     def calculate_urgency(self, text, time_gap_seconds=None):
         score = 0
@@ -85,22 +197,50 @@ class ConversationAnalyzer:
         
         return min(100, max(0, score))
 
+    @staticmethod
+    def _linguistic_urgency(text):
+        score = 0
+        if "!!" in text: score += 20
+        if text.isupper() and len(text) > 4: score += 20
+        score += 30 * len(set(TRIGGER_PATTERN.findall(text.lower())))
+        if "?" in text and len(text) < 15: score += 10
+        return score
+
+    def calculate_urgency_batch(self, texts, time_gaps=None):
+        """
+        Vectorized calculate_urgency.
+        texts: sequence of texts (None/empty allowed)
+        time_gaps: sequence of seconds since the previous message, None/NaN for "unknown"
+        Returns an int array with the same values calculate_urgency gives per message.
+        """
+        n = len(texts)
+        with stage("urgency", items=n):
+            has_text = np.fromiter((bool(t) for t in texts), dtype=bool, count=n)
+            scores = np.fromiter(
+                (self._linguistic_urgency(t) if t else 0 for t in texts), dtype=np.int64, count=n
+            )
+
+            if time_gaps is not None:
+                gaps = np.array([np.nan if g is None else g for g in time_gaps], dtype=np.float64)
+                # NaN compares False on both sides, i.e. no temporal signal
+                scores += np.where(gaps < 30, 15, np.where(gaps > 86400, -10, 0))
+
+            return np.where(has_text, np.clip(scores, 0, 100), 0)
+
     def estimate_engagement(self, messages_data):
         """
-        messages_data: list of dicts with 'text', 'sender_id', 'date'
+        messages_data: list of dicts with 'text', 'sender_id', 'date' (optionally
+        'telegram_id' and 'reply_to_msg_id')
+        Engagement (0-100) of the conversation as of its newest message, from the same
+        windowed per-sender metrics the pipeline stores (core/engagement.py).
         """
         if not messages_data:
             return 0
-        
-        # Simple engagement metrics
-        total_chars = sum(len(m['text'] or "") for m in messages_data)
-        avg_len = total_chars / len(messages_data)
-        
-        # Response time calculation (if we had proper sender distinction logic here)
-        # For now, just simplistic length/frequency
-        
-        score = min(100, (avg_len / 5) * 10) # 50 chars avg = 100 score
-        return score
+
+        state = ChatEngagement()
+        for k, m in enumerate(sorted(messages_data, key=lambda m: m['date'])):
+            state.add(m['date'], k, m['sender_id'], m.get('telegram_id'), m.get('reply_to_msg_id'), len(m['text'] or ""))
+        return state.chat_score()
 
     def calculate_sentiment(self, text):
         """
@@ -111,6 +251,20 @@ class ConversationAnalyzer:
         scores = self.sentiment_analyzer.polarity_scores(text)
         return scores['compound']
 
+    def sentiment_cache_info(self):
+        return self._sentiment_memo.cache_info() if self._sentiment_memo else None
+
+    def calculate_sentiment_batch(self, texts):
+        """
+        calculate_sentiment for a sequence of texts, returned as a float array.
+        VADER runs once per distinct text; results are memoized across calls.
+        """
+        if self._sentiment_memo is None:
+            self._sentiment_memo = lru_cache(maxsize=Config.SENTIMENT_CACHE_SIZE)(self.calculate_sentiment)
+        memo = self._sentiment_memo
+        with stage("vader", items=len(texts)):
+            return np.fromiter((memo(t) if t else 0.0 for t in texts), dtype=np.float64, count=len(texts))
+
     def analyze_emotional_tone(self, sentiment_score):
         if sentiment_score >= 0.05:
             return "Positive"
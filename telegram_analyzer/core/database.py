@@ -1,20 +1,258 @@
-from sqlalchemy import create_engine
+from sqlalchemy import String, cast, create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker
+from concurrent.futures import Future
 from contextlib import contextmanager
 import os
+import queue
 import sys
+import threading
+import time
 
 # Add parent directory to path to import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import Config
-from core.models import Base
+from core.models import Base, ChatRollup
+from core.search import ensure_search_index
+from core.metrics import stage
+
+# Intent labels renamed in intents.json: old -> new
+RENAMED_INTENTS = {"irriation": "irritation"}
+
+# Run before a unique index is added to an existing database, so rows written before
+# it existed don't stop it from being created
+DEDUPLICATE = {
+    "uq_messages_chat_telegram": [
+        # Older syncs could store a message twice: keep the first copy, drop the others
+        # together with everything derived from them
+        """CREATE TEMP TABLE duplicate_messages AS SELECT id FROM messages
+           WHERE telegram_id IS NOT NULL AND id NOT IN (
+               SELECT min(id) FROM messages WHERE telegram_id IS NOT NULL GROUP BY chat_id, telegram_id)""",
+        "DELETE FROM message_analysis WHERE message_id IN (SELECT id FROM duplicate_messages)",
+        "DELETE FROM message_embeddings WHERE message_id IN (SELECT id FROM duplicate_messages)",
+        "DELETE FROM messages WHERE id IN (SELECT id FROM duplicate_messages)",
+        "DROP TABLE duplicate_messages",
+    ],
+    # Re-analysis used to add a row per run; the newest one wins
+    "uq_message_analysis_message_id": [
+        "DELETE FROM message_analysis WHERE id NOT IN (SELECT max(id) FROM message_analysis GROUP BY message_id)",
+    ],
+    "uq_message_embeddings_message_id": [
+        "DELETE FROM message_embeddings WHERE id NOT IN (SELECT max(id) FROM message_embeddings GROUP BY message_id)",
+    ],
+}
+
+
+def _tune(dbapi_conn, _record):
+    # Applied to every new writable connection; journal_mode=WAL is persistent, the rest are per connection
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.close()
+    _tune_read(dbapi_conn, _record)
+
+
+def _tune_read(dbapi_conn, _record):
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA synchronous=NORMAL") # WAL only fsyncs on checkpoints
+    cursor.execute(f"PRAGMA cache_size=-{Config.DB_CACHE_KB}")
+    cursor.execute(f"PRAGMA mmap_size={Config.DB_MMAP_BYTES}")
+    cursor.execute(f"PRAGMA busy_timeout={Config.DB_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+class DatabaseWriter:
+    """
+    Single writer thread with its own connection.
+    Callers submit fn(session, *args); the thread takes whatever has queued up (up to
+    DB_WRITE_BATCH jobs, waiting at most DB_WRITE_BATCH_MS for more) and commits them
+    together. If one job of a batch fails, the batch is rolled back and replayed one
+    job per transaction, so only the failing job sees the error.
+    on_rollback runs after every rollback, before any replay: jobs that keep in-memory
+    state next to what they write (drift, replies, engagement) drop it there, so replayed
+    jobs start from what the database holds instead of from state the rollback undid.
+    """
+
+    def __init__(self, session_factory, batch_size=None, batch_ms=None, on_rollback=None):
+        self.session_factory = session_factory
+        self.on_rollback = on_rollback or (lambda: None)
+        self.batch_size = batch_size or Config.DB_WRITE_BATCH
+        self.batch_delay = (batch_ms if batch_ms is not None else Config.DB_WRITE_BATCH_MS) / 1000
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self.thread.start()
+
+        self.jobs = 0
+        self.commits = 0
+        self.failures = 0
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.queue.put((fn, args, future))
+        return future
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.batch_delay
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            session = self.session_factory()
+            try:
+                results = [fn(session, *args) for fn, args, _ in batch]
+                with stage("commit", items=len(batch)):
+                    session.commit()
+                self.commits += 1
+                for (_, _, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                session.rollback()
+                self.on_rollback()
+                if len(batch) == 1:
+                    self._fail(batch[0], e)
+                else:
+                    self._replay(batch, session)
+            finally:
+                session.close()
+            self.jobs += len(batch)
+
+    def _replay(self, batch, session):
+        for job in batch:
+            fn, args, future = job
+            try:
+                result = fn(session, *args)
+                session.commit()
+                self.commits += 1
+                future.set_result(result)
+            except Exception as e:
+                session.rollback()
+                self.on_rollback()
+                self._fail(job, e)
+
+    def _fail(self, job, error):
+        fn, _, future = job
+        self.failures += 1
+        print(f"Database write {getattr(fn, '__name__', fn)} failed: {error}")
+        future.set_exception(error)
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "jobs": self.jobs,
+            "commits": self.commits,
+            "jobs_per_commit": self.jobs / self.commits if self.commits else 0,
+            "failures": self.failures,
+        }
+
 
 class DatabaseManager:
-    def __init__(self):
-        self.engine = create_engine(f'sqlite:///{Config.DB_PATH}', connect_args={'check_same_thread': False})
+    """
+    mode "tuned" (default): WAL and tuned pragmas on every connection, a dedicated writer
+    thread for write() / run_write(), and a pool of read-only connections behind
+    read_session(). get_session() stays available for mixed read/write work.
+    mode "default": the plain SQLite engine; write() and read_session() fall back to
+    ordinary sessions so callers don't have to care.
+    Every process has its own manager: with INFERENCE_MODE=process each worker process
+    runs its own writer thread next to the server's. SQLite still serializes their
+    transactions (busy_timeout), but batching only happens within a process.
+    """
+
+    def __init__(self, path=None, mode=None):
+        self.path = path or Config.DB_PATH
+        self.mode = mode or Config.DB_MODE
+        self.rollback_hooks = []
+        tuned = self.mode == "tuned"
+
+        self.engine = create_engine(f'sqlite:///{self.path}', connect_args={'check_same_thread': False})
+        if tuned:
+            event.listen(self.engine, "connect", _tune)
         Base.metadata.create_all(self.engine)
+        self._ensure_indexes()
+        ensure_search_index(self.engine)
         self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self._rename_intents()
+
+        self.writer = None
+        self.ReadSession = self.SessionLocal
+        if tuned:
+            write_engine = create_engine(
+                f'sqlite:///{self.path}',
+                connect_args={'check_same_thread': False},
+                pool_size=1, max_overflow=0,
+            )
+            event.listen(write_engine, "connect", _tune)
+            self.writer = DatabaseWriter(
+                sessionmaker(autocommit=False, autoflush=False, bind=write_engine),
+                on_rollback=self._rolled_back,
+            )
+
+            read_engine = create_engine(
+                f'sqlite:///file:{os.path.abspath(self.path)}?mode=ro&uri=true',
+                connect_args={'check_same_thread': False},
+                pool_size=Config.DB_READ_POOL_SIZE, max_overflow=Config.DB_READ_POOL_SIZE,
+            )
+            event.listen(read_engine, "connect", _tune_read)
+            self.ReadSession = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+    def _ensure_indexes(self):
+        # create_all only builds indexes together with new tables, so add missing ones to existing databases
+        inspector = inspect(self.engine)
+        for table in Base.metadata.sorted_tables:
+            existing = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                try:
+                    with self.engine.begin() as conn:
+                        removed = 0
+                        for statement in DEDUPLICATE.get(index.name, ()):
+                            result = conn.execute(text(statement))
+                            if statement.lstrip().startswith("DELETE FROM " + table.name):
+                                removed += result.rowcount
+                        if removed:
+                            print(f"Removed {removed} duplicate rows from {table.name} before creating {index.name}")
+                        index.create(conn)
+                except Exception as e:
+                    if index.unique:
+                        # Upserts (ON CONFLICT) on this table need the index; don't start without it
+                        raise RuntimeError(f"Could not create unique index {index.name}: {e}") from e
+                    print(f"Could not create index {index.name}: {e}")
+
+    def _rename_intents(self):
+        # Moves analyses stored under an old label (and their rollup counts) to the new one
+        with self.get_session() as session:
+            for old, new in RENAMED_INTENTS.items():
+                renamed = session.execute(
+                    text("UPDATE message_analysis SET intent = :new WHERE intent = :old"), {"old": old, "new": new}
+                ).rowcount
+                if not renamed:
+                    continue
+                for row in session.query(ChatRollup).filter(cast(ChatRollup.intent_hist, String).like(f'%"{old}"%')):
+                    hist = dict(row.intent_hist)
+                    hist[new] = hist.get(new, 0) + hist.pop(old)
+                    row.intent_hist = hist
+                print(f"Renamed intent {old!r} to {new!r} on {renamed} analyses")
+            session.commit()
+
+    def on_rollback(self, fn):
+        """
+        Registers fn() to run whenever a write() job's transaction is rolled back.
+        """
+        self.rollback_hooks.append(fn)
+
+    def _rolled_back(self):
+        for fn in self.rollback_hooks:
+            try:
+                fn()
+            except Exception as e:
+                print(f"Rollback hook {getattr(fn, '__qualname__', fn)} failed: {e}")
 
     @contextmanager
     def get_session(self):
@@ -24,4 +262,45 @@ class DatabaseManager:
         finally:
             session.close()
 
+    @contextmanager
+    def read_session(self):
+        """
+        Session on a read-only connection. Sees everything committed when it starts.
+        """
+        session = self.ReadSession()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    def write(self, fn, *args):
+        """
+        Queues fn(session, *args) on the writer and returns a Future with its result.
+        fn must not commit; the writer commits for it.
+        """
+        if self.writer:
+            return self.writer.submit(fn, *args)
+        future = Future()
+        try:
+            with self.get_session() as session:
+                result = fn(session, *args)
+                session.commit()
+            future.set_result(result)
+        except Exception as e:
+            self._rolled_back()
+            future.set_exception(e)
+        return future
+
+    def run_write(self, fn, *args):
+        """
+        Blocking write(). Not for the event loop: await asyncio.wrap_future(db.write(...)) there.
+        """
+        return self.write(fn, *args).result()
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "writer": self.writer.stats() if self.writer else None,
+        }
+
 db = DatabaseManager()
@@ -0,0 +1,297 @@
+from collections import deque
+from datetime import datetime, timedelta
+import os
+import sys
+import threading
+
+from sqlalchemy import tuple_
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from core.models import Message, MessageAnalysis, ChatAnalysis, DriftPoint
+
+EPOCH = datetime(1970, 1, 1)
+REBASE_AT = 1e6 # Shift x back to 0 before the sums lose precision
+
+
+class SlidingRegression:
+    """
+    Least-squares line and variance over a sliding window of (x, y) points.
+    Keeps running sums, so adding or evicting a point is O(1).
+    Points must be pushed in increasing x.
+    """
+
+    def __init__(self):
+        self.points = deque()
+        self.origin = None
+        self.n = 0
+        self.sx = self.sy = self.sxx = self.sxy = self.syy = 0.0
+
+    def push(self, x, y):
+        if self.origin is None:
+            self.origin = x
+        elif x - self.origin > REBASE_AT:
+            self._rebase(x)
+        x -= self.origin
+        self.points.append((x, y))
+        self.n += 1
+        self.sx += x
+        self.sy += y
+        self.sxx += x * x
+        self.sxy += x * y
+        self.syy += y * y
+
+    def pop(self):
+        x, y = self.points.popleft()
+        self.n -= 1
+        self.sx -= x
+        self.sy -= y
+        self.sxx -= x * x
+        self.sxy -= x * y
+        self.syy -= y * y
+        if not self.n:
+            # Reset so rounding leftovers don't accumulate
+            self.origin = None
+            self.sx = self.sy = self.sxx = self.sxy = self.syy = 0.0
+
+    def first_x(self):
+        return self.points[0][0] + self.origin
+
+    def _rebase(self, x):
+        # O(window), but only every REBASE_AT units of x
+        points = [(px + self.origin, py) for px, py in self.points]
+        self.points.clear()
+        self.origin = x
+        self.n = 0
+        self.sx = self.sy = self.sxx = self.sxy = self.syy = 0.0
+        for px, py in points:
+            self.push(px, py)
+
+    def slope(self):
+        denom = self.n * self.sxx - self.sx * self.sx
+        if self.n < 2 or denom <= 0:
+            return 0.0
+        return (self.n * self.sxy - self.sx * self.sy) / denom
+
+    def variance(self):
+        if not self.n:
+            return 0.0
+        mean = self.sy / self.n
+        return max(0.0, self.syy / self.n - mean * mean)
+
+    def span(self):
+        if self.n < 2:
+            return 0.0
+        return self.points[-1][0] - self.points[0][0]
+
+
+def classify(window):
+    """
+    Same labels as ConversationAnalyzer.detect_emotional_drift, but the slope is judged
+    by the sentiment change it implies across the whole window, so the thresholds
+    don't depend on the window size.
+    """
+    if window.n < 3:
+        return "Stable"
+    if window.variance() > Config.DRIFT_VOLATILITY_THRESHOLD:
+        return "Volatile"
+    change = window.slope() * window.span()
+    if change > Config.DRIFT_SLOPE_THRESHOLD:
+        return "Warming"
+    if change < -Config.DRIFT_SLOPE_THRESHOLD:
+        return "Cooling"
+    return "Stable"
+
+
+def _hours(date):
+    return (date - EPOCH).total_seconds() / 3600
+
+
+class ChatDrift:
+    """
+    Drift state of one chat: a last-N-messages window and a last-T-hours window.
+    """
+
+    def __init__(self, max_messages=None, max_hours=None):
+        self.max_messages = max_messages or Config.DRIFT_WINDOW_MESSAGES
+        self.max_hours = max_hours or Config.DRIFT_WINDOW_HOURS
+        self.messages = SlidingRegression() # x = message sequence number
+        self.hours = SlidingRegression() # x = hours since epoch
+        self.seq = 0
+        self.dates = deque() # Dates of the messages window
+        self.last = None # (date, message id) of the newest message added
+
+    def add(self, date, message_id, sentiment):
+        self.seq += 1
+        self.messages.push(self.seq, sentiment)
+        self.dates.append(date)
+        if self.messages.n > self.max_messages:
+            self.messages.pop()
+            self.dates.popleft()
+
+        now = _hours(date)
+        self.hours.push(now, sentiment)
+        while self.hours.n > 1 and self.hours.first_x() < now - self.max_hours:
+            self.hours.pop()
+
+        self.last = (date, message_id)
+
+    def oldest(self):
+        # Messages older than this don't affect either window
+        return min(self.dates[0], EPOCH + timedelta(hours=self.hours.first_x()))
+
+    def point(self, chat_id):
+        return DriftPoint(
+            chat_id=chat_id,
+            date=self.last[0],
+            message_slope=self.messages.slope(),
+            message_variance=self.messages.variance(),
+            message_trend=classify(self.messages),
+            hour_slope=self.hours.slope(),
+            hour_variance=self.hours.variance(),
+            hour_trend=classify(self.hours),
+        )
+
+
+class DriftEngine:
+    """
+    Online emotional drift per chat.
+    New analyses are folded into in-memory sliding windows in (date, id) order, O(1) per
+    message, with one drift point per written batch. State is rebuilt from the database
+    (one window's worth of rows) when a chat is first seen or another process has written
+    newer drift points (process inference mode). A batch older than what the windows
+    hold (backfill) gets its point from the window ending at its newest message instead.
+    Full re-analyses skip the per-batch updates and replay() the chat once at the end.
+    """
+
+    def __init__(self):
+        self.chats = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _query(session, chat_id):
+        return (session.query(Message.date, Message.id, MessageAnalysis.sentiment_score)
+                .join(MessageAnalysis, MessageAnalysis.message_id == Message.id)
+                .filter(Message.chat_id == chat_id))
+
+    def _load(self, session, chat_id, upto=None):
+        """
+        Rebuilds a chat's windows from its analyzed messages up to the (date, id) key
+        upto, by default the newest ones.
+        """
+        state = ChatDrift()
+        base = self._query(session, chat_id)
+        if upto is not None:
+            base = base.filter(tuple_(Message.date, Message.id) <= upto)
+        newest = (base.order_by(Message.date.desc(), Message.id.desc())
+                  .limit(state.max_messages).all())
+        if not newest:
+            return state
+        cutoff = newest[0].date - timedelta(hours=state.max_hours)
+        if newest[-1].date > cutoff:
+            rows = base.filter(Message.date >= cutoff).order_by(Message.date.asc(), Message.id.asc()).all()
+        else:
+            rows = newest[::-1]
+
+        for date, msg_id, sentiment in rows:
+            state.add(date, msg_id, sentiment or 0.0)
+        return state
+
+    def _latest_point(self, session, chat_id):
+        return (session.query(DriftPoint.date)
+                .filter(DriftPoint.chat_id == chat_id)
+                .order_by(DriftPoint.date.desc())
+                .limit(1)
+                .scalar())
+
+    def _set_trend(self, session, chat_id, state):
+        summary = session.query(ChatAnalysis).filter(ChatAnalysis.chat_id == chat_id).first()
+        if not summary:
+            summary = ChatAnalysis(chat_id=chat_id)
+            session.add(summary)
+        summary.overall_sentiment_trend = classify(state.messages)
+
+    def update(self, session, chat_id, rows, entries):
+        """
+        Folds freshly written analyses into the chat's drift state, stores a drift point
+        and refreshes ChatAnalysis.overall_sentiment_trend. Does not commit.
+        rows: objects with id and date; entries: matching MessageAnalysis dicts
+        """
+        if not entries:
+            return
+        sentiment = {e["message_id"]: e["sentiment_score"] or 0.0 for e in entries}
+        new = sorted((r.date, r.id) for r in rows if r.id in sentiment)
+
+        with self._lock:
+            state = self.chats.get(chat_id)
+            latest = self._latest_point(session, chat_id)
+            if state is not None and latest and state.last and latest > state.last[0]:
+                state = None # Another process has moved on
+
+            if state is not None and (state.last is None or new[0] > state.last):
+                for date, msg_id in new:
+                    state.add(date, msg_id, sentiment[msg_id])
+                at = state
+            else:
+                # The new rows are already flushed, so a reload includes them
+                loaded = state is None
+                if loaded:
+                    state = self._load(session, chat_id)
+                if state.last == new[-1]:
+                    at = state
+                else:
+                    # Older than the newest analyses (backfill): the point describes the
+                    # window ending at this batch, dated accordingly
+                    at = self._load(session, chat_id, upto=new[-1])
+                    if not loaded and new[-1] >= (state.oldest(), 0):
+                        # Lands inside the current windows
+                        state = self._load(session, chat_id)
+            self.chats[chat_id] = state
+
+            if not at.last:
+                return
+            session.add(at.point(chat_id))
+        self._set_trend(session, chat_id, state)
+
+    def replay(self, session, chat_id, every=None):
+        """
+        Rebuilds a chat's drift series by walking all its analyzed messages in date
+        order, with a point every `every` messages (default ANALYSIS_CHUNK_SIZE, as an
+        in-order incremental run would write) and one at the newest. Used at the end
+        of a full re-analysis, whose chunks go by id rather than date. Does not commit.
+        """
+        every = every or Config.ANALYSIS_CHUNK_SIZE
+        session.query(DriftPoint).filter(DriftPoint.chat_id == chat_id).delete()
+        state = ChatDrift()
+        points = []
+        count = 0
+        rows = self._query(session, chat_id).order_by(Message.date.asc(), Message.id.asc())
+        for date, msg_id, sentiment in rows.yield_per(10000):
+            state.add(date, msg_id, sentiment or 0.0)
+            count += 1
+            if count % every == 0:
+                points.append(state.point(chat_id))
+        if count % every:
+            points.append(state.point(chat_id))
+        session.add_all(points)
+
+        with self._lock:
+            self.chats[chat_id] = state
+        if state.last:
+            self._set_trend(session, chat_id, state)
+        return len(points)
+
+    def reset(self, session, chat_id):
+        with self._lock:
+            self.chats.pop(chat_id, None)
+        session.query(DriftPoint).filter(DriftPoint.chat_id == chat_id).delete()
+
+    def forget(self):
+        # Drops the cached state of every chat; it is rebuilt from the database on next use
+        with self._lock:
+            self.chats.clear()
+
+
+drift = DriftEngine()
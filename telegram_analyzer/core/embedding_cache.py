@@ -0,0 +1,126 @@
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+
+
+def default_cache_path():
+    """
+    The on-disk store lives next to the main database: telegram_analysis.db -> telegram_analysis_embeddings.db
+    """
+    if Config.EMBEDDING_CACHE_PATH:
+        return Config.EMBEDDING_CACHE_PATH
+    root, _ = os.path.splitext(Config.DB_PATH)
+    return f"{root}_embeddings.db"
+
+
+class EmbeddingCache:
+    """
+    Two level cache for sentence embeddings.
+    Level 1 is a bounded in-memory LRU, level 2 a SQLite file with raw float32 vectors.
+    Entries are keyed by a hash of the model name and the normalized text, so switching
+    models never returns stale vectors.
+    """
+
+    def __init__(self, model_name, path=None, max_items=None):
+        self.model_name = model_name
+        self.path = path or default_cache_path()
+        self.max_items = max_items if max_items is not None else Config.EMBEDDING_CACHE_SIZE
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL) WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def normalize(text):
+        # all-MiniLM-L6-v2 is uncased and splits on whitespace, so this does not change the embedding
+        return " ".join(text.lower().split())
+
+    def key(self, normalized_text):
+        return hashlib.sha1(f"{self.model_name}\0{normalized_text}".encode("utf-8")).digest()
+
+    def get_many(self, keys):
+        """
+        Returns a dict of key -> vector for every key found in memory or on disk.
+        """
+        found = {}
+        missing = []
+        with self._lock:
+            for k in keys:
+                vec = self._memory.get(k)
+                if vec is not None:
+                    self._memory.move_to_end(k)
+                    found[k] = vec
+                else:
+                    missing.append(k)
+            self.hits += len(found)
+
+            # SQLite caps the number of bound parameters, so look up in chunks
+            for i in range(0, len(missing), 500):
+                chunk = missing[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for k, blob in rows:
+                    vec = np.frombuffer(blob, dtype=np.float32)
+                    found[k] = vec
+                    self._remember(k, vec)
+                self.disk_hits += len(rows)
+
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        """
+        items: list of (key, vector) pairs. Stored in memory and persisted to disk.
+        """
+        if not items:
+            return
+        with self._lock:
+            rows = []
+            for k, vec in items:
+                vec = np.ascontiguousarray(vec, dtype=np.float32)
+                self._remember(k, vec)
+                rows.append((k, vec.tobytes()))
+            self._conn.executemany("INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def _remember(self, k, vec):
+        self._memory[k] = vec
+        self._memory.move_to_end(k)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "model": self.model_name,
+                "memory_items": len(self._memory),
+                "memory_limit": self.max_items,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,193 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+
+# Sentence embedding backends. Both return L2-normalized float32 (n, dim) arrays from
+# encode(texts, batch_size) so the analyzer, the caches and the intent prototypes
+# don't care which one is running.
+
+
+def encoder_name(backend, model_name):
+    """
+    Identity of the vectors a backend produces. Keys the embedding and intent caches, so
+    switching backends never mixes vectors from different ones.
+    """
+    if backend == "onnx":
+        return f"{model_name}@onnx-{'int8' if Config.ONNX_QUANTIZE else 'fp32'}"
+    return model_name
+
+
+class TorchEncoder:
+    """
+    The sentence-transformers model on PyTorch (the default).
+    """
+
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts, batch_size=None):
+        return self.model.encode(
+            list(texts),
+            batch_size=batch_size or Config.ENCODE_BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        ).astype(np.float32)
+
+
+def export_onnx(model_name, out_dir, quantize=True):
+    """
+    Exports the transformer of a sentence-transformers model to ONNX, plus its tokenizer,
+    and optionally applies dynamic int8 quantization (weights stored as int8, activations
+    quantized on the fly). Needs torch, sentence-transformers and onnxruntime.
+    The files are written to a temporary directory that is renamed to out_dir at the
+    end, so other processes (process inference mode) never load a half-written export.
+    """
+    parent = os.path.dirname(os.path.abspath(out_dir))
+    os.makedirs(parent, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix=".export-", dir=parent)
+    try:
+        meta = _export_onnx(model_name, work_dir, quantize)
+        _publish_dir(work_dir, out_dir, meta["model_file"])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return meta
+
+
+def _publish_dir(work_dir, out_dir, model_file):
+    # rename() is atomic but won't replace a non-empty directory
+    try:
+        os.rename(work_dir, out_dir)
+        return
+    except OSError:
+        pass
+    meta = _read_meta(out_dir)
+    if meta and meta["model_file"] == model_file:
+        # Another process exported the same model first
+        return
+    # A stale export (other quantization): move it out of the way, then swap ours in
+    stale = tempfile.mkdtemp(prefix=".stale-", dir=os.path.dirname(os.path.abspath(out_dir)))
+    os.rename(out_dir, os.path.join(stale, "export"))
+    os.rename(work_dir, out_dir)
+    shutil.rmtree(stale, ignore_errors=True)
+
+
+def _read_meta(model_dir):
+    meta_path = os.path.join(model_dir, "encoder.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def _export_onnx(model_name, out_dir, quantize):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer = st[0].auto_model.eval()
+    tokenizer = st.tokenizer
+
+    sample = tokenizer(["export sample text"], return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    fp32_path = os.path.join(out_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[n] for n in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={n: {0: "batch", 1: "sequence"} for n in input_names + ["last_hidden_state"]},
+            opset_version=17,
+            dynamo=False,
+        )
+    tokenizer.save_pretrained(out_dir)
+
+    model_file = "model.onnx"
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(fp32_path, os.path.join(out_dir, "model.int8.onnx"), weight_type=QuantType.QInt8)
+        model_file = "model.int8.onnx"
+
+    meta = {
+        "model_name": model_name,
+        "model_file": model_file,
+        "input_names": input_names,
+        "max_seq_length": st.max_seq_length,
+        "dimension": st.get_sentence_embedding_dimension(),
+    }
+    with open(os.path.join(out_dir, "encoder.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+class OnnxEncoder:
+    """
+    The same model exported to ONNX and run with ONNX Runtime, int8-quantized by
+    default. Mean pooling and normalization match the sentence-transformers pipeline
+    of all-MiniLM-L6-v2. Exports on first use if ONNX_MODEL_DIR has no model yet;
+    after that torch is never imported.
+    """
+
+    def __init__(self, model_name, model_dir=None, threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("ENCODER_BACKEND=onnx needs onnxruntime: pip install -r requirements-onnx.txt") from e
+        from transformers import AutoTokenizer
+
+        model_dir = model_dir or os.path.join(Config.ONNX_MODEL_DIR, model_name.replace("/", "_"))
+        meta = _read_meta(model_dir)
+        wanted = "model.int8.onnx" if Config.ONNX_QUANTIZE else "model.onnx"
+        if meta is None or meta["model_file"] != wanted:
+            print(f"Exporting {model_name} to ONNX in {model_dir}...")
+            meta = export_onnx(model_name, model_dir, quantize=Config.ONNX_QUANTIZE)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads or Config.ONNX_THREADS
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, meta["model_file"]), options, providers=["CPUExecutionProvider"]
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.input_names = meta["input_names"]
+        self.max_length = meta["max_seq_length"]
+        self.dimension = meta["dimension"]
+
+    def encode(self, texts, batch_size=None):
+        texts = list(texts)
+        batch_size = batch_size or Config.ENCODE_BATCH_SIZE
+        out = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        # Length-sorted batches keep padding (and wasted compute) to a minimum
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            tokens = self.tokenizer(
+                [texts[i] for i in idx], padding=True, truncation=True,
+                max_length=self.max_length, return_tensors="np",
+            )
+            feeds = {n: tokens[n].astype(np.int64) for n in self.input_names}
+            hidden = self.session.run(["last_hidden_state"], feeds)[0]
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            out[idx] = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return out
+
+
+def load_encoder(backend, model_name, threads=None):
+    if backend == "onnx":
+        return OnnxEncoder(model_name, threads=threads)
+    if backend != "torch":
+        raise ValueError(f"Unknown ENCODER_BACKEND {backend!r}, expected 'torch' or 'onnx'")
+    return TorchEncoder(model_name)
@@ -0,0 +1,361 @@
+from collections import deque
+from datetime import datetime, timedelta
+import math
+import os
+import sys
+import threading
+
+from sqlalchemy import bindparam, func, text, tuple_
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from core.models import Message, ChatAnalysis
+from core.drift import SlidingRegression
+
+EPOCH = datetime(1970, 1, 1)
+
+# How much each windowed metric counts towards a sender's score
+WEIGHTS = {
+    "responsiveness": 0.3,
+    "turn_taking": 0.2,
+    "initiative": 0.2,
+    "length_trend": 0.15,
+    "reply_depth": 0.15,
+}
+MAX_REPLY_DEPTH = 100 # Longer reply chains count as this deep; bounds the walk in REPLY_DEPTHS
+
+# Reply-chain depth of stored messages, following reply_to_msg_id through the whole
+# history: 0 without a reply, parent's depth + 1 otherwise (1 if the parent isn't stored)
+REPLY_DEPTHS = text("""
+    WITH RECURSIVE chain(start, parent, depth) AS (
+        SELECT telegram_id, reply_to_msg_id, 1 FROM messages
+        WHERE chat_id = :chat_id AND telegram_id IN :ids AND reply_to_msg_id > 0
+        UNION ALL
+        SELECT chain.start, m.reply_to_msg_id, chain.depth + 1 FROM chain
+        JOIN messages m ON m.chat_id = :chat_id AND m.telegram_id = chain.parent
+        WHERE m.reply_to_msg_id > 0 AND chain.depth < :limit
+    )
+    SELECT start, max(depth) FROM chain GROUP BY start
+""").bindparams(bindparam("ids", expanding=True))
+
+
+class SenderWindow:
+    """
+    Running sums over one sender's messages in the window.
+    """
+
+    __slots__ = ("messages", "turns", "starts", "responses", "latency_sum", "depth_sum", "lengths")
+
+    def __init__(self):
+        self.messages = self.turns = self.starts = self.responses = self.depth_sum = 0
+        self.latency_sum = 0.0 # log1p(seconds) of the responses
+        self.lengths = SlidingRegression() # x = hours since epoch, y = log1p(characters)
+
+    def add(self, event, sign=1):
+        t, _, _, turn, latency, start, depth, length = event
+        self.messages += sign
+        self.turns += sign * turn
+        self.starts += sign * start
+        self.depth_sum += sign * depth
+        if latency is not None:
+            self.responses += sign
+            self.latency_sum += sign * latency
+        if sign > 0:
+            self.lengths.push(t / 3600, length)
+        else:
+            # Events of one sender leave the window in the order they came in
+            self.lengths.pop()
+
+
+class ChatEngagement:
+    """
+    Engagement state of one chat: the messages of the last ENGAGEMENT_WINDOW_HOURS (at
+    most ENGAGEMENT_WINDOW_MESSAGES) with running per-sender sums, so adding a message
+    and evicting the oldest are O(1).
+    Per sender: response time, turn-taking ratio, message length trend, reply-chain
+    depth (reply_to_msg_id) and initiative (share of the conversations they started).
+    """
+
+    def __init__(self, max_messages=None, max_hours=None, silence_minutes=None):
+        self.max_messages = max_messages or Config.ENGAGEMENT_WINDOW_MESSAGES
+        self.max_hours = max_hours or Config.ENGAGEMENT_WINDOW_HOURS
+        self.silence = (silence_minutes or Config.ENGAGEMENT_SILENCE_MINUTES) * 60
+        self.window = deque()
+        self.senders = {}
+        self.depths = {} # telegram id -> reply depth, for messages in the window
+        self.starts = 0 # Conversation starts in the window
+        self.replies = 0 # Messages in the window that reply to another one
+        self.last = None # (date, message id) of the newest message added
+        self.last_time = None
+        self.last_sender = None
+
+    def prime(self, date, sender_id):
+        # The message right before the window, so its first message is judged like any other
+        self.last_time = (date - EPOCH).total_seconds()
+        self.last_sender = sender_id or 0
+
+    def add(self, date, message_id, sender_id, telegram_id, reply_to, length, parent_depth=None):
+        """
+        Folds in the next message and returns its reply depth.
+        parent_depth: depth of the message replied to, if known; otherwise it is taken
+                      from the window (0 once the parent has left it).
+        """
+        t = (date - EPOCH).total_seconds()
+        sender = sender_id or 0 # Channel posts without a sender count as one participant
+        gap = None if self.last_time is None else max(0.0, t - self.last_time)
+        start = gap is None or gap > self.silence
+        turn = sender != self.last_sender
+        # A turn change within a conversation answers whoever spoke before
+        latency = math.log1p(gap) if turn and not start else None
+        depth = 0
+        if reply_to:
+            if parent_depth is None:
+                parent_depth = self.depths.get(reply_to, 0)
+            depth = min(parent_depth + 1, MAX_REPLY_DEPTH)
+
+        event = (t, sender, telegram_id, turn, latency, start, depth, math.log1p(length or 0))
+        self.window.append(event)
+        stats = self.senders.get(sender)
+        if stats is None:
+            stats = self.senders[sender] = SenderWindow()
+        stats.add(event)
+        self.starts += start
+        self.replies += depth > 0
+        if telegram_id is not None:
+            self.depths[telegram_id] = depth
+
+        self.last = (date, message_id)
+        self.last_time = t
+        self.last_sender = sender
+
+        cutoff = t - self.max_hours * 3600
+        while len(self.window) > self.max_messages or self.window[0][0] < cutoff:
+            self._evict()
+        return depth
+
+    def _evict(self):
+        event = self.window.popleft()
+        _, sender, telegram_id, _, _, start, depth, _ = event
+        stats = self.senders[sender]
+        stats.add(event, -1)
+        if not stats.messages:
+            del self.senders[sender]
+        self.starts -= start
+        self.replies -= depth > 0
+        if telegram_id is not None and self.depths.get(telegram_id) == depth:
+            del self.depths[telegram_id]
+
+    def metrics(self, sender):
+        """
+        Raw windowed metrics of one sender, None where the window has no data for them.
+        """
+        stats = self.senders.get(sender)
+        if stats is None:
+            return None
+        return {
+            "messages": stats.messages,
+            # Geometric mean, so one reply after a night doesn't swamp the rest
+            "response_time": math.expm1(stats.latency_sum / stats.responses) if stats.responses else None,
+            "turn_taking": stats.turns / stats.messages,
+            # Change of log length across the window; > 0 means messages are getting longer
+            "length_trend": stats.lengths.slope() * stats.lengths.span() if stats.lengths.n >= 3 else None,
+            "reply_depth": stats.depth_sum / stats.messages,
+            "initiative": stats.starts / self.starts if self.starts else None,
+        }
+
+    def components(self, sender):
+        """
+        The metrics of one sender mapped to 0..1, only those the window has data for.
+        """
+        stats = self.senders.get(sender)
+        if stats is None:
+            return {}
+        out = {"turn_taking": stats.turns / stats.messages}
+        if stats.responses:
+            out["responsiveness"] = max(0.0, 1 - stats.latency_sum / stats.responses / math.log1p(self.silence))
+        if self.starts:
+            # Relative to an equal share of the conversation starts
+            out["initiative"] = min(1.0, stats.starts / self.starts * len(self.senders))
+        if stats.lengths.n >= 3:
+            out["length_trend"] = 0.5 + 0.5 * math.tanh(stats.lengths.slope() * stats.lengths.span())
+        if self.replies:
+            # Only where the chat uses replies at all
+            out["reply_depth"] = 1 - math.exp(-stats.depth_sum / stats.messages)
+        return out
+
+    def sender_score(self, sender):
+        parts = self.components(sender)
+        if not parts:
+            return 0.0
+        weight = sum(WEIGHTS[k] for k in parts)
+        return 100 * sum(WEIGHTS[k] * v for k, v in parts.items()) / weight
+
+    def chat_score(self):
+        # Senders weighted by how much they wrote in the window
+        if not self.window:
+            return 0.0
+        return sum(self.sender_score(s) * stats.messages for s, stats in self.senders.items()) / len(self.window)
+
+    def summary(self):
+        return {
+            "window": {
+                "messages": len(self.window),
+                "hours": self.max_hours,
+                "conversations": self.starts,
+                "newest": self.last[0].isoformat() if self.last else None,
+            },
+            "engagement": self.chat_score(),
+            "senders": sorted(({
+                "sender_id": int(sender),
+                "score": self.sender_score(sender),
+                **self.metrics(sender),
+            } for sender in self.senders), key=lambda s: -s["messages"]),
+        }
+
+
+class EngagementEngine:
+    """
+    Windowed engagement per chat, from message metadata only (dates, senders,
+    reply_to_msg_id, text length), so scores don't wait for any model.
+    score() folds messages into an in-memory ChatEngagement in O(1) each. The state is
+    rebuilt from the database (one window's worth of rows) when a chat is first seen or
+    when it doesn't end right before the messages being scored: backfill, a full
+    re-analysis starting over, or another process having moved on (process inference mode).
+    Reply depths of parents outside the folded rows come from the database, so a
+    rebuilt window has the same depths as one folded forward message by message.
+    """
+
+    def __init__(self):
+        self.chats = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _query(session, chat_id):
+        return (session.query(Message.id, Message.date, Message.sender_id, Message.telegram_id,
+                              Message.reply_to_msg_id, func.length(Message.text).label("length"))
+                .filter(Message.chat_id == chat_id))
+
+    @staticmethod
+    def _reply_depths(session, chat_id, telegram_ids):
+        if not telegram_ids:
+            return {}
+        rows = session.execute(REPLY_DEPTHS, {"chat_id": chat_id, "ids": list(telegram_ids), "limit": MAX_REPLY_DEPTH})
+        return dict(rows.all())
+
+    def _fold(self, session, chat_id, state, rows, wanted=()):
+        """
+        Adds rows (in (date, id) order) to state. Returns {id: sender score right after
+        the message} for the ids in wanted.
+        """
+        inside = {r.telegram_id for r in rows}
+        outside = self._reply_depths(session, chat_id, {
+            r.reply_to_msg_id for r in rows if r.reply_to_msg_id and r.reply_to_msg_id not in inside
+        })
+        depths = {} # telegram id -> depth, for the rows folded so far
+        scores = {}
+        for r in rows:
+            parent = None
+            if r.reply_to_msg_id:
+                parent = depths.get(r.reply_to_msg_id, outside.get(r.reply_to_msg_id, 0))
+            depth = state.add(r.date, r.id, r.sender_id, r.telegram_id, r.reply_to_msg_id, r.length, parent)
+            if r.telegram_id is not None:
+                depths[r.telegram_id] = depth
+            if r.id in wanted:
+                scores[r.id] = state.sender_score(state.last_sender)
+        return scores
+
+    def _load(self, session, chat_id, *conditions):
+        """
+        Rebuilds a chat's window from its newest messages matching conditions.
+        """
+        state = ChatEngagement()
+        newest = (self._query(session, chat_id).filter(*conditions)
+                  .order_by(Message.date.desc(), Message.id.desc())
+                  .limit(state.max_messages + 1).all())
+        if not newest:
+            return state
+        cutoff = newest[0].date - timedelta(hours=state.max_hours)
+        rows = [r for r in reversed(newest) if r.date >= cutoff]
+        if len(rows) > state.max_messages:
+            rows = rows[1:]
+        if len(rows) < len(newest):
+            before = newest[len(rows)]
+            state.prime(before.date, before.sender_id)
+        self._fold(session, chat_id, state, rows)
+        return state
+
+    def score(self, session, chat_id, rows):
+        """
+        Engagement (0-100) of the sender of every row as of that message.
+        rows: objects with id and date. Every message in the rows' (date, id) range is
+        folded in, analyzed or not, so a chunk that continues where the previous one
+        ended (ties on date included) is folded onto the state without a reload.
+        """
+        key = tuple_(Message.date, Message.id)
+        lo = min((r.date, r.id) for r in rows)
+        hi = max((r.date, r.id) for r in rows)
+        previous = (session.query(Message.date, Message.id)
+                    .filter(Message.chat_id == chat_id, key < lo)
+                    .order_by(Message.date.desc(), Message.id.desc())
+                    .first())
+        context = (self._query(session, chat_id)
+                   .filter(key >= lo, key <= hi)
+                   .order_by(Message.date.asc(), Message.id.asc())
+                   .all())
+
+        with self._lock:
+            state = self.chats.get(chat_id)
+            if state is None or state.last != (tuple(previous) if previous else None):
+                state = self._load(session, chat_id, key < lo)
+            scores = self._fold(session, chat_id, state, context, {r.id for r in rows})
+            self.chats[chat_id] = state
+        return [scores[r.id] for r in rows]
+
+    def update(self, session, chat_id, rows, entries):
+        """
+        Refreshes ChatAnalysis.current_engagement when a batch of written analyses reaches
+        the chat's newest messages. Does not commit.
+        rows: objects with id and date; entries: matching MessageAnalysis dicts
+        """
+        if not entries:
+            return
+        written = {e["message_id"] for e in entries}
+        key = max((r.date, r.id) for r in rows if r.id in written)
+
+        # Sessions don't autoflush; drift.update may just have added the ChatAnalysis row
+        session.flush()
+        summary = session.query(ChatAnalysis).filter(ChatAnalysis.chat_id == chat_id).first()
+        if not summary:
+            summary = ChatAnalysis(chat_id=chat_id)
+            session.add(summary)
+        newest = session.query(func.max(Message.date)).filter(Message.chat_id == chat_id).scalar()
+        if key[0] < newest and summary.current_engagement is not None:
+            # Older history (backfill, early chunks of a full run); the current score stands
+            return
+
+        with self._lock:
+            state = self.chats.get(chat_id)
+            if state is None or state.last != key:
+                state = self._load(session, chat_id, tuple_(Message.date, Message.id) <= key)
+                self.chats[chat_id] = state
+            summary.current_engagement = state.chat_score()
+
+    def summary(self, session, chat_id):
+        """
+        Per-sender metrics over the window ending at the chat's newest message.
+        """
+        state = self._load(session, chat_id)
+        if not state.window:
+            return None
+        current = session.query(ChatAnalysis.current_engagement).filter(ChatAnalysis.chat_id == chat_id).scalar()
+        return {"current_engagement": current, **state.summary()}
+
+    def forget(self):
+        # Drops the cached state of every chat; it is rebuilt from the database on next use
+        with self._lock:
+            self.chats.clear()
+
+
+engagement = EngagementEngine()
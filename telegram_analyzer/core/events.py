@@ -0,0 +1,150 @@
+from collections import defaultdict
+from datetime import datetime
+import asyncio
+import json
+import os
+import sys
+import threading
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+
+# Event types whose items accumulate until the next flush; every other type keeps its latest payload
+APPEND_TYPES = ("analyses",)
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def encode(frame):
+    return json.dumps(frame, separators=(",", ":"), default=_default)
+
+
+class Subscriber:
+    """
+    One connected client (a WebSocket or an SSE stream). Frames are already serialized.
+    When the client falls behind its queue is dropped and replaced by a single
+    "resync" frame telling it to refetch.
+    """
+
+    def __init__(self, queue_size):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.chats = set()
+        self.dropped = 0
+
+    def put(self, frame):
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.dropped += self.queue.qsize()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(encode({"resync": sorted(self.chats)}))
+
+
+class EventHub:
+    """
+    Per-chat push channel for the dashboard.
+    Publishers (sync, live analysis, analysis jobs) hand in small delta events. Events
+    of a chat are coalesced for EVENTS_FLUSH_MS and then serialized once into a single
+    frame shared by every subscriber of that chat. Bursts therefore cost one frame per
+    flush, no matter how many messages arrive or how many tabs are open.
+    publish() may be called from worker threads; everything else runs on the event loop.
+    """
+
+    def __init__(self, flush_ms=None, max_items=None, queue_size=None):
+        self.flush_delay = (flush_ms or Config.EVENTS_FLUSH_MS) / 1000
+        self.max_items = max_items or Config.EVENTS_MAX_ITEMS
+        self.queue_size = queue_size or Config.EVENTS_QUEUE_SIZE
+        self.loop = None
+        self.subscribers = defaultdict(set) # chat_id -> {Subscriber}
+        self.pending = {} # chat_id -> {event key: event}
+        self._loop_thread = None
+
+        self.published = 0
+        self.frames = 0
+
+    def connect(self):
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+            self._loop_thread = threading.get_ident()
+        return Subscriber(self.queue_size)
+
+    def disconnect(self, sub):
+        for chat_id in list(sub.chats):
+            self.unsubscribe(sub, chat_id)
+
+    def subscribe(self, sub, chat_id):
+        sub.chats.add(chat_id)
+        self.subscribers[chat_id].add(sub)
+
+    def unsubscribe(self, sub, chat_id):
+        sub.chats.discard(chat_id)
+        subs = self.subscribers.get(chat_id)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del self.subscribers[chat_id]
+                self.pending.pop(chat_id, None)
+
+    def publish(self, chat_id, kind, payload):
+        """
+        kind "analyses": payload is a list of items, appended to what is pending.
+        Any other kind: payload is a dict; only the latest one per kind (and per payload
+        "job", if set) is delivered.
+        """
+        if self.loop is None:
+            return
+        if threading.get_ident() != self._loop_thread:
+            self.loop.call_soon_threadsafe(self._publish, chat_id, kind, payload)
+        else:
+            self._publish(chat_id, kind, payload)
+
+    def _publish(self, chat_id, kind, payload):
+        if chat_id not in self.subscribers:
+            return # Nobody is watching, don't even buffer
+        self.published += 1
+
+        first = chat_id not in self.pending
+        pending = self.pending.setdefault(chat_id, {})
+        if kind in APPEND_TYPES:
+            event = pending.setdefault(kind, {"type": kind, "items": [], "dropped": 0})
+            event["items"].extend(payload)
+            overflow = len(event["items"]) - self.max_items
+            if overflow > 0:
+                # Keep the newest; the client refetches if anything was dropped
+                del event["items"][:overflow]
+                event["dropped"] += overflow
+        else:
+            pending[(kind, payload.get("job"))] = dict(payload, type=kind)
+
+        if first:
+            self.loop.call_later(self.flush_delay, self._flush, chat_id)
+
+    def _flush(self, chat_id):
+        pending = self.pending.pop(chat_id, None)
+        subs = self.subscribers.get(chat_id)
+        if not pending or not subs:
+            return
+        frame = encode({"chat_id": chat_id, "events": list(pending.values())})
+        self.frames += 1
+        for sub in subs:
+            sub.put(frame)
+
+    def stats(self):
+        subs = {sub for chat_subs in self.subscribers.values() for sub in chat_subs}
+        return {
+            "chats": len(self.subscribers),
+            "subscribers": len(subs),
+            "events_published": self.published,
+            "frames_sent": self.frames,
+            "frames_dropped": sum(sub.dropped for sub in subs),
+        }
+
+
+events = EventHub()
@@ -0,0 +1,394 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import json
+import os
+import re
+import sys
+import time
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from core.database import db
+from core.models import User, Chat, Message, SyncCheckpoint
+from core.metrics import stage
+from core.search import deferred_indexing
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+INSERT_MESSAGE = (
+    "INSERT INTO messages (telegram_id, chat_id, sender_id, text, date, reply_to_msg_id) "
+    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (chat_id, telegram_id) DO NOTHING"
+)
+# How SQLAlchemy stores DateTime on SQLite; rows bypass its type processing
+SQL_DATETIME = "%Y-%m-%d %H:%M:%S.%f"
+SQL_UTC_SECONDS = "%Y-%m-%d %H:%M:%S.000000"
+
+# Telegram Desktop chat types -> Chat.type as written by sync
+CHAT_TYPES = {
+    "personal_chat": "user",
+    "bot_chat": "user",
+    "saved_messages": "user",
+    "private_group": "group",
+    "private_supergroup": "channel",
+    "public_supergroup": "channel",
+    "private_channel": "channel",
+    "public_channel": "channel",
+}
+
+
+class JsonStream:
+    """
+    Pull parser over a text file for JSON documents too big to json.load.
+    The caller walks containers with iter_object() / iter_array() and decodes the
+    parts it wants with value(), which hands one element at a time to the C decoder
+    (raw_decode). Only the current element and one read chunk are held in memory.
+    """
+
+    def __init__(self, f, chunk_size=None):
+        self.f = f
+        self.chunk_size = chunk_size or Config.IMPORT_READ_CHUNK
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        # Drop what was consumed and append the next chunk
+        data = self.f.read(self.chunk_size)
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        if not data:
+            self.eof = True
+
+    def _peek(self):
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self.eof:
+                return ""
+            self._fill()
+
+    def _take(self, expected):
+        c = self._peek()
+        if c not in expected:
+            raise ValueError(f"Expected {expected!r} at offset {self.pos}, got {c!r}")
+        self.pos += 1
+        return c
+
+    def value(self):
+        """
+        Decodes the next complete value.
+        """
+        self._peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number that ends the buffer may continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def iter_object(self):
+        """
+        Yields the keys of the next object. The caller must consume each value.
+        """
+        self._take("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self._take(":")
+            yield key
+            if self._take(",}") == "}":
+                return
+
+    def iter_array(self):
+        """
+        Yields once per element of the next array. The caller must consume each element.
+        """
+        self._take("[")
+        if self._peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self._take(",]") == "]":
+                return
+
+    def values(self):
+        for _ in self.iter_array():
+            yield self.value()
+
+
+def _chat(stream, meta):
+    # Yields (chat fields, message iterator) when "messages" comes up
+    for key in stream.iter_object():
+        if key == "messages":
+            messages = stream.values()
+            yield meta, messages
+            for _ in messages: # Whatever the caller left unread
+                pass
+        else:
+            meta[key] = stream.value()
+
+
+def iter_chats(stream):
+    """
+    Yields (chat fields, message iterator) for every chat of a Telegram Desktop
+    export, either a full export (chats.list / left_chats.list) or a single-chat one.
+    The fields are the ones that precede "messages" in the file (name, type, id).
+    Each message iterator must be used before asking for the next chat.
+    """
+    top = {}
+    for key in stream.iter_object():
+        if key in ("chats", "left_chats"):
+            for section_key in stream.iter_object():
+                if section_key == "list":
+                    for _ in stream.iter_array():
+                        yield from _chat(stream, {})
+                else:
+                    stream.value()
+        elif key == "messages":
+            # Single-chat export: the top-level object is the chat
+            messages = stream.values()
+            yield top, messages
+            for _ in messages:
+                pass
+        else:
+            top[key] = stream.value()
+
+
+def flatten_text(text):
+    """
+    Plain text of a message. Rich text is a list of strings and entity objects
+    ({"type": "bold", "text": "..."}).
+    """
+    if isinstance(text, str):
+        return text
+    return "".join(part if isinstance(part, str) else part.get("text", "") for part in text or ())
+
+
+def peer_id(ref):
+    """
+    "user123" / "channel123" / "chat123" -> the id telethon uses for that peer.
+    """
+    if ref is None or isinstance(ref, int):
+        return ref
+    if ref.startswith("user"):
+        return int(ref[4:])
+    if ref.startswith("channel"):
+        return int("-100" + ref[7:])
+    if ref.startswith("chat"):
+        return -int(ref[4:])
+    return None
+
+
+def chat_id(meta):
+    """
+    Export chat id -> the marked id sync and live updates store, so both land on the same Chat.
+    """
+    raw = int(meta["id"])
+    kind = meta.get("type")
+    if kind == "private_group":
+        return -raw
+    if CHAT_TYPES.get(kind) == "channel":
+        return int(f"-100{raw}")
+    return raw
+
+
+def message_row(msg, chat_id):
+    """
+    An INSERT_MESSAGE parameter tuple for an exported message, or None for service
+    messages and messages without text (media only).
+    """
+    if msg.get("type") != "message":
+        return None
+    text = flatten_text(msg.get("text"))
+    if not text:
+        return None
+    unixtime = msg.get("date_unixtime")
+    if unixtime:
+        # UTC like telethon's dates; gmtime is ~4x cheaper than going through datetime
+        date = time.strftime(SQL_UTC_SECONDS, time.gmtime(int(unixtime)))
+    else:
+        # Older exports only have local time
+        date = datetime.fromisoformat(msg["date"]).strftime(SQL_DATETIME)
+    return (msg["id"], chat_id, peer_id(msg.get("from_id")), text, date, msg.get("reply_to_message_id"))
+
+
+def _store_batch(session, chat, rows, senders, first_id):
+    """
+    Writer job: one large transaction per batch. Duplicates (re-imports, messages
+    already synced) are skipped by the unique (chat_id, telegram_id) index.
+    senders: {user id: display name} of the batch.
+    first_id: lowest Telegram id this import has written for the chat so far; the
+              export holds every message in between, so the import covers first_id
+              up to the newest message of the batch (this one included).
+    Returns the number of new messages.
+    """
+    with stage("import_insert", items=len(rows)):
+        stmt = sqlite_insert(Chat).values(id=chat["id"], title=chat["title"], type=chat["type"])
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=["id"],
+            set_={"title": func.coalesce(stmt.excluded.title, Chat.title), "type": stmt.excluded.type},
+        ))
+
+        if senders:
+            stmt = sqlite_insert(User)
+            session.execute(
+                # Bare users created by sync get the export's display name
+                stmt.on_conflict_do_update(
+                    index_elements=["id"], set_={"first_name": func.coalesce(User.first_name, stmt.excluded.first_name)},
+                ),
+                [{"id": uid, "first_name": name} for uid, name in senders.items()],
+            )
+
+        with deferred_indexing(session) as after_id:
+            # Plain tuples straight to the driver's executemany; SQLAlchemy's per-row
+            # parameter processing costs more than the insert itself here
+            session.connection().exec_driver_sql(INSERT_MESSAGE, rows)
+        inserted = session.query(func.count(Message.id)).filter(Message.id > after_id).scalar()
+
+        # Later syncs continue from the imported range instead of fetching it again.
+        # Sync treats oldest_id..newest_id as fetched without gaps, so the range only
+        # grows by an import that overlaps or touches it; a disjoint one (checkpoint
+        # 900..1000, import 1..500) is left for sync to bridge
+        lo, hi = first_id, max(r[0] for r in rows)
+        checkpoint = session.get(SyncCheckpoint, chat["id"])
+        if not checkpoint:
+            checkpoint = SyncCheckpoint(chat_id=chat["id"], history_complete=False, messages_fetched=0)
+            session.add(checkpoint)
+        if checkpoint.newest_id is None or checkpoint.oldest_id is None:
+            checkpoint.oldest_id, checkpoint.newest_id = lo, hi
+        elif lo <= checkpoint.newest_id + 1 and hi >= checkpoint.oldest_id - 1:
+            checkpoint.oldest_id = min(lo, checkpoint.oldest_id)
+            checkpoint.newest_id = max(hi, checkpoint.newest_id)
+        checkpoint.messages_fetched = (checkpoint.messages_fetched or 0) + inserted
+        checkpoint.updated_at = datetime.utcnow()
+    return inserted
+
+
+class ExportImporter:
+    """
+    Streams a Telegram Desktop export (result.json) into the database.
+    Parsing runs on the calling thread while the previous batch is written by the
+    database writer, with at most IMPORT_WRITES_IN_FLIGHT batches queued. With
+    analyze=True every committed batch also schedules an incremental analyze_chat()
+    of its chat on a background thread, so analysis follows the import instead of
+    starting after it.
+    """
+
+    def __init__(self, batch_size=None, analyze=False, chat_ids=None, progress=None):
+        self.batch_size = batch_size or Config.IMPORT_BATCH_SIZE
+        self.analyze = analyze
+        self.chat_ids = set(chat_ids) if chat_ids else None # Only these (marked) ids
+        self.progress = progress # progress(stats) after every committed batch
+        self.stats = {"chats": 0, "messages": 0, "inserted": 0, "skipped": 0, "analyzed": 0, "seconds": 0.0}
+        self._writes = deque()
+        self._analysis = ThreadPoolExecutor(max_workers=1, thread_name_prefix="import-analysis") if analyze else None
+        self._analysis_pending = {}
+
+    def run(self, path):
+        started = time.perf_counter()
+        try:
+            with open(path, encoding="utf-8") as f:
+                for meta, messages in iter_chats(JsonStream(f)):
+                    self._import_chat(meta, messages)
+            while self._writes:
+                self._finish_write()
+            if self._analysis:
+                self._finish_analysis()
+        finally:
+            if self._analysis:
+                self._analysis.shutdown(wait=True)
+        self.stats["seconds"] = time.perf_counter() - started
+        return self.stats
+
+    def _import_chat(self, meta, messages):
+        if "id" not in meta:
+            return
+        chat = {
+            "id": chat_id(meta),
+            "title": meta.get("name"),
+            "type": CHAT_TYPES.get(meta.get("type"), "unknown"),
+        }
+        if self.chat_ids and chat["id"] not in self.chat_ids:
+            return
+        self.stats["chats"] += 1
+
+        batch = []
+        senders = {}
+        first_id = None
+        seen = kept = 0
+        for msg in messages:
+            seen += 1
+            row = message_row(msg, chat["id"])
+            if row is None:
+                continue
+            kept += 1
+            batch.append(row)
+            if row[2] is not None:
+                senders[row[2]] = msg.get("from")
+            if len(batch) >= self.batch_size:
+                first_id = self._write(chat, batch, senders, first_id)
+                batch = []
+                senders = {}
+        if batch:
+            self._write(chat, batch, senders, first_id)
+        self.stats["messages"] += seen
+        self.stats["skipped"] += seen - kept
+
+    def _write(self, chat, rows, senders, first_id):
+        # Returns the chat's lowest imported id including this batch
+        first_id = min([r[0] for r in rows] + ([first_id] if first_id is not None else []))
+        self._writes.append((chat["id"], db.write(_store_batch, chat, rows, senders, first_id)))
+        while len(self._writes) > Config.IMPORT_WRITES_IN_FLIGHT:
+            self._finish_write()
+        return first_id
+
+    def _finish_write(self):
+        chat_id, future = self._writes.popleft()
+        self.stats["inserted"] += future.result()
+        if self._analysis:
+            self._schedule_analysis(chat_id)
+        if self.progress:
+            self.progress(self.stats)
+
+    def _schedule_analysis(self, chat_id):
+        # One queued run per chat is enough: it picks up every batch committed before it starts
+        pending = self._analysis_pending.get(chat_id)
+        if pending and not pending.running() and not pending.done():
+            return
+        self._analysis_pending[chat_id] = self._analysis.submit(self._analyze, chat_id)
+
+    def _analyze(self, chat_id):
+        from core.pipeline import analyze_chat
+        self.stats["analyzed"] += analyze_chat(chat_id)
+
+    def _finish_analysis(self):
+        # A run that was already going may have missed the last batches
+        for chat_id, future in list(self._analysis_pending.items()):
+            future.result()
+            self._analysis_pending[chat_id] = self._analysis.submit(self._analyze, chat_id)
+        for future in self._analysis_pending.values():
+            future.result()
+
+
+def import_export(path, analyze=False, batch_size=None, chat_ids=None, progress=None):
+    """
+    Imports a Telegram Desktop JSON export. Returns counters (chats, messages seen,
+    inserted, skipped, analyzed, seconds).
+    """
+    return ExportImporter(batch_size, analyze, chat_ids, progress).run(path)
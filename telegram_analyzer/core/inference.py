@@ -0,0 +1,118 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import asyncio
+import multiprocessing
+import os
+import sys
+import threading
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+
+
+def _torch_threads(workers):
+    # Split the cores between workers instead of letting every worker grab all of them
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def _init_process_worker(threads):
+    """
+    Runs once in every worker process: pin torch/ONNX Runtime threads and load the model.
+    """
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from core.analyzer import analyzer
+    analyzer.encoder_threads = threads
+    analyzer.warm_up()
+
+
+def _warm_up():
+    from core.analyzer import analyzer
+    analyzer.warm_up()
+    return os.getpid()
+
+
+class InferenceExecutor:
+    """
+    Runs analysis work (model inference, VADER and the DB writes that go with it) off
+    the event loop.
+    mode "thread": a thread pool sharing the analyzer singleton; torch releases the GIL
+                   while encoding, so workers run in parallel.
+    mode "process": a process pool; every worker loads its own model once at start-up.
+                    Workers also open their own database (one writer thread each, see
+                    DatabaseManager) and keep their own drift/reply/engagement state,
+                    which they reload when the database shows another process moved on.
+    Submitted callables must be module-level functions with picklable arguments so
+    both modes behave the same.
+    """
+
+    def __init__(self, workers=None, mode=None):
+        self.workers = workers or Config.INFERENCE_WORKERS
+        self.mode = mode or Config.INFERENCE_MODE
+        self._pool = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.model_ready = False
+
+    @property
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                threads = _torch_threads(self.workers)
+                if self.mode == "process":
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_process_worker,
+                        initargs=(threads,),
+                    )
+                else:
+                    try:
+                        import torch
+                        torch.set_num_threads(threads)
+                    except ImportError:
+                        pass
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+            return self._pool
+
+    async def run(self, fn, *args):
+        self.submitted += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+        finally:
+            self.completed += 1
+
+    async def warm_up(self):
+        """
+        Loads the model ahead of the first analysis: once for the shared analyzer in
+        thread mode, in every worker process in process mode.
+        """
+        jobs = self.workers if self.mode == "process" else 1
+        try:
+            await asyncio.gather(*[self.run(_warm_up) for _ in range(jobs)])
+            self.model_ready = True
+        except Exception as e:
+            print(f"Model warm-up failed: {e}")
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "in_flight": self.submitted - self.completed,
+            "completed": self.completed,
+            "model_ready": self.model_ready,
+        }
+
+
+inference = InferenceExecutor()
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+
+
+def default_cache_path():
+    """
+    Next to the main database: telegram_analysis.db -> telegram_analysis_intents.npz
+    """
+    if Config.INTENT_CACHE_PATH:
+        return Config.INTENT_CACHE_PATH
+    root, _ = os.path.splitext(Config.DB_PATH)
+    return f"{root}_intents.npz"
+
+
+def load_intents(path=None):
+    """
+    Reads {intent: [reference phrases]} from the intents file. Intents without phrases are skipped.
+    """
+    with open(path or Config.INTENTS_PATH, encoding="utf-8") as f:
+        intents = json.load(f)
+    compiled = {}
+    for label, phrases in intents.items():
+        phrases = [p for p in phrases if p and p.strip()]
+        if not phrases:
+            print(f"Intent {label!r} has no reference phrases, skipping it")
+            continue
+        compiled[label] = phrases
+    return compiled
+
+
+def intents_hash(model_name, intents):
+    payload = json.dumps([model_name, intents], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class IntentPrototypes:
+    """
+    Every reference phrase of every intent as one row of a normalized (P, D) matrix.
+    Rows of an intent are contiguous; starts[i] is the first row of labels[i], so
+    np.maximum.reduceat over the columns of a (messages, P) similarity matrix gives
+    the per-intent max in one call, however many intents there are.
+    """
+
+    def __init__(self, labels, starts, matrix, digest):
+        self.labels = list(labels)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.matrix = matrix
+        self.hash = digest
+
+    @classmethod
+    def compile(cls, model, model_name, intents, cache_path=None):
+        """
+        model: an encoder from core.encoders; model_name: its encoder_name()
+        Encodes the reference phrases, or loads them from the on-disk cache when the
+        model and intents are unchanged since they were last encoded.
+        """
+        digest = intents_hash(model_name, intents)
+        cache_path = cache_path or default_cache_path()
+
+        try:
+            with np.load(cache_path) as cached:
+                if str(cached["hash"]) == digest:
+                    return cls(cached["labels"].tolist(), cached["starts"], cached["matrix"], digest)
+        except (OSError, KeyError, ValueError):
+            pass
+
+        labels = list(intents.keys())
+        phrases = [p for label in labels for p in intents[label]]
+        starts = np.cumsum([0] + [len(intents[label]) for label in labels[:-1]])
+        matrix = model.encode(phrases)
+
+        try:
+            # Write then rename, process workers may compile at the same time
+            tmp = f"{cache_path}.{os.getpid()}.tmp.npz"
+            np.savez(tmp, hash=np.array(digest), labels=np.array(labels), starts=starts, matrix=matrix)
+            os.replace(tmp, cache_path)
+        except OSError as e:
+            print(f"Could not cache intent prototypes: {e}")
+        return cls(labels, starts, matrix, digest)
+
+    def score(self, embeddings):
+        """
+        (messages, intents) matrix of the best similarity to any phrase of each intent.
+        embeddings: normalized (messages, D) array
+        """
+        return np.maximum.reduceat(embeddings @ self.matrix.T, self.starts, axis=1)
@@ -0,0 +1,289 @@
+from collections import defaultdict
+from datetime import datetime
+import asyncio
+import os
+import sys
+import time
+import traceback
+import uuid
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from core.database import db
+from core.models import AnalysisJob
+from core.pipeline import analyze_chunk, pending_count
+from core.rollups import chat_overall
+from core.inference import inference
+from core.events import events
+from core.profiler import SamplingProfiler
+
+ACTIVE = ("queued", "running")
+COLUMNS = ("id", "chat_id", "full", "status", "after_id", "done", "total", "error",
+           "created_at", "started_at", "finished_at")
+
+
+def _job_dict(row):
+    return {c: getattr(row, c) for c in COLUMNS}
+
+
+def _save_job(session, job):
+    row = session.get(AnalysisJob, job["id"])
+    if not row:
+        row = AnalysisJob(id=job["id"])
+        session.add(row)
+    for c in COLUMNS[1:]:
+        setattr(row, c, job[c])
+
+
+class JobManager:
+    """
+    Runs chat analyses as tracked jobs.
+    - At most one running and one queued job per chat: repeated requests get the existing
+      job back (a queued job is upgraded if a full run is asked for). A resumed incremental
+      job that already made progress isn't upgraded; a full run is queued behind it instead.
+    - JOB_CONCURRENCY jobs run at once; each chunk runs on the inference executor.
+    - Jobs are persisted after every chunk together with the position they reached, so
+      after a restart queued and interrupted jobs continue where they stopped.
+    - Cancellation takes effect between chunks; finished chunks stay committed.
+    """
+
+    def __init__(self, sync=None, concurrency=None):
+        self.sync = sync # Optional coroutine fn(chat_id, limit=...) run before analysis
+        self.concurrency = concurrency or Config.JOB_CONCURRENCY
+        self.queue = asyncio.Queue()
+        self.active = {} # job id -> job dict, queued or running
+        self.by_chat = defaultdict(list) # chat id -> active job ids, oldest first
+        self.cancelled = set()
+        self.locks = defaultdict(asyncio.Lock) # Jobs of one chat never overlap
+        self.runtime = {} # job id -> (monotonic start, done at start) for throughput
+        self.workers = []
+
+    def start(self):
+        if self.workers:
+            return
+        self._resume()
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def _resume(self):
+        with db.get_session() as session:
+            rows = (session.query(AnalysisJob)
+                    .filter(AnalysisJob.status.in_(ACTIVE))
+                    .order_by(AnalysisJob.created_at.asc())
+                    .all())
+            jobs = [_job_dict(r) for r in rows]
+        for job in jobs:
+            if job["id"] in self.active:
+                continue
+            if job["status"] == "running":
+                print(f"Resuming analysis job {job['id']} for chat {job['chat_id']} at message {job['after_id']}")
+            job["status"] = "queued"
+            self._track(job)
+
+    def _track(self, job):
+        self.active[job["id"]] = job
+        self.by_chat[job["chat_id"]].append(job["id"])
+        self.queue.put_nowait(job["id"])
+
+    def _persist(self, job):
+        # Queued on the database writer without waiting; the writer keeps the order
+        db.write(_save_job, dict(job))
+
+    def _publish(self, job):
+        events.publish(job["chat_id"], "progress", {
+            "job": "analysis",
+            "job_id": job["id"],
+            "phase": job["status"],
+            "analyzed": job["done"],
+            "total": job["total"],
+            "error": job["error"],
+        })
+
+    def submit(self, chat_id, full=False, profile=False):
+        """
+        Returns (job, created). created is False when the request was coalesced into
+        an existing job.
+        profile: record a sampling profile of the run (see core/profiler.py); can't be
+                 switched on for a job that is already running. Kept in memory only (not
+                 in COLUMNS), so a job resumed after a restart runs without profiling.
+        """
+        jobs = [self.active[j] for j in self.by_chat.get(chat_id, [])]
+        queued = [j for j in jobs if j["status"] == "queued"]
+        running = next((j for j in jobs if j["status"] == "running"), None)
+
+        # A queued full run covers any request; an incremental one only another incremental
+        # request, or a full one if it hasn't started yet (a resumed job past message 0 would
+        # skip everything before its position)
+        match = next((j for j in queued if j["full"] or not full), None)
+        if match is None and full:
+            match = next((j for j in queued if j["after_id"] == 0), None)
+            if match:
+                match["full"] = True
+                self._persist(match)
+        if match:
+            match["profile"] = match.get("profile") or profile
+            return match, False
+        # A full run can't be folded into a running or resumed incremental one, so it queues behind it
+        if not queued and running and (running["full"] or not full):
+            return running, False
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "chat_id": chat_id,
+            "full": full,
+            "status": "queued",
+            "after_id": 0,
+            "done": 0,
+            "total": None,
+            "error": None,
+            "created_at": datetime.utcnow(),
+            "started_at": None,
+            "finished_at": None,
+            "profile": profile, # Not persisted
+        }
+        self._persist(job)
+        self._track(job)
+        self._publish(job)
+        return job, True
+
+    def cancel(self, job_id):
+        job = self.active.get(job_id)
+        if not job:
+            return self.get(job_id)
+        if job["status"] == "queued":
+            # The worker drops it when it comes up
+            job["status"] = "cancelled"
+            job["finished_at"] = datetime.utcnow()
+            self._persist(job)
+            self._publish(job)
+            self._forget(job)
+        else:
+            self.cancelled.add(job_id)
+        return self.view(job)
+
+    def _forget(self, job):
+        self.active.pop(job["id"], None)
+        chat_jobs = self.by_chat.get(job["chat_id"], [])
+        if job["id"] in chat_jobs:
+            chat_jobs.remove(job["id"])
+        if not chat_jobs:
+            self.by_chat.pop(job["chat_id"], None)
+        self.runtime.pop(job["id"], None)
+
+    def view(self, job):
+        data = dict(job)
+        data["rate"] = None
+        data["eta_seconds"] = None
+        if job["id"] in self.runtime:
+            started, done_before = self.runtime[job["id"]]
+            elapsed = time.monotonic() - started
+            if elapsed > 0:
+                data["rate"] = (job["done"] - done_before) / elapsed
+            if data["rate"] and job["total"] is not None:
+                data["eta_seconds"] = max(0, job["total"] - job["done"]) / data["rate"]
+        for key in ("created_at", "started_at", "finished_at"):
+            if data[key]:
+                data[key] = data[key].isoformat()
+        return data
+
+    def get(self, job_id):
+        if job_id in self.active:
+            return self.view(self.active[job_id])
+        with db.read_session() as session:
+            row = session.get(AnalysisJob, job_id)
+            return self.view(_job_dict(row)) if row else None
+
+    def list(self, chat_id=None, status=None, limit=50):
+        with db.read_session() as session:
+            q = session.query(AnalysisJob)
+            if chat_id is not None:
+                q = q.filter(AnalysisJob.chat_id == chat_id)
+            if status:
+                q = q.filter(AnalysisJob.status == status)
+            rows = q.order_by(AnalysisJob.created_at.desc()).limit(limit).all()
+            jobs = [_job_dict(r) for r in rows]
+        # Live progress of active jobs is ahead of what was last persisted
+        return [self.view(self.active.get(j["id"], j)) for j in jobs]
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            job = self.active.get(job_id)
+            try:
+                if job and job["status"] == "queued":
+                    async with self.locks[job["chat_id"]]:
+                        # It may have been cancelled while waiting for the chat's lock
+                        if job_id in self.active and job["status"] == "queued":
+                            await self._run(job)
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job):
+        chat_id = job["chat_id"]
+        job["status"] = "running"
+        job["started_at"] = job["started_at"] or datetime.utcnow()
+        self.runtime[job["id"]] = (time.monotonic(), job["done"])
+        self._persist(job)
+        self._publish(job)
+        profiler = SamplingProfiler().start() if job.get("profile") else None
+
+        try:
+            if self.sync:
+                try:
+                    await self.sync(chat_id, limit=50) # Last 50 on first sync, then everything new
+                except Exception as e:
+                    print(f"Sync before analysis of {chat_id} failed, analyzing what is stored: {e}")
+
+            remaining = await inference.run(pending_count, chat_id, job["full"], job["after_id"])
+            job["total"] = job["done"] + remaining
+            self._persist(job)
+
+            while True:
+                if job["id"] in self.cancelled:
+                    job["status"] = "cancelled"
+                    break
+                analyzed, after_id = await inference.run(analyze_chunk, chat_id, job["full"], job["after_id"])
+                if not analyzed:
+                    job["status"] = "done"
+                    break
+                job["done"] += analyzed
+                job["after_id"] = after_id
+                job["total"] = max(job["total"], job["done"])
+                self._persist(job)
+                self._publish(job)
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            print(f"ERROR in analysis job {job['id']}: {e}")
+            traceback.print_exc()
+        finally:
+            if profiler:
+                job["profile_path"] = profiler.stop().dump(job["id"])
+                print(f"Profile of analysis job {job['id']} ({profiler.samples} samples): {job['profile_path']}")
+            # A job interrupted by shutdown stays "running" and is resumed on the next start
+            if job["status"] not in ACTIVE:
+                job["finished_at"] = datetime.utcnow()
+            self._persist(job)
+            self._publish(job)
+            self.cancelled.discard(job["id"])
+            self._forget(job)
+
+        if job["status"] == "done" and job["done"]:
+            with db.read_session() as session:
+                overall = chat_overall(session, chat_id)
+            if overall:
+                events.publish(chat_id, "rollups", {"overall": overall})
+
+    def stats(self):
+        return {
+            "concurrency": self.concurrency,
+            "queued": sum(1 for j in self.active.values() if j["status"] == "queued"),
+            "running": sum(1 for j in self.active.values() if j["status"] == "running"),
+        }
@@ -0,0 +1,196 @@
+from bisect import bisect_left
+import os
+import sys
+import threading
+import time
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+
+# Seconds, from sub-millisecond DB lookups up to slow model batches
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value=1, *labels):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + value
+
+    def samples(self):
+        with self._lock:
+            items = list(self.values.items())
+        return [(self.name + _labels(self.label_names, k), v) for k, v in items]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=STAGE_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {} # labels -> [counts per bucket (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(v[0]), v[1], v[2]) for k, v in self.values.items()]
+        out = []
+        for labels, counts, total, count in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                out.append((self.name + "_bucket" + _labels(self.label_names, labels, ("le", _number(bound))), cumulative))
+            out.append((self.name + "_sum" + _labels(self.label_names, labels), total))
+            out.append((self.name + "_count" + _labels(self.label_names, labels), count))
+        return out
+
+
+class Callback:
+    """
+    Value read at scrape time (queue depths, counters kept by other components), so
+    it costs nothing between scrapes. fn returns a number or {label values tuple: number}.
+    """
+
+    def __init__(self, name, help, fn, labels=(), kind="gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.label_names = tuple(labels)
+        self.kind = kind
+
+    def samples(self):
+        value = self.fn()
+        if isinstance(value, dict):
+            return [(self.name + _labels(self.label_names, k), v) for k, v in value.items()]
+        return [] if value is None else [(self.name, value)]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def _add(self, metric):
+        # Registering the same name again returns the existing metric
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=STAGE_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def callback(self, name, help, fn, labels=(), kind="gauge"):
+        metric = Callback(name, help, fn, labels, kind)
+        self.metrics[name] = metric
+        return metric
+
+    def render(self):
+        """
+        Prometheus text exposition format (version 0.0.4).
+        """
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                print(f"Metric {metric.name} failed: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name} {_number(value)}" for name, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+metrics = Registry()
+
+STAGE_SECONDS = metrics.histogram(
+    "analyzer_stage_seconds", "Time spent per pipeline stage call", labels=("stage",))
+STAGE_ITEMS = metrics.counter(
+    "analyzer_stage_items_total", "Items (messages, texts, rows) handled per pipeline stage", labels=("stage",))
+
+
+class _Stage:
+    __slots__ = ("name", "items", "started")
+
+    def __init__(self, name, items):
+        self.name = name
+        self.items = items
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.started, self.items)
+        return False
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name, items=None):
+    """
+    with stage("encode", items=len(texts)): ...
+    Records the duration (and item count) of one call of a pipeline stage.
+    """
+    if not Config.METRICS_ENABLED:
+        return _NO_STAGE
+    return _Stage(name, items)
+
+
+def observe(name, seconds, items=None):
+    # For stages whose time is accumulated by hand, e.g. waits inside an async for
+    if not Config.METRICS_ENABLED:
+        return
+    STAGE_SECONDS.observe(seconds, name)
+    if items:
+        STAGE_ITEMS.inc(items, name)
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Text, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Text, Boolean, Index, JSON, LargeBinary
 from sqlalchemy.orm import relationship, declarative_base
 
 Base = declarative_base()
@@ -30,6 +30,11 @@ class Chat(Base):
 
 class Message(Base):
     __tablename__ = 'messages'
+    __table_args__ = (
+        Index('ix_messages_chat_date', 'chat_id', 'date'),
+        # A Telegram message id is unique within its chat; backs ON CONFLICT DO NOTHING on sync
+        Index('uq_messages_chat_telegram', 'chat_id', 'telegram_id', unique=True),
+    )
     
     id = Column(Integer, primary_key=True) # Internal DB ID
     telegram_id = Column(Integer) # Message ID in Telegram
@@ -45,6 +50,10 @@ class Message(Base):
 
 class MessageAnalysis(Base):
     __tablename__ = 'message_analysis'
+    __table_args__ = (
+        # One analysis per message; also backs the anti-join and bulk upserts
+        Index('uq_message_analysis_message_id', 'message_id', unique=True),
+    )
     
     id = Column(Integer, primary_key=True)
     message_id = Column(Integer, ForeignKey('messages.id'))
@@ -73,3 +82,107 @@ class ChatAnalysis(Base):
     overall_sentiment_trend = Column(String) # 'warming', 'cooling', 'stable'
     
     chat = relationship("Chat", back_populates="analysis")
+
+class ReplyModel(Base):
+    __tablename__ = 'reply_models'
+    
+    chat_id = Column(Integer, ForeignKey('chats.id'), primary_key=True)
+    version = Column(Integer, default=1) # Bumped on every update, tells other processes their copy is stale
+    params = Column(JSON) # Latency stats per sender and sender pair, per-horizon model coefficients
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class AnalysisCheckpoint(Base):
+    __tablename__ = 'analysis_checkpoints'
+    
+    chat_id = Column(Integer, ForeignKey('chats.id'), primary_key=True)
+    last_message_id = Column(Integer, default=0) # Highest internal Message.id analyzed
+    last_message_date = Column(DateTime, nullable=True) # Newest message date analyzed
+    # Highest MessageAnalysis.id when the running full re-analysis reset the chat; rows
+    # above it were written (and counted) after the reset. None outside full runs
+    reset_analysis_id = Column(Integer, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SyncCheckpoint(Base):
+    __tablename__ = 'sync_checkpoints'
+    
+    chat_id = Column(Integer, ForeignKey('chats.id'), primary_key=True)
+    newest_id = Column(Integer, nullable=True) # Highest Telegram message id synced
+    oldest_id = Column(Integer, nullable=True) # Lowest Telegram message id synced
+    history_complete = Column(Boolean, default=False) # Backfill reached the first message
+    messages_fetched = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class ChatRollup(Base):
+    __tablename__ = 'chat_rollups'
+    __table_args__ = (
+        Index('uq_chat_rollups_bucket', 'chat_id', 'bucket', 'bucket_start', unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(Integer, ForeignKey('chats.id'))
+    bucket = Column(String) # 'all', 'hour', 'day', 'week'
+    bucket_start = Column(DateTime)
+    
+    # Running sums so mean/variance can be updated incrementally
+    message_count = Column(Integer, default=0)
+    sentiment_sum = Column(Float, default=0.0)
+    sentiment_sq_sum = Column(Float, default=0.0)
+    urgency_sum = Column(Float, default=0.0)
+    urgency_hist = Column(JSON) # Message counts per 20-point urgency band
+    intent_hist = Column(JSON) # intent -> message count
+
+class DriftPoint(Base):
+    __tablename__ = 'drift_points'
+    __table_args__ = (
+        Index('ix_drift_points_chat_date', 'chat_id', 'date'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(Integer, ForeignKey('chats.id'))
+    date = Column(DateTime) # Date of the newest message covered
+    
+    # Last N messages window
+    message_slope = Column(Float) # Sentiment change per message
+    message_variance = Column(Float)
+    message_trend = Column(String) # 'Warming', 'Cooling', 'Stable', 'Volatile'
+    
+    # Last T hours window
+    hour_slope = Column(Float) # Sentiment change per hour
+    hour_variance = Column(Float)
+    hour_trend = Column(String)
+
+class AnalysisJob(Base):
+    __tablename__ = 'analysis_jobs'
+    __table_args__ = (
+        Index('ix_analysis_jobs_chat_status', 'chat_id', 'status'),
+    )
+    
+    id = Column(String, primary_key=True) # uuid4 hex
+    chat_id = Column(Integer, ForeignKey('chats.id'))
+    full = Column(Boolean, default=False)
+    status = Column(String, default="queued") # 'queued', 'running', 'done', 'failed', 'cancelled'
+    
+    after_id = Column(Integer, default=0) # Message.id the run has got to, resumes from here
+    done = Column(Integer, default=0)
+    total = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+class MessageEmbedding(Base):
+    __tablename__ = 'message_embeddings'
+    __table_args__ = (
+        Index('uq_message_embeddings_message_id', 'message_id', unique=True),
+        {"sqlite_autoincrement": True}, # Ids are never reused, not even the highest one
+    )
+    
+    # Insertion order, lets the vector index pick up new rows. A re-stored embedding
+    # replaces its row and gets a new id, so it is picked up the same way
+    id = Column(Integer, primary_key=True)
+    message_id = Column(Integer, ForeignKey('messages.id'))
+    chat_id = Column(Integer, ForeignKey('chats.id'))
+    dtype = Column(String) # 'float32' or 'int8'
+    scale = Column(Float, nullable=True) # int8 only: vector = values * scale
+    vector = Column(LargeBinary)
@@ -0,0 +1,279 @@
+from sqlalchemy import bindparam, func, update
+import numpy as np
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import os
+import sys
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from core.database import db
+from core.models import Message, MessageAnalysis, AnalysisCheckpoint
+from core.analyzer import analyzer
+from core.rollups import apply_rollups, reset_rollups
+from core.drift import drift
+from core.replies import replies, COLUMNS as REPLY_COLUMNS
+from core.engagement import engagement
+from core.vector_index import store_embeddings
+from core.metrics import stage
+
+# record_analyses keeps these engines' in-memory state in step with what it writes; if the
+# writer rolls a batch back, that state is dropped so replayed jobs don't apply it twice
+for _engine in (drift, replies, engagement):
+    db.on_rollback(_engine.forget)
+
+# Columns recomputed on every (re-)analysis
+ANALYSIS_COLUMNS = [
+    "intent", "intent_confidence", "urgency_score", "engagement_score",
+    "sentiment_score", "emotional_tone",
+    "future_reply_prob_5min", "future_reply_prob_1hr", "future_reply_prob_24hr",
+]
+INSERT_COLUMNS = ["message_id"] + ANALYSIS_COLUMNS
+
+
+def _fetch_chunk(session, chat_id, after_id, full, limit):
+    """
+    Next chunk of messages to analyze, ordered by internal id.
+    Incremental mode anti-joins against message_analysis so only unanalyzed rows come back.
+    """
+    q = (session.query(Message.id, Message.text, Message.date, Message.sender_id)
+         .filter(Message.chat_id == chat_id, Message.id > after_id))
+    if not full:
+        q = (q.outerjoin(MessageAnalysis, MessageAnalysis.message_id == Message.id)
+              .filter(MessageAnalysis.id.is_(None)))
+    return q.order_by(Message.id.asc()).limit(limit).all()
+
+
+def _time_gaps(session, chat_id, rows):
+    """
+    Seconds since the previous message in the chat (by date) for every row.
+    Only looks at the date range spanned by the rows plus the one message right
+    before it, so the gap stays correct across the incremental boundary.
+    """
+    lo = min(r.date for r in rows)
+    hi = max(r.date for r in rows)
+
+    boundary = (session.query(func.max(Message.date))
+                .filter(Message.chat_id == chat_id, Message.date < lo)
+                .scalar())
+    context = (session.query(Message.date, Message.id)
+               .filter(Message.chat_id == chat_id, Message.date >= lo, Message.date <= hi)
+               .order_by(Message.date.asc(), Message.id.asc())
+               .all())
+    dates = np.array([d for d, _ in context], dtype="datetime64[us]").astype(np.int64)
+    position = {msg_id: k for k, (_, msg_id) in enumerate(context)}
+    idx = np.array([position[r.id] for r in rows], dtype=np.int64)
+
+    # Gap to the previous message in (date, id) order
+    gaps = (dates[idx] - dates[np.maximum(idx - 1, 0)]) / 1e6
+    first = idx == 0
+    if boundary:
+        gaps[first] = (dates[idx[first]] - np.datetime64(boundary, "us").astype(np.int64)) / 1e6
+    else:
+        # The very first message of a chat has no predecessor
+        gaps[first] = 0
+    return gaps
+
+
+def score_messages(session, chat_id, rows, intents=None, embeddings=None):
+    """
+    Computes MessageAnalysis column values for rows of one chat.
+    rows: objects with id, text, date and sender_id (e.g. query rows)
+    intents: optional precomputed (intent, confidence) pairs, one per row
+    embeddings: the message embeddings that came with precomputed intents, if any
+    Each entry also carries the message embedding (or None) under "embedding".
+    """
+    texts = [r.text for r in rows]
+    gaps = _time_gaps(session, chat_id, rows)
+    if intents is None:
+        intents, embeddings = analyzer.predict_intents_batch(texts, return_embeddings=True)
+
+    urgency = analyzer.calculate_urgency_batch(texts, gaps)
+    sentiment = analyzer.calculate_sentiment_batch(texts)
+    with stage("reply_prob", items=len(rows)):
+        reply_probs = replies.predict(session, chat_id, rows, gaps, intents, urgency, sentiment)
+    with stage("engagement", items=len(rows)):
+        engagement_scores = engagement.score(session, chat_id, rows)
+
+    entries = []
+    for k, (r, (intent, confidence)) in enumerate(zip(rows, intents)):
+        entries.append({
+            "message_id": r.id,
+            "intent": intent,
+            "intent_confidence": confidence,
+            "urgency_score": float(urgency[k]),
+            "engagement_score": engagement_scores[k],
+            "sentiment_score": float(sentiment[k]),
+            "emotional_tone": analyzer.analyze_emotional_tone(sentiment[k]),
+            **reply_probs[k],
+            "embedding": embeddings[k] if embeddings is not None else None,
+        })
+    return entries
+
+
+def write_analyses(session, entries, full=False, reset_id=None):
+    """
+    Bulk writes analysis rows. Full re-analysis overwrites existing rows in place.
+    reset_id: with full, only rows up to this MessageAnalysis.id are overwritten; newer
+              ones were written after the run's reset (live stream) and already counted.
+    Returns the set of message ids that were written.
+    """
+    if not entries:
+        return set()
+    stmt = sqlite_insert(MessageAnalysis)
+    if full:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["message_id"],
+            set_={c: getattr(stmt.excluded, c) for c in ANALYSIS_COLUMNS},
+            where=MessageAnalysis.id <= reset_id if reset_id is not None else None,
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=["message_id"])
+    params = [{c: e[c] for c in INSERT_COLUMNS} for e in entries]
+    # RETURNING skips rows that hit the conflict, so callers only count real writes
+    result = session.execute(stmt.returning(MessageAnalysis.message_id), params)
+    return {row[0] for row in result}
+
+
+def _fill_reply_probs(session, chat_id, rows, entries):
+    """
+    Predicts again the rows that were scored before the chat's reply model had labels
+    for every horizon (a new chat, the start of a full run), now that replies.update()
+    has learned from them, and writes their reply columns. Does not commit.
+    rows, entries: the written rows and their entries, in the same order
+    """
+    missing = [k for k, e in enumerate(entries) if any(e[c] is None for c in REPLY_COLUMNS)]
+    if not missing:
+        return
+    sub = [rows[k] for k in missing]
+    subentries = [entries[k] for k in missing]
+    probs = replies.predict(
+        session, chat_id, sub, _time_gaps(session, chat_id, sub),
+        [(e["intent"], e["intent_confidence"]) for e in subentries],
+        [e["urgency_score"] for e in subentries], [e["sentiment_score"] for e in subentries],
+    )
+    params = []
+    for e, p in zip(subentries, probs):
+        if all(p[c] is None for c in REPLY_COLUMNS):
+            continue # Still nothing labeled
+        e.update(p)
+        params.append({"mid": e["message_id"], **{f"p_{c}": p[c] for c in REPLY_COLUMNS}})
+    if params:
+        stmt = (update(MessageAnalysis)
+                .where(MessageAnalysis.message_id == bindparam("mid"))
+                .values({c: bindparam(f"p_{c}") for c in REPLY_COLUMNS}))
+        session.connection().execute(stmt, params)
+
+
+def record_analyses(session, chat_id, rows, entries, full=False, reset_id=None):
+    """
+    Writes the analyses of one chat and updates everything derived from them.
+    Returns the entries that were actually written. Does not commit.
+    """
+    with stage("analysis_insert", items=len(entries)):
+        written = write_analyses(session, entries, full, reset_id)
+    written_rows = [r for r in rows if r.id in written]
+    written_entries = [e for e in entries if e["message_id"] in written]
+    with stage("rollups", items=len(written_entries)):
+        apply_rollups(session, chat_id, [r.date for r in written_rows], written_entries)
+    if not full:
+        # A full run goes by id, not date; its drift series is replayed once at the end
+        with stage("drift", items=len(written_entries)):
+            drift.update(session, chat_id, written_rows, written_entries)
+    with stage("reply_model", items=len(written_entries)):
+        replies.update(session, chat_id, written_rows, written_entries)
+        _fill_reply_probs(session, chat_id, written_rows, written_entries)
+    with stage("chat_engagement", items=len(written_entries)):
+        engagement.update(session, chat_id, written_rows, written_entries)
+    if Config.STORE_EMBEDDINGS:
+        with stage("embedding_store", items=len(written_entries)):
+            store_embeddings(session, chat_id, written_entries)
+    return written_entries
+
+
+def pending_count(chat_id, full=False, after_id=0):
+    """
+    Number of messages an analysis run starting after after_id still has to go through.
+    """
+    with db.read_session() as session:
+        q = session.query(func.count(Message.id)).filter(Message.chat_id == chat_id, Message.id > after_id)
+        if not full:
+            q = (q.outerjoin(MessageAnalysis, MessageAnalysis.message_id == Message.id)
+                  .filter(MessageAnalysis.id.is_(None)))
+        return q.scalar()
+
+
+def _store_chunk(session, chat_id, rows, entries, full, reset):
+    """
+    Write half of analyze_chunk, run on the database writer.
+    """
+    checkpoint = session.get(AnalysisCheckpoint, chat_id)
+    if not checkpoint:
+        checkpoint = AnalysisCheckpoint(chat_id=chat_id, last_message_id=0)
+        session.add(checkpoint)
+    if reset:
+        # Every message gets rewritten, so the aggregates are rebuilt from scratch.
+        # Analyses the live stream writes from here on are counted as they come in,
+        # so the run must not rewrite (and count) them again
+        reset_rollups(session, chat_id)
+        drift.reset(session, chat_id)
+        replies.reset(session, chat_id)
+        checkpoint.reset_analysis_id = session.query(func.coalesce(func.max(MessageAnalysis.id), 0)).scalar()
+    if not rows:
+        if full:
+            # End of a full run
+            with stage("drift_replay"):
+                drift.replay(session, chat_id)
+            checkpoint.reset_analysis_id = None
+        return
+
+    record_analyses(session, chat_id, rows, entries, full, checkpoint.reset_analysis_id if full else None)
+
+    # Advance the high-water mark together with the chunk it covers
+    checkpoint.last_message_id = max(checkpoint.last_message_id or 0, rows[-1].id)
+    newest = max(r.date for r in rows)
+    if not checkpoint.last_message_date or newest > checkpoint.last_message_date:
+        checkpoint.last_message_date = newest
+
+
+def analyze_chunk(chat_id, full=False, after_id=0, chunk_size=None):
+    """
+    Analyzes the next chunk of a chat. Scoring reads from a read-only connection, the
+    results are committed in one go by the database writer.
+    after_id: internal Message.id the run has got to; 0 starts a new run. A full run
+    starting at 0 clears the chat's rollups and drift series first; its last, empty
+    chunk replays the drift series in date order.
+    Returns (messages analyzed, new after_id). 0 analyzed means the run is finished.
+    """
+    chunk_size = chunk_size or Config.ANALYSIS_CHUNK_SIZE
+    reset = full and after_id == 0
+
+    with db.read_session() as session:
+        if not full:
+            checkpoint = session.get(AnalysisCheckpoint, chat_id)
+            after_id = max(after_id, (checkpoint.last_message_id or 0) if checkpoint else 0)
+        rows = _fetch_chunk(session, chat_id, after_id, full, chunk_size)
+        entries = score_messages(session, chat_id, rows) if rows else []
+
+    db.run_write(_store_chunk, chat_id, rows, entries, full, reset)
+    if not rows:
+        return 0, after_id
+    return len(rows), rows[-1].id
+
+
+def analyze_chat(chat_id, full=False, chunk_size=None):
+    """
+    Analyzes the messages of a chat that have no MessageAnalysis yet.
+    full=True re-analyzes every message of the chat.
+    Progress is tracked with a per-chat high-water mark (AnalysisCheckpoint), so each
+    run only touches messages inserted since the previous one.
+    Returns the number of messages analyzed.
+    """
+    count = 0
+    after_id = 0
+    while True:
+        analyzed, after_id = analyze_chunk(chat_id, full, after_id, chunk_size)
+        if not analyzed:
+            return count
+        count += analyzed
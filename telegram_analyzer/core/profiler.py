@@ -0,0 +1,91 @@
+from collections import Counter
+import os
+import sys
+import threading
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+
+# Leaf frames of threads that are blocked waiting for work; not worth a sample
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"), # concurrent.futures worker blocked on its queue
+    ("connection.py", "wait"),
+    ("connection.py", "_recv"),
+}
+
+
+def profile_path(name):
+    return os.path.join(Config.PROFILE_DIR, f"{name}.folded")
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler for the whole process, started only on request.
+    A daemon thread wakes every PROFILE_INTERVAL_MS, walks the stack of every other
+    thread (sys._current_frames) and counts busy stacks. Nothing runs while it is off.
+    folded() returns the "collapsed stack" format read by flamegraph.pl, speedscope and
+    similar tools: one line per stack, "thread;outer;...;inner count".
+    In INFERENCE_MODE=process only the server process is sampled.
+    """
+
+    def __init__(self, interval_ms=None):
+        self.interval = (interval_ms or Config.PROFILE_INTERVAL_MS) / 1000
+        self.stacks = Counter()
+        self.samples = 0
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        return self
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                leaf = frame.f_code
+                if (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def dump(self, name):
+        """
+        Writes the folded stacks to PROFILE_DIR/<name>.folded and returns the path.
+        """
+        os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+        path = profile_path(name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.folded())
+        return path
@@ -0,0 +1,508 @@
+from datetime import datetime
+import math
+import os
+import sys
+import threading
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from core.models import Message, MessageAnalysis, ReplyModel
+from core.analyzer import analyzer
+
+# MessageAnalysis column -> horizon in seconds
+HORIZONS = {
+    "future_reply_prob_5min": 300,
+    "future_reply_prob_1hr": 3600,
+    "future_reply_prob_24hr": 86400,
+}
+COLUMNS = list(HORIZONS)
+NAMES = [c.rsplit("_", 1)[1] for c in COLUMNS] # "5min", "1hr", "24hr"
+SECONDS = np.array(list(HORIZONS.values()), dtype=np.float64)
+LONGEST = SECONDS[-1]
+LOG_DAY = math.log1p(LONGEST)
+EPOCH = datetime(1970, 1, 1)
+
+BASE_FEATURES = [
+    "author_rate_5min", "author_rate_1hr", "author_rate_24hr", "author_latency",
+    "urgency", "sentiment", "intent_confidence", "question", "length", "gap", "hour_sin", "hour_cos",
+]
+
+
+def _seconds(dates):
+    # Naive UTC datetimes as stored -> epoch seconds; 5x faster than going through datetime64
+    return np.array([(d - EPOCH).total_seconds() for d in dates], dtype=np.float64)
+
+
+def _sender_array(sender_ids):
+    # Unknown senders (channel posts) count as one participant
+    return np.array([s or 0 for s in sender_ids], dtype=np.int64)
+
+
+def response_latencies(times, senders, telegram_ids, reply_to):
+    """
+    For every message of a timeline (arrays in (date, id) order): seconds until
+    someone else answered, and the position of the answer. The answer is the next
+    message by another sender (turn change) or an explicit reply by another sender,
+    whichever came first. inf / -1 where the timeline holds no answer.
+    """
+    n = len(times)
+    latency = np.full(n, np.inf)
+    responder = np.full(n, -1, dtype=np.int64)
+    if not n:
+        return latency, responder
+
+    # Runs of consecutive messages by one sender; each run is answered by the start of the next
+    change = np.ones(n, dtype=bool)
+    change[1:] = senders[1:] != senders[:-1]
+    starts = np.flatnonzero(change)
+    next_run = np.cumsum(change) # Index into starts of the following run
+    has = next_run < len(starts)
+    responder[has] = starts[next_run[has]]
+    latency[has] = times[responder[has]] - times[has]
+
+    replying = np.flatnonzero(reply_to > 0)
+    if len(replying):
+        order = np.argsort(telegram_ids, kind="stable")
+        sorted_ids = telegram_ids[order]
+        pos = np.minimum(np.searchsorted(sorted_ids, reply_to[replying]), n - 1)
+        found = sorted_ids[pos] == reply_to[replying]
+        src, dst = replying[found], order[pos[found]]
+        valid = (senders[src] != senders[dst]) & (times[src] >= times[dst])
+        src, dst = src[valid], dst[valid]
+        lag = times[src] - times[dst]
+
+        # Earliest explicit reply per message, kept where it beats the turn change
+        o = np.lexsort((lag, dst))
+        src, dst, lag = src[o], dst[o], lag[o]
+        first = np.ones(len(dst), dtype=bool)
+        first[1:] = dst[1:] != dst[:-1]
+        src, dst, lag = src[first], dst[first], lag[first]
+        better = lag < latency[dst]
+        latency[dst[better]] = lag[better]
+        responder[dst[better]] = src[better]
+    return latency, responder
+
+
+def reply_prob(analysis):
+    """
+    {"5min": p, "1hr": p, "24hr": p} for API items, from a MessageAnalysis or an entry dict.
+    """
+    get = analysis.get if isinstance(analysis, dict) else lambda c: getattr(analysis, c, None)
+    return {name: get(c) for name, c in zip(NAMES, COLUMNS)}
+
+
+def _sigmoid(z):
+    return 1 / (1 + np.exp(-np.clip(z, -30, 30)))
+
+
+def _classifier(model=None):
+    from sklearn.linear_model import SGDClassifier
+
+    clf = SGDClassifier(loss="log_loss", alpha=Config.REPLY_ALPHA, random_state=0)
+    if model and model["coef"] is not None:
+        # partial_fit needs its internal buffers, so take one throwaway step and put the saved state back
+        clf.partial_fit(np.zeros((2, len(model["coef"]))), [0, 1], classes=[0, 1])
+        clf.coef_ = np.array([model["coef"]], dtype=np.float64)
+        clf.intercept_ = np.array([model["intercept"]], dtype=np.float64)
+        clf.t_ = model["t"]
+    return clf
+
+
+class ChatReplies:
+    """
+    Reply model of one chat.
+    - Latency statistics: per author (messages labeled and answered per horizon, log
+      latency sums) and per (author, responder) pair, all running sums.
+    - One logistic model per horizon (SGDClassifier, log loss), trained with
+      partial_fit on each message once its label is final, i.e. once the chat has
+      moved on by the horizon's length.
+    Serialized to ReplyModel.params.
+    """
+
+    def __init__(self, vocab, params=None):
+        self.vocab = list(vocab)
+        self.intent_index = {label: i for i, label in enumerate(self.vocab)}
+        self.features = BASE_FEATURES + [f"intent:{label}" for label in self.vocab]
+        self.version = 0
+        params = params or {}
+        self.end = params.get("end") # Newest message time (epoch seconds) labels were derived up to
+        self.chat = params.get("chat") or {"n": [0, 0, 0], "k": [0, 0, 0]}
+        # author -> [n per horizon..., answered per horizon..., answered within a day, log latency sum]
+        self.authors = params.get("authors") or {}
+        # "author>responder" -> [answers, log latency sum, log latency square sum, within 5min, within 1hr]
+        self.pairs = params.get("pairs") or {}
+        self.models = params.get("models") or {
+            c: {"coef": None, "intercept": 0.0, "t": 1.0, "samples": 0, "positives": 0} for c in COLUMNS
+        }
+
+    def to_params(self):
+        return {
+            "vocab": self.vocab,
+            "end": self.end,
+            "chat": self.chat,
+            "authors": self.authors,
+            "pairs": self.pairs,
+            "models": self.models,
+        }
+
+    def _author_table(self, senders):
+        """
+        Smoothed reply rates per horizon and typical latency for each distinct sender.
+        Returns (table, inverse) so table[inverse] lines up with senders.
+        """
+        uniq, inverse = np.unique(senders, return_inverse=True)
+        n, k = np.array(self.chat["n"], dtype=np.float64), np.array(self.chat["k"], dtype=np.float64)
+        prior = (k + 1) / (n + 2)
+        weight = Config.REPLY_PRIOR_WEIGHT
+        chat_latency = self._mean_log_latency(self.authors.values())
+
+        table = np.empty((len(uniq), 4))
+        for i, sender in enumerate(uniq.tolist()):
+            stats = self.authors.get(str(sender))
+            if stats:
+                table[i, :3] = (np.array(stats[3:6]) + weight * prior) / (np.array(stats[:3]) + weight)
+                table[i, 3] = stats[7] / stats[6] / LOG_DAY if stats[6] else chat_latency
+            else:
+                table[i, :3] = prior
+                table[i, 3] = chat_latency
+        return table, inverse
+
+    @staticmethod
+    def _mean_log_latency(stats):
+        answered = sum(s[6] for s in stats)
+        if not answered:
+            return 1.0 # As slow as a day
+        return sum(s[7] for s in stats) / answered / LOG_DAY
+
+    def feature_matrix(self, senders, times, gaps, texts, intents, confidence, urgency, sentiment):
+        n = len(times)
+        X = np.zeros((n, len(self.features)))
+        if not n:
+            return X
+        table, inverse = self._author_table(senders)
+        X[:, :4] = table[inverse]
+        X[:, 4] = np.nan_to_num(np.asarray(urgency, dtype=np.float64)) / 100
+        X[:, 5] = np.nan_to_num(np.asarray(sentiment, dtype=np.float64))
+        X[:, 6] = np.nan_to_num(np.asarray(confidence, dtype=np.float64))
+        X[:, 7] = [bool(t) and "?" in t for t in texts]
+        X[:, 8] = np.log1p([len(t or "") for t in texts]) / 5
+        X[:, 9] = np.log1p(np.maximum(gaps, 0)) / LOG_DAY
+        angle = (times % 86400) / 86400 * 2 * np.pi
+        X[:, 10] = np.sin(angle)
+        X[:, 11] = np.cos(angle)
+        index = np.array([self.intent_index.get(i, -1) for i in intents])
+        hit = index >= 0
+        X[np.flatnonzero(hit), len(BASE_FEATURES) + index[hit]] = 1
+        return X
+
+    def predict(self, X):
+        """
+        (n, 3) reply probabilities. Horizons whose model has not seen enough of both
+        outcomes fall back to the author's smoothed reply rate; None for a horizon
+        without any labeled message yet.
+        """
+        P = np.empty((len(X), len(COLUMNS)))
+        known = []
+        for j, column in enumerate(COLUMNS):
+            model = self.models[column]
+            known.append(self.chat["n"][j] > 0)
+            fitted = (model["coef"] is not None and model["samples"] >= Config.REPLY_MIN_SAMPLES
+                      and 0 < model["positives"] < model["samples"])
+            if fitted:
+                P[:, j] = _sigmoid(X @ np.array(model["coef"]) + model["intercept"])
+            else:
+                P[:, j] = X[:, j]
+        # A reply within 5 minutes is also one within the hour
+        P = np.maximum.accumulate(P, axis=1)
+        return P, known
+
+    def train(self, j, X, y):
+        column = COLUMNS[j]
+        model = self.models[column]
+        clf = _classifier(model)
+        clf.partial_fit(X, y.astype(np.int64), classes=[0, 1])
+        model["coef"] = clf.coef_[0].tolist()
+        model["intercept"] = float(clf.intercept_[0])
+        model["t"] = float(clf.t_)
+        model["samples"] += int(len(y))
+        model["positives"] += int(y.sum())
+
+    def add_labels(self, j, senders, y):
+        self.chat["n"][j] += int(len(y))
+        self.chat["k"][j] += int(y.sum())
+        uniq, inverse = np.unique(senders, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(uniq))
+        answered = np.bincount(inverse, weights=y, minlength=len(uniq))
+        for sender, c, a in zip(uniq.tolist(), counts.tolist(), answered.tolist()):
+            stats = self.authors.setdefault(str(sender), [0] * 8)
+            stats[j] += c
+            stats[3 + j] += int(a)
+
+    def add_latencies(self, authors, responders, latency):
+        """
+        Answers within a day, by (author, responder) pair.
+        """
+        logs = np.log1p(latency)
+        pairs = np.stack([authors, responders], axis=1)
+        uniq, inverse = np.unique(pairs, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        size = len(uniq)
+        sums = [
+            np.bincount(inverse, minlength=size),
+            np.bincount(inverse, weights=logs, minlength=size),
+            np.bincount(inverse, weights=logs * logs, minlength=size),
+            np.bincount(inverse, weights=latency <= SECONDS[0], minlength=size),
+            np.bincount(inverse, weights=latency <= SECONDS[1], minlength=size),
+        ]
+        for i, (author, responder) in enumerate(uniq.tolist()):
+            stats = self.pairs.setdefault(f"{author}>{responder}", [0, 0.0, 0.0, 0, 0])
+            for f, s in enumerate(sums):
+                stats[f] += s[i].item()
+            author_stats = self.authors.setdefault(str(author), [0] * 8)
+            author_stats[6] += int(sums[0][i])
+            author_stats[7] += float(sums[1][i])
+
+    def summary(self):
+        """
+        Latency distributions and model state, for the API.
+        """
+        def pair(key, stats):
+            author, responder = key.split(">")
+            count, log_sum, log_sq = stats[0], stats[1], stats[2]
+            mean = log_sum / count
+            spread = math.sqrt(max(0.0, log_sq / count - mean * mean))
+            return {
+                "sender_id": int(author),
+                "responder_id": int(responder),
+                "answers": int(count),
+                # Log-normal fit of the latencies
+                "median_seconds": math.expm1(mean),
+                "p90_seconds": math.expm1(mean + 1.2816 * spread),
+                "within_5min": stats[3] / count,
+                "within_1hr": stats[4] / count,
+            }
+
+        return {
+            "models": {
+                name: {
+                    "samples": self.models[c]["samples"],
+                    "base_rate": self.models[c]["positives"] / self.models[c]["samples"] if self.models[c]["samples"] else None,
+                    "fitted": self.models[c]["coef"] is not None and self.models[c]["samples"] >= Config.REPLY_MIN_SAMPLES,
+                } for name, c in zip(NAMES, COLUMNS)
+            },
+            "senders": [{
+                "sender_id": int(sender),
+                "messages": stats[2],
+                "reply_rate": {name: stats[3 + j] / stats[j] if stats[j] else None for j, name in enumerate(NAMES)},
+            } for sender, stats in self.authors.items()],
+            "pairs": sorted((pair(k, s) for k, s in self.pairs.items() if s[0]), key=lambda p: -p["answers"]),
+        }
+
+
+class ReplyEngine:
+    """
+    Reply probabilities per message, learned per chat.
+    Labels come from the chat itself: response latencies are derived from timestamps,
+    sender alternation and reply_to_msg_id with vectorized NumPy over a timeline
+    (response_latencies). update() runs with every written batch of analyses and only
+    looks at the messages whose labels became final since the previous update, so the
+    per-chat state grows incrementally. State is kept in memory and in ReplyModel;
+    the version column tells a process (process inference mode) that its copy is stale.
+    """
+
+    def __init__(self):
+        self.chats = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def vocab():
+        return list(analyzer.intents) + ["neutral"]
+
+    def _state(self, session, chat_id):
+        version = session.query(ReplyModel.version).filter(ReplyModel.chat_id == chat_id).scalar()
+        cached = self.chats.get(chat_id)
+        if version is None:
+            return None
+        if cached and cached.version == version:
+            return cached
+        params = session.query(ReplyModel.params).filter(ReplyModel.chat_id == chat_id).scalar() or {}
+        if params.get("vocab") != self.vocab():
+            # Intents changed, the feature layout with them
+            return None
+        state = ChatReplies(params["vocab"], params)
+        state.version = version
+        self.chats[chat_id] = state
+        return state
+
+    def predict(self, session, chat_id, rows, gaps, intents, urgency, sentiment):
+        """
+        Reply probabilities for freshly scored rows (objects with text, date, sender_id).
+        Returns one {column: probability or None} dict per row.
+        """
+        with self._lock:
+            state = self._state(session, chat_id)
+        if state is None:
+            return [dict.fromkeys(COLUMNS) for _ in rows]
+        X = state.feature_matrix(
+            _sender_array(r.sender_id for r in rows), _seconds([r.date for r in rows]), np.asarray(gaps),
+            [r.text for r in rows], [i for i, _ in intents], [c for _, c in intents], urgency, sentiment,
+        )
+        P, known = state.predict(X)
+        return [{c: float(P[i, j]) if known[j] else None for j, c in enumerate(COLUMNS)} for i in range(len(rows))]
+
+    def _timeline(self, session, chat_id, lo=None, hi=None):
+        q = (session.query(Message.id, Message.date, Message.sender_id, Message.telegram_id,
+                           Message.reply_to_msg_id, Message.text, MessageAnalysis.intent,
+                           MessageAnalysis.intent_confidence, MessageAnalysis.urgency_score,
+                           MessageAnalysis.sentiment_score)
+             .outerjoin(MessageAnalysis, MessageAnalysis.message_id == Message.id)
+             .filter(Message.chat_id == chat_id))
+        boundary = None
+        if lo is not None:
+            q = q.filter(Message.date >= lo)
+            boundary = (session.query(func.max(Message.date))
+                        .filter(Message.chat_id == chat_id, Message.date < lo)
+                        .scalar())
+        if hi is not None:
+            q = q.filter(Message.date <= hi)
+        return q.order_by(Message.date.asc(), Message.id.asc()).all(), boundary
+
+    def _learn(self, session, state, chat_id, end, segment, new_ids):
+        """
+        Labels one timeline segment and trains on the messages whose labels became final.
+        new_ids: ids analyzed in this batch (None: every analyzed message counts as new)
+        """
+        rows, boundary = self._timeline(session, chat_id, *segment)
+        if not rows:
+            return
+        times = _seconds([r.date for r in rows])
+        senders = _sender_array(r.sender_id for r in rows)
+        latency, responder = response_latencies(
+            times, senders,
+            np.array([r.telegram_id or 0 for r in rows], dtype=np.int64),
+            np.array([r.reply_to_msg_id or 0 for r in rows], dtype=np.int64),
+        )
+        analyzed = np.array([r.intent is not None for r in rows])
+        ids = np.array([r.id for r in rows], dtype=np.int64)
+        is_new = analyzed if new_ids is None else np.isin(ids, new_ids)
+
+        # Labels that became final: new analyses old enough to have one, and earlier
+        # analyses the chat has now moved on past
+        fresh = []
+        for h in SECONDS:
+            known = times <= end - h
+            if state.end is None:
+                fresh.append(known & is_new)
+            else:
+                fresh.append(known & analyzed & (is_new | (times > state.end - h)))
+        take = np.flatnonzero(np.logical_or.reduce(fresh))
+        if not len(take):
+            return
+
+        previous = np.empty(len(rows))
+        previous[1:] = times[:-1]
+        previous[0] = _seconds([boundary])[0] if boundary else times[0]
+        gaps = times - previous
+
+        sub = [rows[i] for i in take]
+        # Features before the stats learn these labels, as at prediction time
+        X = state.feature_matrix(
+            senders[take], times[take], gaps[take], [r.text for r in sub], [r.intent for r in sub],
+            [r.intent_confidence for r in sub], [r.urgency_score for r in sub], [r.sentiment_score for r in sub],
+        )
+        for j, h in enumerate(SECONDS):
+            mask = fresh[j][take]
+            if not mask.any():
+                continue
+            y = latency[take][mask] <= h
+            state.train(j, X[mask], y)
+            state.add_labels(j, senders[take][mask], y)
+            if j == len(SECONDS) - 1:
+                answered = take[mask][y]
+                state.add_latencies(senders[answered], senders[responder[answered]], latency[answered])
+
+    def update(self, session, chat_id, rows, entries):
+        """
+        Learns from the labels that became final with this batch of written analyses.
+        rows: objects with id and date; entries: matching MessageAnalysis dicts. Does not commit.
+        """
+        if not entries:
+            return
+        new_ids = np.array([e["message_id"] for e in entries], dtype=np.int64)
+        new_set = set(new_ids.tolist())
+        new_dates = [r.date for r in rows if r.id in new_set]
+
+        with self._lock:
+            state = self._state(session, chat_id)
+            newest = session.query(func.max(Message.date)).filter(Message.chat_id == chat_id).scalar()
+            end = _seconds([newest])[0]
+            if state is None:
+                # First update (or intents changed): learn from everything analyzed so far
+                state = ChatReplies(self.vocab())
+                segments = [(None, None)]
+                new_ids = None
+            else:
+                new_times = _seconds(new_dates)
+                labeled_now = new_times.min() <= end - SECONDS[0]
+                if not labeled_now and state.end is not None and end - state.end < Config.REPLY_UPDATE_SECONDS:
+                    # Nothing final yet; the next update covers these
+                    return
+                segments = []
+                if labeled_now:
+                    segments.append((min(new_dates), datetime.utcfromtimestamp(min(new_times.max() + LONGEST, end))))
+                if state.end is not None and end > state.end:
+                    # Earlier analyses whose labels became final since the last update
+                    segments.append((datetime.utcfromtimestamp(state.end - LONGEST), newest))
+                segments = self._merge(segments) if segments else []
+
+            for segment in segments:
+                self._learn(session, state, chat_id, end, segment, new_ids)
+            state.end = end if state.end is None else max(state.end, end)
+            self._save(session, chat_id, state)
+
+    @staticmethod
+    def _merge(segments):
+        segments = sorted(segments)
+        merged = [list(segments[0])]
+        for lo, hi in segments[1:]:
+            if lo <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], hi)
+            else:
+                merged.append([lo, hi])
+        return [tuple(s) for s in merged]
+
+    def _save(self, session, chat_id, state):
+        stmt = sqlite_insert(ReplyModel).values(
+            chat_id=chat_id, version=1, params=state.to_params(), updated_at=datetime.utcnow(),
+        )
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=["chat_id"],
+            set_={"version": ReplyModel.version + 1, "params": stmt.excluded.params, "updated_at": stmt.excluded.updated_at},
+        ))
+        state.version = session.query(ReplyModel.version).filter(ReplyModel.chat_id == chat_id).scalar()
+        self.chats[chat_id] = state
+
+    def summary(self, session, chat_id):
+        with self._lock:
+            state = self._state(session, chat_id)
+        return state.summary() if state else None
+
+    def reset(self, session, chat_id):
+        # An empty state rather than none: a full re-analysis then learns from each
+        # rewritten message once, instead of starting over from every stored analysis
+        with self._lock:
+            self._save(session, chat_id, ChatReplies(self.vocab()))
+
+    def forget(self):
+        # Drops the cached state of every chat; it is rebuilt from the database on next use
+        with self._lock:
+            self.chats.clear()
+
+
+replies = ReplyEngine()
@@ -0,0 +1,127 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import literal_column
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import os
+import sys
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.models import ChatRollup
+
+BUCKETS = ("hour", "day", "week")
+ALL_TIME = datetime(1970, 1, 1) # bucket_start of the per-chat "all" row
+URGENCY_BINS = 5 # 0-20, 20-40, 40-60, 60-80, 80-100
+
+
+def bucket_start(date, bucket):
+    if bucket == "hour":
+        return date.replace(minute=0, second=0, microsecond=0)
+    if bucket == "day":
+        return date.replace(hour=0, minute=0, second=0, microsecond=0)
+    if bucket == "week":
+        day = date.replace(hour=0, minute=0, second=0, microsecond=0)
+        return day - timedelta(days=day.weekday())
+    return ALL_TIME
+
+
+def urgency_bin(urgency):
+    return min(URGENCY_BINS - 1, int(urgency // (100 / URGENCY_BINS)))
+
+
+# Histogram merges for the upsert, in SQL so they are as atomic as the sums
+MERGE_URGENCY_HIST = "json_array(" + ", ".join(
+    f"json_extract(chat_rollups.urgency_hist, '$[{i}]') + json_extract(excluded.urgency_hist, '$[{i}]')"
+    for i in range(URGENCY_BINS)
+) + ")"
+MERGE_INTENT_HIST = """(SELECT json_group_object(key, total) FROM (
+    SELECT key, sum(value) AS total FROM (
+        SELECT key, value FROM json_each(chat_rollups.intent_hist)
+        UNION ALL SELECT key, value FROM json_each(excluded.intent_hist)
+    ) GROUP BY key
+))"""
+
+
+def _empty():
+    return {
+        "message_count": 0,
+        "sentiment_sum": 0.0,
+        "sentiment_sq_sum": 0.0,
+        "urgency_sum": 0.0,
+        "urgency_hist": [0] * URGENCY_BINS,
+        "intent_hist": {},
+    }
+
+
+def apply_rollups(session, chat_id, dates, entries):
+    """
+    Folds newly written analyses into the chat's all-time and hour/day/week rollups.
+    dates: message dates, one per entry
+    entries: MessageAnalysis column dicts as written by the pipeline
+    Does not commit.
+    """
+    deltas = defaultdict(_empty)
+    for date, entry in zip(dates, entries):
+        sentiment = entry["sentiment_score"] or 0.0
+        urgency = entry["urgency_score"] or 0.0
+        keys = [("all", ALL_TIME)] + [(b, bucket_start(date, b)) for b in BUCKETS]
+        for key in keys:
+            d = deltas[key]
+            d["message_count"] += 1
+            d["sentiment_sum"] += sentiment
+            d["sentiment_sq_sum"] += sentiment * sentiment
+            d["urgency_sum"] += urgency
+            d["urgency_hist"][urgency_bin(urgency)] += 1
+            d["intent_hist"][entry["intent"]] = d["intent_hist"].get(entry["intent"], 0) + 1
+
+    if not deltas:
+        return
+
+    # One upsert for every bucket: the increments happen inside SQLite, so concurrent
+    # writers (live stream, analysis jobs, another process) never lose each other's counts
+    stmt = sqlite_insert(ChatRollup)
+    session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["chat_id", "bucket", "bucket_start"],
+            set_={
+                "message_count": ChatRollup.message_count + stmt.excluded.message_count,
+                "sentiment_sum": ChatRollup.sentiment_sum + stmt.excluded.sentiment_sum,
+                "sentiment_sq_sum": ChatRollup.sentiment_sq_sum + stmt.excluded.sentiment_sq_sum,
+                "urgency_sum": ChatRollup.urgency_sum + stmt.excluded.urgency_sum,
+                "urgency_hist": literal_column(MERGE_URGENCY_HIST),
+                "intent_hist": literal_column(MERGE_INTENT_HIST),
+            },
+        ),
+        [{"chat_id": chat_id, "bucket": bucket, "bucket_start": start, **d} for (bucket, start), d in deltas.items()],
+    )
+
+
+def reset_rollups(session, chat_id):
+    session.query(ChatRollup).filter(ChatRollup.chat_id == chat_id).delete()
+
+
+def summarize(row):
+    n = row.message_count or 0
+    mean = row.sentiment_sum / n if n else 0.0
+    return {
+        "bucket_start": row.bucket_start.isoformat(),
+        "messages": n,
+        "sentiment_mean": mean,
+        # Population variance from the running sums, clamped against rounding
+        "sentiment_variance": max(0.0, row.sentiment_sq_sum / n - mean * mean) if n else 0.0,
+        "urgency_mean": row.urgency_sum / n if n else 0.0,
+        "urgency_hist": row.urgency_hist,
+        "intent_hist": row.intent_hist,
+    }
+
+
+def chat_overall(session, chat_id):
+    row = (session.query(ChatRollup)
+           .filter(ChatRollup.chat_id == chat_id, ChatRollup.bucket == "all")
+           .first())
+    if not row:
+        return None
+    overall = summarize(row)
+    del overall["bucket_start"]
+    return overall
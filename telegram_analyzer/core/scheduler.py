@@ -0,0 +1,181 @@
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy import func
+import asyncio
+import math
+import os
+import sys
+import time
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from core.database import db
+from core.models import Chat, Message, SyncCheckpoint
+
+
+class TokenBucket:
+    """
+    Shared request budget for all sync workers.
+    Refills at `rate` tokens per second up to `capacity`. A FloodWait pauses every
+    worker and halves the rate; the rate then creeps back up while requests succeed.
+    """
+
+    def __init__(self, rate=None, capacity=None):
+        self.max_rate = rate or Config.SYNC_RATE_PER_SEC
+        self.rate = self.max_rate
+        self.capacity = capacity or Config.SYNC_BURST
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.flood_waits = 0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, tokens=1):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    # Additive increase back towards the configured rate
+                    self.rate = min(self.max_rate, self.rate + self.max_rate * 0.01)
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+    def on_flood_wait(self, seconds):
+        # Multiplicative decrease, and nobody talks to Telegram until the wait is over
+        self.flood_waits += 1
+        self.rate = max(self.max_rate * 0.05, self.rate / 2)
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    def stats(self):
+        return {
+            "rate": self.rate,
+            "max_rate": self.max_rate,
+            "capacity": self.capacity,
+            "flood_waits": self.flood_waits,
+            "paused_for": max(0.0, self.paused_until - time.monotonic()),
+        }
+
+
+class SyncScheduler:
+    """
+    Keeps the history of every known chat warm by syncing many chats concurrently.
+    Chats are ordered by staleness weighted by recent activity.
+    """
+
+    def __init__(self, manager, concurrency=None):
+        self.manager = manager
+        self.concurrency = concurrency or Config.SYNC_CONCURRENCY
+        self.bucket = TokenBucket()
+        self.queue = asyncio.PriorityQueue()
+        self.pending = set() # Queued or running chat ids
+        self.running = set()
+        self.workers = []
+        self.completed = 0
+        self.failed = 0
+        self.stored = 0
+        self._recent = deque() # (timestamp, messages stored) for throughput
+
+    def _priorities(self):
+        """
+        Returns [(priority, chat_id)], most urgent first.
+        Never synced chats come first, then staleness * log-scaled message volume of the last week.
+        """
+        now = datetime.utcnow()
+        week_ago = now - timedelta(days=7)
+        with db.read_session() as session:
+            chats = (session.query(Chat.id, Chat.last_updated, SyncCheckpoint.chat_id)
+                     .outerjoin(SyncCheckpoint, SyncCheckpoint.chat_id == Chat.id)
+                     .all())
+            activity = dict(session.query(Message.chat_id, func.count(Message.id))
+                            .filter(Message.date >= week_ago)
+                            .group_by(Message.chat_id)
+                            .all())
+
+        ranked = []
+        for chat_id, last_updated, synced in chats:
+            if not synced or not last_updated:
+                score = math.inf
+            else:
+                stale_hours = max((now - last_updated).total_seconds(), 0) / 3600
+                score = stale_hours * (1 + math.log1p(activity.get(chat_id, 0)))
+            ranked.append((-score, chat_id))
+        ranked.sort()
+        return ranked
+
+    def enqueue_all(self):
+        added = 0
+        for priority, chat_id in self._priorities():
+            if chat_id in self.pending:
+                continue
+            self.pending.add(chat_id)
+            self.queue.put_nowait((priority, chat_id))
+            added += 1
+        return added
+
+    def start(self):
+        if self.workers:
+            return
+        self.manager.rate_limiter = self.bucket
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self.workers.append(asyncio.create_task(self._refill_loop()))
+
+    async def stop(self):
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def _refill_loop(self):
+        while True:
+            try:
+                if await self.manager.is_user_authorized():
+                    self.enqueue_all()
+            except Exception as e:
+                print(f"Scheduler refill failed: {e}")
+            await asyncio.sleep(Config.SYNC_INTERVAL)
+
+    async def _worker(self):
+        while True:
+            _, chat_id = await self.queue.get()
+            self.running.add(chat_id)
+            try:
+                stored = await self.manager.sync_history(chat_id)
+                self.completed += 1
+                self.stored += stored
+                self._recent.append((time.monotonic(), stored))
+            except Exception as e:
+                self.failed += 1
+                print(f"Scheduled sync of {chat_id} failed: {e}")
+            finally:
+                self.running.discard(chat_id)
+                self.pending.discard(chat_id)
+                self.queue.task_done()
+
+    def stats(self):
+        # Throughput over the last minute
+        cutoff = time.monotonic() - 60
+        while self._recent and self._recent[0][0] < cutoff:
+            self._recent.popleft()
+        return {
+            "queue_depth": self.queue.qsize(),
+            "running": sorted(self.running),
+            "concurrency": self.concurrency,
+            "completed": self.completed,
+            "failed": self.failed,
+            "messages_stored": self.stored,
+            "messages_per_sec": sum(n for _, n in self._recent) / 60,
+            "rate_limit": self.bucket.stats(),
+        }
@@ -0,0 +1,197 @@
+from sqlalchemy import text, inspect, bindparam, column, DateTime, Float, Integer, String, Text
+from contextlib import contextmanager
+import base64
+import html
+import os
+import re
+import sys
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# External-content FTS5 index over messages.text. chat_id is indexed as well so a
+# per-chat search only walks that chat's postings instead of every match.
+FTS_TABLE = "messages_fts"
+INSERT_TRIGGER = "messages_fts_ai"
+SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        text, chat_id,
+        content='messages', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    # Triggers keep the index in step with every insert path (sync, live stream, imports)
+    f"""CREATE TRIGGER IF NOT EXISTS {INSERT_TRIGGER} AFTER INSERT ON messages BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, text, chat_id) VALUES (new.id, new.text, new.chat_id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text, chat_id) VALUES ('delete', old.id, old.text, old.chat_id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF text, chat_id ON messages BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text, chat_id) VALUES ('delete', old.id, old.text, old.chat_id);
+        INSERT INTO {FTS_TABLE}(rowid, text, chat_id) VALUES (new.id, new.text, new.chat_id);
+    END""",
+]
+
+# Snippet markers that can't occur in message text; swapped for <mark> after escaping
+MARK_OPEN, MARK_CLOSE = "\x02", "\x03"
+TERM = re.compile(r"\w+\*?", re.UNICODE)
+
+
+def ensure_search_index(engine):
+    """
+    Creates the FTS table and triggers if missing and indexes existing messages once.
+    """
+    new = FTS_TABLE not in inspect(engine).get_table_names()
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+        if new:
+            count = conn.execute(text("SELECT count(*) FROM messages")).scalar()
+            if count:
+                print(f"Building search index over {count} messages...")
+                conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+@contextmanager
+def deferred_indexing(session):
+    """
+    For large bulk inserts (core/importer.py): drops the per-row insert trigger for
+    the rest of the transaction and indexes the new messages with one INSERT ... SELECT
+    at the end, which is several times faster than the trigger. Must run inside a
+    single transaction (a writer job), so a rollback brings the trigger back.
+    Yields the highest Message.id before the insert; new rows are the ones above it.
+    """
+    after_id = session.execute(text("SELECT coalesce(max(id), 0) FROM messages")).scalar()
+    session.execute(text(f"DROP TRIGGER IF EXISTS {INSERT_TRIGGER}"))
+    yield after_id
+    session.execute(
+        text(f"INSERT INTO {FTS_TABLE}(rowid, text, chat_id) SELECT id, text, chat_id FROM messages WHERE id > :after"),
+        {"after": after_id},
+    )
+    session.execute(text(SCHEMA[1]))
+
+
+def build_match(query, chat_id=None):
+    """
+    Turns free text into a safe FTS5 expression: every word must match (prefix if it
+    ends with *), FTS operators typed by the user are treated as plain words.
+    Returns None if the query has no searchable words.
+    """
+    terms = []
+    for term in TERM.findall(query):
+        prefix = term.endswith("*")
+        word = term.rstrip("*")
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    if not terms:
+        return None
+    match = "text : (" + " AND ".join(terms) + ")"
+    if chat_id is not None:
+        # unicode61 drops the sign, so the SQL filter on chat_id stays authoritative
+        match = f'chat_id : "{abs(chat_id)}" AND ' + match
+    return match
+
+
+def encode_cursor(rank, message_id):
+    return base64.urlsafe_b64encode(f"{rank!r}|{message_id}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    rank, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    return float(rank), int(message_id)
+
+
+def _highlight(snippet):
+    escaped = html.escape(snippet or "")
+    return escaped.replace(MARK_OPEN, "<mark>").replace(MARK_CLOSE, "</mark>")
+
+
+def search_messages(session, query, chat_id=None, since=None, until=None, tone=None, intent=None,
+                    limit=20, cursor=None):
+    """
+    Ranked full-text search, best match first (bm25), ties broken by message id.
+    Filters on chat/date and, through MessageAnalysis, on tone/intent.
+    cursor: value from a previous page's next_cursor (raises ValueError if malformed)
+    Returns (items, next_cursor or None).
+    """
+    match = build_match(query, chat_id)
+    if not match:
+        return [], None
+
+    filters = []
+    params = {"match": match, "limit": limit + 1}
+    if chat_id is not None:
+        filters.append("m.chat_id = :chat_id")
+        params["chat_id"] = chat_id
+    if since:
+        filters.append("m.date >= :since")
+        params["since"] = since
+    if until:
+        filters.append("m.date <= :until")
+        params["until"] = until
+    if tone:
+        filters.append("a.emotional_tone = :tone")
+        params["tone"] = tone
+    if intent:
+        filters.append("a.intent = :intent")
+        params["intent"] = intent
+    if cursor:
+        params["after_rank"], params["after_id"] = decode_cursor(cursor)
+        filters.append("(hits.rank > :after_rank OR (hits.rank = :after_rank AND hits.id > :after_id))")
+
+    # Filtering on analysis fields only makes sense for analyzed messages
+    join = "JOIN" if tone or intent else "LEFT JOIN"
+    where = ("WHERE " + " AND ".join(filters)) if filters else ""
+
+    # Pass 1: rank and filter, no snippets
+    stmt = text(f"""
+        WITH hits AS (
+            SELECT rowid AS id, bm25({FTS_TABLE}) AS rank
+            FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match
+        )
+        SELECT hits.id, hits.rank, m.chat_id, m.text, m.date, m.sender_id,
+               a.intent, a.urgency_score, a.sentiment_score, a.emotional_tone
+        FROM hits
+        JOIN messages m ON m.id = hits.id
+        {join} message_analysis a ON a.message_id = m.id
+        {where}
+        ORDER BY hits.rank, hits.id
+        LIMIT :limit
+    """)
+    # Typed so dates are bound and returned the way the ORM stores them
+    stmt = stmt.bindparams(*[bindparam(p, type_=DateTime) for p in ("since", "until") if p in params])
+    stmt = stmt.columns(
+        column("id", Integer), column("rank", Float), column("chat_id", Integer), column("text", Text),
+        column("date", DateTime), column("sender_id", Integer), column("intent", String),
+        column("urgency_score", Float), column("sentiment_score", Float), column("emotional_tone", String),
+    )
+    rows = session.execute(stmt, params).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        return [], None
+
+    # Pass 2: snippets for the page only
+    ids = [r.id for r in rows]
+    placeholders = ", ".join(f":id{k}" for k in range(len(ids)))
+    snippets = dict(session.execute(text(f"""
+        SELECT rowid, snippet({FTS_TABLE}, 0, '{MARK_OPEN}', '{MARK_CLOSE}', '…', 16)
+        FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match AND rowid IN ({placeholders})
+    """), {"match": match, **{f"id{k}": i for k, i in enumerate(ids)}}).all())
+
+    items = [{
+        "id": r.id,
+        "chat_id": r.chat_id,
+        "text": r.text,
+        "snippet": _highlight(snippets.get(r.id)),
+        "date": r.date,
+        "sender_id": r.sender_id,
+        "intent": r.intent or "unknown",
+        "urgency": r.urgency_score or 0,
+        "sentiment": r.sentiment_score or 0,
+        "tone": r.emotional_tone or "Neutral",
+        "rank": r.rank,
+    } for r in rows]
+    next_cursor = encode_cursor(rows[-1].rank, rows[-1].id) if has_more else None
+    return items, next_cursor
@@ -0,0 +1,105 @@
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import os
+import sys
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.models import User, Chat, Message
+from core.metrics import stage
+
+# Stay well below SQLite's bound parameter limit in IN (...) lookups
+LOOKUP_CHUNK = 500
+
+
+def _chunks(items, size=LOOKUP_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def existing_telegram_ids(session, chat_id, telegram_ids):
+    found = set()
+    for chunk in _chunks(list(telegram_ids)):
+        rows = (session.query(Message.telegram_id)
+                .filter(Message.chat_id == chat_id, Message.telegram_id.in_(chunk))
+                .all())
+        found.update(r[0] for r in rows)
+    return found
+
+
+def existing_user_ids(session, user_ids):
+    found = set()
+    for chunk in _chunks(list(user_ids)):
+        found.update(r[0] for r in session.query(User.id).filter(User.id.in_(chunk)).all())
+    return found
+
+
+def bulk_insert_messages(session, chat_id, rows):
+    """
+    Inserts a chunk of messages for one chat with set-based lookups instead of per-row queries.
+    rows: list of dicts with telegram_id, sender_id, text, date, reply_to_msg_id
+    Unknown senders are created as bare User rows. Does not commit.
+    Returns the list of rows that were new.
+    """
+    if not rows:
+        return []
+
+    # Prefetch what we already have, then drop duplicates within the chunk itself
+    with stage("db_exists", items=len(rows)):
+        known = existing_telegram_ids(session, chat_id, {r["telegram_id"] for r in rows})
+    new_rows = []
+    for r in rows:
+        if r["telegram_id"] in known:
+            continue
+        known.add(r["telegram_id"])
+        new_rows.append(r)
+    if not new_rows:
+        return []
+
+    sender_ids = {r["sender_id"] for r in new_rows if r["sender_id"]}
+    with stage("db_exists", items=len(sender_ids)):
+        missing_users = sender_ids - existing_user_ids(session, sender_ids)
+
+    with stage("db_insert", items=len(new_rows)):
+        if missing_users:
+            session.execute(
+                sqlite_insert(User).on_conflict_do_nothing(index_elements=["id"]),
+                [{"id": uid} for uid in missing_users],
+            )
+
+        session.execute(
+            sqlite_insert(Message).on_conflict_do_nothing(index_elements=["chat_id", "telegram_id"]),
+            [{
+                "telegram_id": r["telegram_id"],
+                "chat_id": chat_id,
+                "sender_id": r["sender_id"],
+                "text": r["text"],
+                "date": r["date"],
+                "reply_to_msg_id": r["reply_to_msg_id"],
+            } for r in new_rows],
+        )
+    return new_rows
+
+
+def ensure_chats(session, chat_ids):
+    """
+    Creates placeholder Chat rows for ids we have not seen yet (e.g. from live updates).
+    """
+    chat_ids = [c for c in set(chat_ids) if c is not None]
+    if chat_ids:
+        session.execute(
+            sqlite_insert(Chat).on_conflict_do_nothing(index_elements=["id"]),
+            [{"id": c, "type": "unknown"} for c in chat_ids],
+        )
+
+
+def message_rows(session, chat_id, telegram_ids):
+    """
+    (id, text, date, sender_id) rows for the given Telegram message ids of one chat.
+    """
+    rows = []
+    for chunk in _chunks(list(telegram_ids)):
+        rows.extend(session.query(Message.id, Message.text, Message.date, Message.sender_id)
+                    .filter(Message.chat_id == chat_id, Message.telegram_id.in_(chunk))
+                    .all())
+    return rows
@@ -0,0 +1,191 @@
+from collections import deque, defaultdict
+import asyncio
+import os
+import sys
+import time
+import traceback
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from core.database import db
+from core.storage import bulk_insert_messages, ensure_chats, message_rows
+from core.pipeline import score_messages, record_analyses
+from core.rollups import chat_overall
+from core.replies import reply_prob
+from core.analyzer import analyzer
+from core.inference import inference
+from core.events import events
+
+
+def result_item(row, entry):
+    # Same shape as the items of /api/chats/{id}/results
+    return {
+        "id": row.id,
+        "text": row.text,
+        "date": row.date,
+        "sender_id": row.sender_id,
+        "intent": entry["intent"],
+        "urgency": entry["urgency_score"],
+        "sentiment": entry["sentiment_score"],
+        "tone": entry["emotional_tone"],
+        "engagement": entry["engagement_score"],
+        "reply_prob": reply_prob(entry),
+    }
+
+
+def _persist_messages(session, by_chat):
+    ensure_chats(session, by_chat.keys())
+    for chat_id, rows in by_chat.items():
+        bulk_insert_messages(session, chat_id, rows)
+
+
+def _store_analyses(session, scored):
+    changes = {}
+    for chat_id, rows, entries in scored:
+        written = {e["message_id"]: e for e in record_analyses(session, chat_id, rows, entries)}
+        if written:
+            changes[chat_id] = {
+                "items": [result_item(r, written[r.id]) for r in rows if r.id in written],
+            }
+    session.flush()
+    for chat_id, change in changes.items():
+        change["overall"] = chat_overall(session, chat_id)
+    return changes
+
+
+def process_batch(items):
+    """
+    Persists and analyzes one micro-batch. Runs on the inference executor.
+    items: list of (chat_id, row) pairs
+    Returns {chat_id: {"items": [...], "overall": {...}}} with what changed, for push events.
+    """
+    by_chat = defaultdict(list)
+    for chat_id, row in items:
+        by_chat[chat_id].append(row)
+
+    # 1. Persist
+    db.run_write(_persist_messages, by_chat)
+
+    with db.read_session() as session:
+        # 2. Score every chat's messages with a single encoder call
+        stored = {
+            chat_id: message_rows(session, chat_id, [r["telegram_id"] for r in rows])
+            for chat_id, rows in by_chat.items()
+        }
+        texts = [r.text for rows in stored.values() for r in rows]
+        intents, embeddings = analyzer.predict_intents_batch(texts, return_embeddings=True)
+
+        offset = 0
+        scored = []
+        for chat_id, rows in stored.items():
+            if not rows:
+                continue
+            window = slice(offset, offset + len(rows))
+            scored.append((chat_id, rows, score_messages(session, chat_id, rows, intents[window], embeddings[window])))
+            offset += len(rows)
+
+    # 3. Store
+    return db.run_write(_store_analyses, scored)
+
+
+class StreamingAnalyzer:
+    """
+    Live analysis of incoming messages.
+    Messages are queued by the NewMessage handler and consumed by a single worker that
+    micro-batches them: a batch closes when it reaches STREAM_BATCH_SIZE messages or
+    STREAM_MAX_DELAY_MS after its first message, whichever comes first. Each batch is
+    handed to process_batch on the inference executor.
+    """
+
+    def __init__(self, batch_size=None, max_delay_ms=None):
+        self.batch_size = batch_size or Config.STREAM_BATCH_SIZE
+        self.max_delay = (max_delay_ms or Config.STREAM_MAX_DELAY_MS) / 1000
+        self.queue = asyncio.Queue(maxsize=Config.STREAM_QUEUE_SIZE)
+        self.worker = None
+        self._getter = None
+
+        self.processed = 0
+        self.batches = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=2000) # Seconds from receipt to stored analysis
+
+    def start(self):
+        if self.worker is None:
+            self.worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.worker:
+            self.worker.cancel()
+            await asyncio.gather(self.worker, return_exceptions=True)
+            self.worker = None
+
+    async def submit(self, chat_id, row):
+        """
+        row: dict with telegram_id, sender_id, text, date, reply_to_msg_id
+        """
+        await self.queue.put((time.monotonic(), chat_id, row))
+
+    async def _get(self, timeout=None):
+        # Keep an unfinished get() around instead of cancelling it, so no item is ever dropped
+        if self._getter is None:
+            self._getter = asyncio.ensure_future(self.queue.get())
+        done, _ = await asyncio.wait({self._getter}, timeout=timeout)
+        if not done:
+            return None
+        item = self._getter.result()
+        self._getter = None
+        return item
+
+    async def _next_batch(self):
+        batch = [await self._get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            item = await self._get(timeout=remaining)
+            if item is None:
+                break
+            batch.append(item)
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                changes = await inference.run(process_batch, [(chat_id, row) for _, chat_id, row in batch])
+                for chat_id, change in changes.items():
+                    events.publish(chat_id, "analyses", change["items"])
+                    if change["overall"]:
+                        events.publish(chat_id, "rollups", {"overall": change["overall"]})
+                done = time.monotonic()
+                self.latencies.extend(done - received for received, _, _ in batch)
+                self.processed += len(batch)
+                self.batches += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"ERROR in streaming analysis: {e}")
+                traceback.print_exc()
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+
+        def pct_ms(p):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+        return {
+            "queue_depth": self.queue.qsize(),
+            "processed": self.processed,
+            "batches": self.batches,
+            "errors": self.errors,
+            "avg_batch_size": self.processed / self.batches if self.batches else 0,
+            "latency_p50_ms": pct_ms(0.5),
+            "latency_p99_ms": pct_ms(0.99),
+        }
@@ -1,14 +1,86 @@
-from telethon import TelegramClient, events, types
+from collections import defaultdict
+from datetime import datetime
 import sys
 import os
+import time
 import asyncio
 
+from sqlalchemy import func, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import Config
 from core.database import db, DatabaseManager
-from core.models import User, Chat, Message
+from core.models import User, Chat, Message, SyncCheckpoint
+from core.storage import bulk_insert_messages
+from core.events import events as event_hub
+from core.metrics import stage, observe
+
+def _open_sync(session, chat_id, fields):
+    """
+    Writer job: creates the chat and its SyncCheckpoint if missing. Returns the
+    checkpoint detached from the session; the sync advances it in memory and every
+    later writer job stores it with the messages it covers.
+    """
+    if not session.get(Chat, chat_id):
+        session.add(Chat(id=chat_id, **fields))
+    checkpoint = session.get(SyncCheckpoint, chat_id)
+    if not checkpoint:
+        checkpoint = SyncCheckpoint(chat_id=chat_id, history_complete=False, messages_fetched=0)
+        session.add(checkpoint)
+        session.flush()
+    session.expunge(checkpoint)
+    return checkpoint
+
+
+def _save_checkpoint(session, checkpoint):
+    """
+    Stores a sync's copy of the checkpoint without moving the stored one backwards:
+    the synced range only widens and history_complete only goes from False to True,
+    whatever other writers (a concurrent import) stored meanwhile.
+    """
+    stmt = sqlite_insert(SyncCheckpoint).values(
+        chat_id=checkpoint.chat_id,
+        newest_id=checkpoint.newest_id,
+        oldest_id=checkpoint.oldest_id,
+        history_complete=bool(checkpoint.history_complete),
+        messages_fetched=checkpoint.messages_fetched or 0,
+        updated_at=datetime.utcnow(),
+    )
+    new = stmt.excluded
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=["chat_id"],
+        set_={
+            # Scalar max()/min() are NULL if either side is
+            "newest_id": func.max(func.coalesce(SyncCheckpoint.newest_id, new.newest_id),
+                                  func.coalesce(new.newest_id, SyncCheckpoint.newest_id)),
+            "oldest_id": func.min(func.coalesce(SyncCheckpoint.oldest_id, new.oldest_id),
+                                  func.coalesce(new.oldest_id, SyncCheckpoint.oldest_id)),
+            "history_complete": or_(SyncCheckpoint.history_complete, new.history_complete),
+            "messages_fetched": func.max(func.coalesce(SyncCheckpoint.messages_fetched, 0), new.messages_fetched),
+            "updated_at": new.updated_at,
+        },
+    ))
+
+
+def _store_sync_chunk(session, checkpoint, chunk):
+    """
+    Writer job: inserts a chunk of fetched messages and saves the checkpoint in the
+    same transaction. Returns the rows that were new.
+    """
+    new_rows = bulk_insert_messages(session, checkpoint.chat_id, chunk)
+    _save_checkpoint(session, checkpoint)
+    return new_rows
+
+
+def _finish_sync(session, checkpoint):
+    _save_checkpoint(session, checkpoint)
+    chat = session.get(Chat, checkpoint.chat_id)
+    if chat:
+        chat.last_updated = datetime.utcnow()
+
 
 class TelegramManager:
     def __init__(self):
@@ -16,33 +88,59 @@ class TelegramManager:
         self.api_hash = Config.API_HASH
         self.session_name = Config.SESSION_NAME
         
-        if self.api_id and self.api_hash:
-            try:
-                self.client = TelegramClient(self.session_name, self.api_id, self.api_hash)
-            except Exception as e:
-                print(f"Failed to initialize TelegramClient: {e}")
-                self.client = None
-        else:
+        # Created by the first connect(), so telethon isn't imported on the start-up path
+        self.client = None
+        self._connecting = None
+        if not (self.api_id and self.api_hash):
             print("API_ID or API_HASH missing. TelegramClient not initialized.")
-            self.client = None
         
         self.db_manager = db
+        # Live progress of running syncs, keyed by chat id
+        self.sync_progress = {}
+        # Syncs of one chat never overlap (scheduler, /backfill, analysis jobs)
+        self.sync_locks = defaultdict(asyncio.Lock)
+        # Optional shared request budget (see core/scheduler.py)
+        self.rate_limiter = None
+        self.listening = False
+
+    def _create_client(self):
+        from telethon import TelegramClient
+        try:
+            self.client = TelegramClient(self.session_name, self.api_id, self.api_hash)
+        except Exception as e:
+            print(f"Failed to initialize TelegramClient: {e}")
 
     async def connect(self):
-        if self.client:
-            await self.client.connect()
+        """
+        Creates and connects the client. Every method that talks to Telegram calls it
+        first; concurrent callers share one connection attempt.
+        """
+        if self.client is None and self.api_id and self.api_hash:
+            self._create_client()
+        if not self.client:
+            return
+        if self._connecting is None:
+            self._connecting = asyncio.ensure_future(self.client.connect())
+        try:
+            await asyncio.shield(self._connecting)
+        except Exception:
+            self._connecting = None # Try again on the next call
+            raise
     
     async def is_user_authorized(self):
+        await self.connect()
         if self.client:
             return await self.client.is_user_authorized()
         return False
     
     async def send_code_request(self, phone):
+        await self.connect()
         if not self.client:
             raise Exception("Telegram Client not initialized. Check API_ID and API_HASH.")
         await self.client.send_code_request(phone)
         
     async def sign_in(self, phone, code, password=None):
+        await self.connect()
         if not self.client:
             raise Exception("Telegram Client not initialized.")
         try:
@@ -53,86 +151,221 @@ class TelegramManager:
             else:
                 raise e
 
+    async def _write(self, fn, *args):
+        # Database work of a sync runs on the writer (or a worker thread in DB_MODE=default),
+        # never on the event loop
+        return await asyncio.to_thread(self.db_manager.run_write, fn, *args)
+
+    async def _throttle(self):
+        if self.rate_limiter:
+            await self.rate_limiter.acquire()
+
     async def get_dialogs(self, limit=20):
+        await self.connect()
         if not self.client:
             return []
         # Fetch dialogs and populate local DB if needed
         dialogs = await self.client.get_dialogs(limit=limit)
         return dialogs
 
-    async def sync_history(self, chat_id, limit=100):
+    async def sync_history(self, chat_id, limit=100, backfill=False):
         """
         Syncs message history for a specific chat.
+        The first sync fetches the newest `limit` messages. Later syncs resume from the
+        per-chat SyncCheckpoint and fetch everything newer than the newest synced id.
+        backfill=True additionally walks backwards from the oldest synced id until the
+        start of the chat is reached.
+        Returns the number of new messages stored.
+        A sync of a chat that is already syncing waits for it, then continues from
+        the checkpoint it left.
         """
+        await self.connect()
         if not self.client:
-            return
+            return 0
+        async with self.sync_locks[chat_id]:
+            return await self._sync_history(chat_id, limit, backfill)
+
+    async def _sync_history(self, chat_id, limit, backfill):
+        from telethon import types
             
         # Resolve chat entity
+        await self._throttle()
         entity = await self.client.get_entity(chat_id)
         
-        with self.db_manager.get_session() as session:
-            # Ensure chat exists in DB
-            chat = session.query(Chat).filter(Chat.id == chat_id).first()
-            if not chat:
-                chat_type = 'user'
-                if isinstance(entity, types.Channel):
-                    chat_type = 'channel'
-                elif isinstance(entity, types.Chat):
-                    chat_type = 'group'
-                
-                chat = Chat(
-                    id=chat_id,
-                    title=getattr(entity, 'title', None) or getattr(entity, 'first_name', 'Unknown'),
-                    username=getattr(entity, 'username', None),
-                    type=chat_type
-                )
-                session.add(chat)
-                session.commit()
-
-            # Create or get users
-            # Optimization: Cache users to avoid N+1 queries during bulk sync
-            
-            async for msg in self.client.iter_messages(entity, limit=limit):
-                if not msg.message:
-                    continue
-                
-                # Check if message already exists
-                exists = session.query(Message).filter(Message.telegram_id == msg.id, Message.chat_id == chat_id).first()
-                if exists:
-                    continue
-                
-                # Handle Sender
-                sender_id = msg.sender_id
-                if sender_id:
-                    user = session.query(User).filter(User.id == sender_id).first()
-                    if not user:
-                        # Try to get sender info if possible, might need to fetch entity
-                        # For now, just create ID
-                        user = User(id=sender_id)
-                        session.add(user)
-                        session.commit() # Commit needed to reference it
-                
-                # Create Message
-                db_msg = Message(
-                    telegram_id=msg.id,
-                    chat_id=chat_id,
-                    sender_id=sender_id,
-                    text=msg.message,
-                    date=msg.date,
-                    reply_to_msg_id=msg.reply_to_msg_id
-                )
-                session.add(db_msg)
-            
-            session.commit()
-
-    async def start_listening(self):
-        @self.client.on(events.NewMessage)
-        async def handler(event):
-            # Real-time processing would go here
-            # For now, we can just print or log
-            print(f"New message in {event.chat_id}: {event.message.message}")
-            # Trigger analysis pipeline here
+        chat_type = 'user'
+        if isinstance(entity, types.Channel):
+            chat_type = 'channel'
+        elif isinstance(entity, types.Chat):
+            chat_type = 'group'
+        checkpoint = await self._write(_open_sync, chat_id, {
+            "title": getattr(entity, 'title', None) or getattr(entity, 'first_name', 'Unknown'),
+            "username": getattr(entity, 'username', None),
+            "type": chat_type,
+        })
+
+        progress = self._start_progress(chat_id, checkpoint)
+        try:
+            if checkpoint.newest_id is None:
+                # Nothing synced yet: start with the newest messages
+                progress["phase"] = "initial"
+                await self._sync_range(entity, checkpoint, progress, forward=False, limit=limit)
+            else:
+                progress["phase"] = "forward"
+                await self._sync_range(entity, checkpoint, progress, forward=True)
+
+            if backfill:
+                progress["phase"] = "backfill"
+                while not checkpoint.history_complete:
+                    await self._sync_range(entity, checkpoint, progress, forward=False)
+            await self._write(_finish_sync, checkpoint)
+        finally:
+            progress["phase"] = "done"
+            progress["history_complete"] = bool(checkpoint.history_complete)
+            progress["eta_seconds"] = 0 if checkpoint.history_complete else None
+            event_hub.publish(chat_id, "progress", dict(progress, job="sync"))
+        
+        return progress["stored"]
+
+    async def _sync_range(self, entity, checkpoint, progress, forward, limit=None):
+        """
+        Fetches one direction of history starting from the checkpoint.
+        FloodWait errors pause the sync; since the checkpoint moves together with every
+        stored chunk, the retry continues exactly where the fetch stopped.
+        """
+        from telethon import errors
+
+        while True:
+            try:
+                return await self._fetch_range(entity, checkpoint, progress, forward, limit)
+            except errors.FloodWaitError as e:
+                print(f"FloodWait while syncing {checkpoint.chat_id}, sleeping {e.seconds}s")
+                progress["flood_wait_until"] = time.time() + e.seconds
+                if self.rate_limiter:
+                    self.rate_limiter.on_flood_wait(e.seconds)
+                await asyncio.sleep(e.seconds)
+                progress["flood_wait_until"] = None
+                if limit is not None:
+                    limit = max(0, limit - progress["range_seen"])
+                    if limit == 0:
+                        return
+
+    async def _fetch_range(self, entity, checkpoint, progress, forward, limit):
+        if forward:
+            # Oldest first, starting right after the newest message we have
+            kwargs = {"min_id": checkpoint.newest_id, "reverse": True}
+        else:
+            # Newest first, starting right before the oldest message we have
+            kwargs = {"offset_id": checkpoint.oldest_id or 0}
+
+        chunk = []
+        seen = 0
+        progress["range_seen"] = 0
+        await self._throttle()
+        # Time spent waiting on Telegram, i.e. excluding throttling and storing
+        fetch_seconds = 0.0
+        waiting_since = time.perf_counter()
+        try:
+            async for msg in self.client.iter_messages(entity, limit=limit, **kwargs):
+                fetch_seconds += time.perf_counter() - waiting_since
+                # iter_messages requests pages of 100 messages
+                if seen and seen % 100 == 0:
+                    await self._throttle()
+                seen += 1
+                progress["range_seen"] = seen
+                progress["fetched"] += 1
+                self._advance_checkpoint(checkpoint, msg.id)
+                if msg.message:
+                    chunk.append(self._message_row(msg))
+                if len(chunk) >= Config.SYNC_CHUNK_SIZE:
+                    await self._store_chunk(checkpoint, chunk, progress)
+                    chunk = []
+                waiting_since = time.perf_counter()
+        finally:
+            observe("telegram_fetch", fetch_seconds, seen)
+            # Also runs when the fetch is interrupted, so fetched messages and checkpoint stay in step
+            await self._store_chunk(checkpoint, chunk, progress)
+
+        if not forward and (limit is None or seen < limit):
+            checkpoint.history_complete = True
+            await self._write(_finish_sync, checkpoint)
+
+    @staticmethod
+    def _advance_checkpoint(checkpoint, telegram_id):
+        if checkpoint.newest_id is None or telegram_id > checkpoint.newest_id:
+            checkpoint.newest_id = telegram_id
+        if checkpoint.oldest_id is None or telegram_id < checkpoint.oldest_id:
+            checkpoint.oldest_id = telegram_id
+        checkpoint.messages_fetched = (checkpoint.messages_fetched or 0) + 1
+
+    def _start_progress(self, chat_id, checkpoint):
+        progress = {
+            "chat_id": chat_id,
+            "phase": "starting",
+            "fetched": 0,
+            "stored": 0,
+            "range_seen": 0,
+            "rate": 0.0,
+            "eta_seconds": None,
+            "started_at": time.time(),
+            "flood_wait_until": None,
+            "newest_id": checkpoint.newest_id,
+            "oldest_id": checkpoint.oldest_id,
+            "history_complete": bool(checkpoint.history_complete),
+        }
+        self.sync_progress[chat_id] = progress
+        return progress
+
+    def _update_progress(self, progress, checkpoint):
+        elapsed = time.time() - progress["started_at"]
+        progress["rate"] = progress["fetched"] / elapsed if elapsed > 0 else 0.0
+        progress["newest_id"] = checkpoint.newest_id
+        progress["oldest_id"] = checkpoint.oldest_id
+        progress["history_complete"] = bool(checkpoint.history_complete)
+        if progress["phase"] == "backfill" and progress["rate"] > 0 and checkpoint.oldest_id:
+            # Message ids grow roughly one by one, so the oldest id bounds what is left
+            progress["eta_seconds"] = (checkpoint.oldest_id - 1) / progress["rate"]
+
+    @staticmethod
+    def _message_row(msg):
+        return {
+            "telegram_id": msg.id,
+            "sender_id": msg.sender_id,
+            "text": msg.message,
+            "date": msg.date,
+            "reply_to_msg_id": msg.reply_to_msg_id,
+        }
+
+    async def _store_chunk(self, checkpoint, chunk, progress):
+        # Messages and checkpoint land in the same transaction
+        with stage("sync_store", items=len(chunk)):
+            new_rows = await self._write(_store_sync_chunk, checkpoint, chunk)
+        progress["stored"] += len(new_rows)
+        self._update_progress(progress, checkpoint)
+        # Synced messages reach clients once analyzed ("analyses"); progress carries the counts
+        event_hub.publish(checkpoint.chat_id, "progress", dict(progress, job="sync"))
+
+    async def start_listening(self, on_message=None, block=True):
+        """
+        Registers the NewMessage handler. Every incoming text message is handed to
+        `on_message(chat_id, row)` (e.g. StreamingAnalyzer.submit).
+        block=False returns right away and lets the running event loop deliver updates.
+        """
+        from telethon import events
+
+        await self.connect()
+        if not self.client:
+            return
+        
+        if not self.listening:
+            @self.client.on(events.NewMessage)
+            async def handler(event):
+                if not event.message.message:
+                    return
+                if on_message:
+                    await on_message(event.chat_id, self._message_row(event.message))
+            self.listening = True
         
-        await self.client.run_until_disconnected()
+        if block:
+            await self.client.run_until_disconnected()
 
 telegram_bot = TelegramManager()
@@ -0,0 +1,322 @@
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import numpy as np
+import os
+import sys
+import threading
+import time
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from core.database import db
+from core.models import MessageEmbedding
+
+TRAIN_PER_LIST = 40 # k-means training sample size per IVF list
+TRAIN_ITERATIONS = 10
+ASSIGN_BLOCK = 50000 # Vectors assigned to lists per matrix product
+
+
+def pack(vector, dtype=None):
+    """
+    float32 vector -> (dtype, scale, bytes). int8 keeps one scale per vector.
+    """
+    dtype = dtype or Config.EMBEDDING_STORE_DTYPE
+    vector = np.asarray(vector, dtype=np.float32)
+    if dtype == "int8":
+        scale = float(np.abs(vector).max()) / 127 or 1.0
+        return dtype, scale, np.round(vector / scale).astype(np.int8).tobytes()
+    return "float32", None, vector.tobytes()
+
+
+def unpack(dtype, scale, blob):
+    if dtype == "int8":
+        return np.frombuffer(blob, dtype=np.int8).astype(np.float32) * scale
+    return np.frombuffer(blob, dtype=np.float32).copy()
+
+
+def store_embeddings(session, chat_id, entries):
+    """
+    Persists the embeddings carried by analysis entries. Does not commit.
+    """
+    rows = []
+    for e in entries:
+        if e.get("embedding") is None:
+            continue
+        dtype, scale, blob = pack(e["embedding"])
+        rows.append({"message_id": e["message_id"], "chat_id": chat_id, "dtype": dtype, "scale": scale, "vector": blob})
+    if not rows:
+        return
+    # REPLACE rather than an upsert: the new row id tells VectorIndex.refresh() the
+    # vector changed (full re-analysis, another encoder backend)
+    session.execute(sqlite_insert(MessageEmbedding).prefix_with("OR REPLACE"), rows)
+
+
+def message_vector(session, message_id):
+    row = session.execute(
+        select(MessageEmbedding.dtype, MessageEmbedding.scale, MessageEmbedding.vector)
+        .where(MessageEmbedding.message_id == message_id)
+    ).first()
+    return unpack(*row) if row else None
+
+
+def embed_query(text):
+    # Module-level so it can be sent to the inference pool in either mode
+    from core.analyzer import analyzer
+    return analyzer.encode([text])[0]
+
+
+def _top_k(scores, k):
+    if len(scores) <= k:
+        return np.argsort(-scores)
+    top = np.argpartition(-scores, k)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+class VectorIndex:
+    """
+    Nearest-neighbour search over the stored message embeddings (cosine, the vectors
+    are normalized).
+    Up to VECTOR_EXACT_MAX vectors every query is a single matrix-vector product. Above
+    that an IVF index is trained: k-means splits the vectors into ~sqrt(N) lists stored
+    contiguously, and a query only scans the VECTOR_NPROBE lists closest to it.
+    Embeddings stored after the build are kept in a small tail that is always scanned
+    exactly; the indexed vector of a message stored again is masked out. Once the tail
+    gets large the index is rebuilt on a background thread while queries keep using
+    the current one. Only a query arriving before the first build has finished waits
+    for it.
+    With EMBEDDING_STORE_DTYPE=int8 vectors stay int8 in memory too (4x smaller) and
+    are rescaled per scanned block.
+    """
+
+    def __init__(self, exact_max=None, nprobe=None, dtype=None):
+        self.exact_max = exact_max or Config.VECTOR_EXACT_MAX
+        self.nprobe = nprobe or Config.VECTOR_NPROBE
+        self.dtype = dtype or Config.EMBEDDING_STORE_DTYPE
+        self._lock = threading.Lock()
+        self._reset()
+        self.built = False
+        self.build_seconds = None
+        self._builder = None # Background build thread
+
+    def _reset(self):
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.chats = np.zeros(0, dtype=np.int64)
+        self.data = None # (N, D) float32 or int8, ordered by IVF list
+        self.scales = None # (N,) for int8
+        self.centroids = None # (lists, D), None in exact mode
+        self.offsets = None # list i is data[offsets[i]:offsets[i + 1]]
+        self.sorted_ids = self.ids # ids sorted, to find re-stored messages
+        self.stale = None # (N,) bool, indexed vectors superseded by a tail entry
+        self.tail_ids, self.tail_chats, self.tail_vectors = [], [], []
+        self.tail_index = {} # message id -> position in the tail
+        self.max_row_id = 0
+
+    def _load(self, after_row_id=0):
+        """
+        (row ids, message ids, chat ids, float32 matrix) of embeddings stored after after_row_id.
+        """
+        with db.read_session() as session:
+            rows = session.execute(
+                select(MessageEmbedding.id, MessageEmbedding.message_id, MessageEmbedding.chat_id,
+                       MessageEmbedding.dtype, MessageEmbedding.scale, MessageEmbedding.vector)
+                .where(MessageEmbedding.id > after_row_id)
+                .order_by(MessageEmbedding.id)
+            ).all()
+        if not rows:
+            return None
+        row_ids = np.array([r[0] for r in rows], dtype=np.int64)
+        ids = np.array([r[1] for r in rows], dtype=np.int64)
+        chats = np.array([r[2] for r in rows], dtype=np.int64)
+        if all(r[3] == "float32" for r in rows):
+            matrix = np.frombuffer(b"".join(r[5] for r in rows), dtype=np.float32).reshape(len(rows), -1)
+        else:
+            matrix = np.stack([unpack(r[3], r[4], r[5]) for r in rows])
+        return row_ids, ids, chats, matrix
+
+    def _encode(self, matrix):
+        if self.dtype == "int8":
+            scales = np.abs(matrix).max(axis=1) / 127
+            scales[scales == 0] = 1.0
+            return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return np.ascontiguousarray(matrix, dtype=np.float32), None
+
+    def _train(self, matrix, lists):
+        rng = np.random.default_rng(0)
+        sample = matrix[rng.choice(len(matrix), size=min(len(matrix), lists * TRAIN_PER_LIST), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=lists, replace=False)].copy()
+        for _ in range(TRAIN_ITERATIONS):
+            assign = (sample @ centroids.T).argmax(axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=lists)
+            empty = counts == 0
+            # Re-seed empty lists with random samples
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            centroids = sums / np.linalg.norm(sums, axis=1, keepdims=True).clip(1e-12)
+        return centroids.astype(np.float32)
+
+    def build(self):
+        started = time.perf_counter()
+        loaded = self._load()
+        # Everything is computed before taking the lock, so searches only wait for the swap
+        index = {}
+        if loaded is not None:
+            row_ids, ids, chats, matrix = loaded
+            index["max_row_id"] = int(row_ids[-1])
+            if len(ids) > self.exact_max:
+                lists = int(np.sqrt(len(ids)))
+                centroids = self._train(matrix, lists)
+                assign = np.concatenate([
+                    (matrix[i:i + ASSIGN_BLOCK] @ centroids.T).argmax(axis=1)
+                    for i in range(0, len(matrix), ASSIGN_BLOCK)
+                ])
+                order = np.argsort(assign, kind="stable")
+                index["centroids"] = centroids
+                index["offsets"] = np.searchsorted(assign[order], np.arange(lists + 1))
+                ids, chats, matrix = ids[order], chats[order], matrix[order]
+            index["ids"], index["chats"] = ids, chats
+            index["sorted_ids"] = np.sort(ids)
+            index["data"], index["scales"] = self._encode(matrix)
+        with self._lock:
+            self._reset()
+            for name, value in index.items():
+                setattr(self, name, value)
+            self.built = True
+        self.build_seconds = time.perf_counter() - started
+
+    def start_build(self):
+        """
+        Runs build() on a background thread unless one is already running; returns the thread.
+        """
+        with self._lock:
+            if self._builder is None or not self._builder.is_alive():
+                self._builder = threading.Thread(target=self._build_in_background, name="vector-index", daemon=True)
+                self._builder.start()
+            return self._builder
+
+    def _build_in_background(self):
+        try:
+            self.build()
+        except Exception as e:
+            print(f"Building the vector index failed: {e}")
+
+    def refresh(self):
+        """
+        Picks up embeddings stored since the last build/refresh.
+        """
+        if not self.built:
+            self.start_build().join()
+            return
+        loaded = self._load(self.max_row_id)
+        if loaded is None:
+            return
+        row_ids, ids, chats, matrix = loaded
+        with self._lock:
+            # A concurrent refresh or build may have taken some of these rows already
+            keep = row_ids > self.max_row_id
+            if keep.any():
+                self.max_row_id = int(row_ids[-1])
+                self._add_to_tail(ids[keep], chats[keep], matrix[keep])
+            tail = len(self.tail_ids)
+        if tail > max(self.exact_max // 5, len(self.ids) // 10):
+            self.start_build()
+
+    def _add_to_tail(self, ids, chats, matrix):
+        # Messages stored again replace their tail entry and mask their indexed vector
+        for message_id, chat, vector in zip(ids.tolist(), chats.tolist(), matrix):
+            at = self.tail_index.get(message_id)
+            if at is None:
+                self.tail_index[message_id] = len(self.tail_ids)
+                self.tail_ids.append(message_id)
+                self.tail_chats.append(chat)
+                self.tail_vectors.append(vector)
+            else:
+                self.tail_vectors[at] = vector
+        if not len(self.sorted_ids):
+            return
+        pos = np.minimum(np.searchsorted(self.sorted_ids, ids), len(self.sorted_ids) - 1)
+        found = ids[self.sorted_ids[pos] == ids]
+        if len(found):
+            if self.stale is None:
+                self.stale = np.zeros(len(self.ids), dtype=bool)
+            self.stale |= np.isin(self.ids, found)
+
+    def _scan(self, q, rows):
+        # Scores of q against data[rows] (a slice or an index array)
+        block = self.data[rows]
+        if self.scales is not None:
+            return (block.astype(np.float32) @ q) * self.scales[rows]
+        return block @ q
+
+    def search(self, vector, k=10, chat_id=None, exclude=()):
+        """
+        Returns [(message_id, cosine similarity)], best first.
+        """
+        self.refresh()
+        q = np.asarray(vector, dtype=np.float32)
+        q = q / (np.linalg.norm(q) or 1.0)
+
+        with self._lock:
+            candidate_ids, candidate_scores = [], []
+            if self.data is not None and len(self.ids):
+                if chat_id is not None:
+                    rows = np.flatnonzero(self.chats == chat_id)
+                    if self.centroids is not None and len(rows) > self.exact_max:
+                        rows = self._probe_rows(q, rows)
+                elif self.centroids is not None:
+                    rows = self._probe_rows(q)
+                else:
+                    rows = slice(None)
+                ids, scores = self.ids[rows], self._scan(q, rows)
+                if self.stale is not None:
+                    fresh = ~self.stale[rows]
+                    ids, scores = ids[fresh], scores[fresh]
+                candidate_ids.append(ids)
+                candidate_scores.append(scores)
+
+            if self.tail_ids:
+                tail_ids = np.array(self.tail_ids, dtype=np.int64)
+                tail_scores = np.stack(self.tail_vectors) @ q
+                if chat_id is not None:
+                    mask = np.array(self.tail_chats) == chat_id
+                    tail_ids, tail_scores = tail_ids[mask], tail_scores[mask]
+                candidate_ids.append(tail_ids)
+                candidate_scores.append(tail_scores)
+
+        if not candidate_ids:
+            return []
+        ids = np.concatenate(candidate_ids)
+        scores = np.concatenate(candidate_scores)
+        if exclude:
+            keep = ~np.isin(ids, list(exclude))
+            ids, scores = ids[keep], scores[keep]
+        top = _top_k(scores, k)
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def _probe_rows(self, q, within=None):
+        # Rows of the nprobe lists whose centroids are closest to q
+        lists = _top_k(self.centroids @ q, self.nprobe)
+        rows = np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1]) for i in lists])
+        if within is not None:
+            rows = rows[np.isin(rows, within, assume_unique=True)]
+        return rows
+
+    def _stale_count(self):
+        return int(self.stale.sum()) if self.stale is not None else 0
+
+    def stats(self):
+        return {
+            "built": self.built,
+            "vectors": int(len(self.ids)) - self._stale_count() + len(self.tail_ids),
+            "mode": "ivf" if self.centroids is not None else "exact",
+            "lists": int(len(self.centroids)) if self.centroids is not None else 0,
+            "nprobe": self.nprobe,
+            "dtype": self.dtype,
+            "pending": len(self.tail_ids),
+            "build_seconds": self.build_seconds,
+        }
+
+
+vector_index = VectorIndex()
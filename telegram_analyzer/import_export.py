@@ -0,0 +1,35 @@
+"""
+Offline import of a Telegram Desktop export (Settings > Advanced > Export Telegram data,
+format "Machine-readable JSON"). The file is streamed, so exports of any size work.
+
+    python import_export.py path/to/result.json
+    python import_export.py path/to/result.json --analyze
+"""
+import argparse
+import time
+
+from core.importer import import_export
+
+
+def _progress(stats, last=[0.0]):
+    now = time.perf_counter()
+    if now - last[0] >= 1:
+        last[0] = now
+        print(f"  {stats['chats']} chats, {stats['messages']} messages read, {stats['inserted']} new")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="result.json of the export")
+    parser.add_argument("--analyze", action="store_true", help="Analyze imported chats while importing")
+    parser.add_argument("--batch-size", type=int, help="Messages per transaction (default IMPORT_BATCH_SIZE)")
+    parser.add_argument("--chat", type=int, action="append", help="Only import this chat id (repeatable)")
+    args = parser.parse_args()
+
+    print(f"Importing {args.path}...")
+    stats = import_export(args.path, analyze=args.analyze, batch_size=args.batch_size,
+                          chat_ids=args.chat, progress=_progress)
+    rate = stats["messages"] / stats["seconds"] if stats["seconds"] else 0
+    print(f"Done: {stats['chats']} chats, {stats['messages']} messages read, {stats['inserted']} new, "
+          f"{stats['skipped']} skipped (service/media only), {stats['analyzed']} analyzed "
+          f"in {stats['seconds']:.1f}s ({rate:,.0f} msg/s)")
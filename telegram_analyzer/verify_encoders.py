@@ -0,0 +1,57 @@
+import sys
+import os
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from core.analyzer import ConversationAnalyzer
+
+# Messages covering every intent plus plain chatter that should stay neutral
+REFERENCE = [
+    "sure, that works for me", "yes let's do it", "deal, see you at 5", "fine by me",
+    "sounds acceptable, go ahead", "okay I agree with that", "yeah sure thing",
+    "hmm interesting", "oh I see", "noted, thanks", "ah okay cool", "seen it", "interesting idea there",
+    "oh nice, didn't know that", "cool cool",
+    "maybe later", "idk, whatever you want", "I'm busy right now", "don't really care tbh", "meh, not sure",
+    "I'll think about it some other time", "whatever works",
+    "stop texting me", "this is so annoying", "leave me alone please", "ugh not again", "stop it already",
+    "you're really annoying me", "just leave me alone", "ugh, whatever",
+    "call me asap", "it's an emergency, answer now", "urgent: need the files immediately", "hurry up please",
+    "come now, it's urgent", "need help right now", "please respond immediately", "emergency at home",
+    "what did you have for lunch", "the weather is nice today", "I watched a movie yesterday",
+    "my train leaves at 7", "did you see the match last night", "I'm reading a new book",
+    "the meeting moved to Thursday", "happy birthday!", "thanks for the gift", "where should we eat",
+    "send me the address", "the project deadline is next week", "I'll be there in 10 minutes",
+    "how was your trip", "can you share the photos", "good morning", "see you tomorrow",
+]
+
+
+def check(min_agreement=0.95):
+    """
+    Intent labels from the ONNX (int8) backend should match the PyTorch backend.
+    """
+    torch_analyzer = ConversationAnalyzer(backend="torch")
+    onnx_analyzer = ConversationAnalyzer(backend="onnx")
+
+    expected = torch_analyzer.predict_intents_batch(REFERENCE)
+    actual = onnx_analyzer.predict_intents_batch(REFERENCE)
+
+    mismatches = 0
+    for text, (want, want_conf), (got, got_conf) in zip(REFERENCE, expected, actual):
+        if want != got:
+            mismatches += 1
+            print(f"MISMATCH {text!r}: torch {want} ({want_conf:.3f}) vs onnx {got} ({got_conf:.3f})")
+
+    cosine = np.sum(torch_analyzer.encode(REFERENCE) * onnx_analyzer.encode(REFERENCE), axis=1)
+    agreement = 1 - mismatches / len(REFERENCE)
+    print(f"Checked {len(REFERENCE)} messages: label agreement {agreement:.1%}, "
+          f"embedding cosine mean {cosine.mean():.4f}, min {cosine.min():.4f}")
+    return agreement >= min_agreement
+
+
+if __name__ == "__main__":
+    if not check():
+        sys.exit(1)
+    print("ALL CHECKS PASSED. ONNX intents agree with the PyTorch backend.")
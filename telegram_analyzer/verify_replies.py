@@ -0,0 +1,63 @@
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# A scratch database, set before config is imported
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "verify_replies.db")
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from core.database import db
+from core.models import MessageAnalysis
+from core.pipeline import analyze_chunk
+from core.replies import COLUMNS
+from core.storage import bulk_insert_messages, ensure_chats
+
+CHAT_ID = 1
+MESSAGES = 300 # Fewer than ANALYSIS_CHUNK_SIZE: the whole chat is one chunk
+TEXTS = ["hey", "are you there?", "ok", "call me asap", "sounds good", "why not", "later"]
+
+
+def make_chat():
+    # Two senders over three days, so every horizon has final labels
+    rng = random.Random(0)
+    date = datetime(2025, 1, 1)
+    rows = []
+    for i in range(MESSAGES):
+        date += timedelta(minutes=rng.choice([1, 3, 20, 90, 600]))
+        rows.append({
+            "telegram_id": i + 1,
+            "sender_id": 1 + i % 2 if rng.random() < 0.8 else 1,
+            "text": rng.choice(TEXTS),
+            "date": date,
+            "reply_to_msg_id": i if i and rng.random() < 0.2 else None,
+        })
+
+    def write(session):
+        ensure_chats(session, [CHAT_ID])
+        bulk_insert_messages(session, CHAT_ID, rows)
+    db.run_write(write)
+
+
+def check_single_chunk(full=False):
+    analyzed, _ = analyze_chunk(CHAT_ID, full=full)
+    assert analyzed == MESSAGES, f"expected one chunk of {MESSAGES}, got {analyzed}"
+    with db.get_session() as session:
+        missing = {
+            c: session.query(MessageAnalysis).filter(getattr(MessageAnalysis, c).is_(None)).count()
+            for c in COLUMNS
+        }
+    label = "full re-analysis" if full else "first analysis"
+    assert not any(missing.values()), f"{label}: analyses without reply probabilities {missing}"
+    print(f"{label}: all {analyzed} analyses have reply probabilities")
+
+
+if __name__ == "__main__":
+    make_chat()
+    check_single_chunk()
+    # A full run resets the reply model before its first chunk
+    check_single_chunk(full=True)
+    print("SUCCESS")
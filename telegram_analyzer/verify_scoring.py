@@ -0,0 +1,126 @@
+import random
+import sys
+import os
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from core.analyzer import analyzer
+
+# Building blocks that hit every branch of the urgency and sentiment scorers
+FRAGMENTS = [
+    "asap", "ASAP", "emergency", "now", "urgent", "urgentnow", "asasap", "know", "snow",
+    "!!", "!", "?", "??", "where?", "ok", "LOL", "HELP ME", "great", "terrible", "love",
+    "hate", "not bad", ":)", ":(", "👍", "😡", " ", "  ", "\n", "a", "Why", "NOW!!",
+]
+GAPS = [None, 0, 1, 29, 29.999, 30, 31, 600, 86400, 86400.5, 10 ** 6, float("nan")]
+
+# (text, gap, expected urgency): inputs the random sweep may never draw, with the
+# value calculate_urgency's rules give, so scalar and batch can't be wrong together
+EDGE_CASES = [
+    ("", 0, 0), # No text scores 0 whatever the gap
+    (None, 0, 0),
+    ("   ", None, 0), # Whitespace is text, but has no signal of its own
+    ("   ", 0, 15),
+    ("\n\t", 29.9, 15),
+    ("👍", None, 0), # Emoji only
+    ("😡😡😡", 5, 15),
+    ("😡!!", None, 20),
+    ("asap now urgent emergency", None, 100), # 120, clipped
+    ("asasap", None, 30), # Overlapping triggers
+    ("urgentnow", None, 60),
+    ("knownow", None, 30), # A trigger counts once, however often it appears
+    ("NOW NOW NOW", 10 ** 5, 40),
+    ("HELLO", None, 20), # All caps needs more than 4 characters
+    ("HELL", None, 0),
+    ("ÉCOLE", None, 20),
+    ("12345", None, 0),
+    ("URGENT!!", 0, 85),
+    ("where?", None, 10),
+    ("abcdefghijklm?", None, 10), # Short question: under 15 characters
+    ("abcdefghijklmn?", None, 0),
+    ("ok", 30, 0), # Gap boundaries
+    ("ok", 29.999, 15),
+    ("ok", 86400, 0),
+    ("ok", 86400.001, 0), # -10, clipped
+    ("ok", -5, 15), # Clock skew
+    ("ok", float("inf"), 0),
+    ("ok", float("-inf"), 15),
+    ("ok", float("nan"), 0),
+]
+
+
+def random_text(rng):
+    if rng.random() < 0.05:
+        return rng.choice([None, ""])
+    parts = [rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 6))]
+    return rng.choice(["", " "]).join(parts)
+
+
+def random_gap(rng):
+    if rng.random() < 0.5:
+        return rng.choice(GAPS)
+    return rng.uniform(-10, 2 * 86400)
+
+
+def check(cases=20000, seed=0):
+    """
+    Property: the batch scorers give exactly the scalar results for any input batch.
+    """
+    rng = random.Random(seed)
+    texts = [random_text(rng) for _ in range(cases)]
+    # Duplicates exercise the sentiment memo
+    texts += rng.sample(texts, cases // 4)
+    gaps = [random_gap(rng) for _ in texts]
+
+    urgency = analyzer.calculate_urgency_batch(texts, gaps)
+    sentiment = analyzer.calculate_sentiment_batch(texts)
+
+    failures = 0
+    for i, (text, gap) in enumerate(zip(texts, gaps)):
+        expected_urgency = analyzer.calculate_urgency(text, gap)
+        expected_sentiment = analyzer.calculate_sentiment(text)
+        if urgency[i] != expected_urgency or sentiment[i] != expected_sentiment:
+            failures += 1
+            if failures <= 10:
+                print(f"MISMATCH {text!r} gap={gap}: urgency {urgency[i]} vs {expected_urgency}, "
+                      f"sentiment {sentiment[i]} vs {expected_sentiment}")
+
+    # Without gaps there is no temporal signal at all
+    no_gaps = analyzer.calculate_urgency_batch(texts)
+    failures += sum(no_gaps[i] != analyzer.calculate_urgency(t) for i, t in enumerate(texts))
+
+    print(f"Checked {len(texts)} messages, {failures} mismatches.")
+    return failures == 0
+
+
+def check_edge_cases(seed=0):
+    """
+    Every edge case on its own, then all of them shuffled into one batch: the scalar
+    and batch scorers must both give the expected urgency, and sentiment must agree
+    and stay within [-1, 1].
+    """
+    failures = 0
+    rng = random.Random(seed)
+    batches = [[case] for case in EDGE_CASES] + [rng.sample(EDGE_CASES, len(EDGE_CASES))]
+    for batch in batches:
+        texts = [t for t, _, _ in batch]
+        urgency = analyzer.calculate_urgency_batch(texts, [g for _, g, _ in batch])
+        sentiment = analyzer.calculate_sentiment_batch(texts)
+        for i, (text, gap, expected) in enumerate(batch):
+            scalar = analyzer.calculate_urgency(text, gap)
+            expected_sentiment = analyzer.calculate_sentiment(text)
+            if not (urgency[i] == scalar == expected) or sentiment[i] != expected_sentiment or abs(sentiment[i]) > 1:
+                failures += 1
+                print(f"EDGE CASE {text!r} gap={gap}: urgency batch {urgency[i]} scalar {scalar} expected {expected}, "
+                      f"sentiment {sentiment[i]} vs {expected_sentiment}")
+
+    print(f"Checked {len(EDGE_CASES)} edge cases, {failures} mismatches.")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    edge_ok = check_edge_cases()
+    if not check() or not edge_ok:
+        sys.exit(1)
+    print("ALL CHECKS PASSED. Batch scoring matches the scalar scorers.")
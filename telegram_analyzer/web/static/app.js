@@ -3,13 +3,87 @@ const API_BASE = '/api';
 // State
 let currentChatId = null;
 let chartInstance = null;
+let currentMessages = []; // Oldest to newest, as rendered
+let socket = null;
+
+const MAX_RENDERED = 200;
 
 // Init
 document.addEventListener('DOMContentLoaded', () => {
     checkStatus();
     loadChats();
+    connectEvents();
 });
 
+// Push channel: the server sends per-chat deltas instead of us polling
+function connectEvents() {
+    const proto = location.protocol === 'https:' ? 'wss' : 'ws';
+    socket = new WebSocket(`${proto}://${location.host}${API_BASE}/ws`);
+    socket.onopen = () => {
+        if (currentChatId !== null) sendEvent({ subscribe: currentChatId });
+    };
+    socket.onmessage = (e) => handleFrame(JSON.parse(e.data));
+    socket.onclose = () => {
+        socket = null;
+        setTimeout(connectEvents, 2000); // Reconnect, the server may have restarted
+    };
+}
+
+function sendEvent(msg) {
+    if (socket && socket.readyState === WebSocket.OPEN) socket.send(JSON.stringify(msg));
+}
+
+function handleFrame(frame) {
+    if (frame.resync) {
+        // We fell behind and missed events; start over from the API
+        if (frame.resync.includes(currentChatId)) loadChatResults(currentChatId);
+        return;
+    }
+    if (frame.chat_id !== currentChatId) return;
+
+    frame.events.forEach(ev => {
+        if (ev.type === 'analyses') {
+            if (ev.dropped) {
+                loadChatResults(currentChatId);
+            } else {
+                mergeMessages(ev.items);
+            }
+        } else if (ev.type === 'rollups') {
+            updateMetrics(ev.overall);
+        } else if (ev.type === 'progress') {
+            updateJobStatus(ev);
+            if (ev.job === 'analysis' && ev.phase === 'done' && ev.analyzed) loadChatResults(currentChatId);
+        }
+    });
+}
+
+function mergeMessages(items) {
+    const known = new Set(currentMessages.map(m => m.id));
+    const fresh = items.filter(m => !known.has(m.id));
+    if (!fresh.length) return;
+    currentMessages = currentMessages.concat(fresh)
+        .sort((a, b) => a.date.localeCompare(b.date) || a.id - b.id)
+        .slice(-MAX_RENDERED);
+    renderMessages(currentMessages);
+    renderChart(currentMessages);
+}
+
+function updateJobStatus(ev) {
+    const el = document.getElementById('job-status');
+    if (ev.phase === 'done' || ev.phase === 'cancelled') {
+        el.textContent = '';
+    } else if (ev.phase === 'failed') {
+        el.textContent = `${ev.job} failed`;
+    } else if (ev.job === 'sync') {
+        el.textContent = `Syncing (${ev.phase}): ${ev.stored} new messages`;
+    } else if (ev.phase === 'queued') {
+        el.textContent = 'Analysis queued';
+    } else {
+        const total = ev.total !== null && ev.total !== undefined ? `/${ev.total}` : '';
+        el.textContent = `Analyzing: ${ev.analyzed}${total} messages`;
+    }
+}
+
 async function checkStatus() {
     try {
         const res = await fetch(`${API_BASE}/status`);
@@ -126,7 +200,11 @@ async function loadChats() {
 }
 
 async function selectChat(chatId, title) {
+    if (currentChatId !== null) sendEvent({ unsubscribe: currentChatId });
     currentChatId = chatId;
+    currentMessages = [];
+    sendEvent({ subscribe: chatId });
+    document.getElementById('job-status').textContent = '';
 
     // UI Updates
     document.getElementById('current-chat-title').textContent = title;
@@ -140,33 +218,40 @@ async function selectChat(chatId, title) {
         dashboard.classList.remove('opacity-0');
     }, 10);
 
-    // Trigger analysis
-    await fetch(`${API_BASE}/chats/${chatId}/analyze`);
-
-    // Fetch results
+    // Show what we have right away; sync/analysis progress and new results are pushed
     loadChatResults(chatId);
+
+    // Trigger analysis
+    fetch(`${API_BASE}/chats/${chatId}/analyze`);
 }
 
 async function loadChatResults(chatId) {
     if (currentChatId !== chatId) return; // Prevent race conditions
 
-    const res = await fetch(`${API_BASE}/chats/${chatId}/results`);
-    const messages = await res.json();
-
-    updateMetrics(messages);
-    renderMessages(messages);
-    renderChart(messages);
+    const [res, summaryRes] = await Promise.all([
+        fetch(`${API_BASE}/chats/${chatId}/results`),
+        fetch(`${API_BASE}/chats/${chatId}/summary`),
+    ]);
+    const page = await res.json();
+    const summary = await summaryRes.json();
+    if (currentChatId !== chatId) return;
+    // Pages come newest first; the log and chart read oldest to newest
+    currentMessages = page.items.slice().reverse();
+
+    updateMetrics(summary.overall);
+    renderMessages(currentMessages);
+    renderChart(currentMessages);
 }
 
-function updateMetrics(messages) {
-    if (!messages.length) return;
+function updateMetrics(overall) {
+    // Whole-chat numbers come from the precomputed rollups, not just the loaded page
+    if (!overall || !overall.messages) return;
 
     // Msg Count
-    document.getElementById('metric-msgs').textContent = messages.length;
+    document.getElementById('metric-msgs').textContent = overall.messages;
 
     // Average Sentiment
-    const totalSentiment = messages.reduce((sum, m) => sum + (m.sentiment || 0), 0);
-    const avgSentiment = totalSentiment / messages.length;
+    const avgSentiment = overall.sentiment_mean;
     const sentimentEl = document.getElementById('metric-sentiment');
     const toneEl = document.getElementById('metric-tone');
 
@@ -188,8 +273,7 @@ function updateMetrics(messages) {
     }
 
     // Average Urgency
-    const totalUrgency = messages.reduce((sum, m) => sum + (m.urgency || 0), 0);
-    const avgUrgency = totalUrgency / messages.length;
+    const avgUrgency = overall.urgency_mean;
     document.getElementById('metric-urgency').textContent = Math.round(avgUrgency) + "%";
 }
 